@@ -1,15 +1,130 @@
 import sys
+import threading
 import subprocess
+from collections import deque
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                             QPushButton, QTextEdit, QLabel, QLineEdit, QTabWidget, 
-                             QGroupBox, QScrollArea)
-from PyQt5.QtCore import QProcess, Qt
+                             QPushButton, QPlainTextEdit, QLabel, QLineEdit, QTabWidget, 
+                             QGroupBox, QCheckBox)
+from PyQt5.QtGui import QTextCursor
+from PyQt5.QtCore import QObject, QTimer, Qt, pyqtSignal
+from NetwarsSupervisor import DRAIN_TIMEOUT, Supervisor, format_status
+
+class SupervisorBridge(QObject):
+    """Carries supervisor callbacks from its threads to the GUI thread."""
+    output = pyqtSignal(int, str, bool)
+    state = pyqtSignal(int, str)
+
+class LogView(QWidget):
+    """Console that keeps the last `max_lines` lines and repaints at most every `flush_ms`.
+
+    Lines are kept in a ring buffer and shown in a QPlainTextEdit capped to the
+    same number of blocks, so memory stays flat however long a server runs.
+    Appends between two flushes are coalesced into a single insert.
+    """
+
+    def __init__(self, max_lines=5000, flush_ms=100, parent=None):
+        super().__init__(parent)
+        self.lines = deque(maxlen=max_lines)  # Everything received, for filtering
+        self.pending = deque(maxlen=max_lines)  # Matching lines not shown yet
+        self.filter_text = ""
+        self.paused = False
+        
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        
+        # Filter, search and pause controls
+        tools_layout = QHBoxLayout()
+        self.filter_input = QLineEdit()
+        self.filter_input.setPlaceholderText("Filter lines")
+        self.filter_input.textChanged.connect(self.set_filter)
+        tools_layout.addWidget(self.filter_input)
+        
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search")
+        self.search_input.returnPressed.connect(self.find_next)
+        tools_layout.addWidget(self.search_input)
+        
+        find_btn = QPushButton("Find")
+        find_btn.clicked.connect(self.find_next)
+        tools_layout.addWidget(find_btn)
+        
+        self.pause_box = QCheckBox("Pause")
+        self.pause_box.toggled.connect(self.set_paused)
+        tools_layout.addWidget(self.pause_box)
+        
+        clear_btn = QPushButton("Clear")
+        clear_btn.clicked.connect(self.clear)
+        tools_layout.addWidget(clear_btn)
+        layout.addLayout(tools_layout)
+        
+        self.view = QPlainTextEdit()
+        self.view.setReadOnly(True)
+        self.view.setUndoRedoEnabled(False)
+        self.view.setMaximumBlockCount(max_lines)
+        self.view.setStyleSheet("background-color: black; color: white;")
+        layout.addWidget(self.view)
+        self.setLayout(layout)
+        
+        self.flush_timer = QTimer(self)
+        self.flush_timer.timeout.connect(self.flush)
+        self.flush_timer.start(flush_ms)
+    
+    def append(self, text):
+        for line in text.splitlines() or [""]:
+            self.lines.append(line)
+            if not self.paused and self.matches(line):
+                self.pending.append(line)
+    
+    def matches(self, line):
+        return not self.filter_text or self.filter_text in line.lower()
+    
+    def flush(self):
+        """Show the lines received since the last flush in one insert."""
+        if not self.pending:
+            return
+        scrollbar = self.view.verticalScrollBar()
+        at_bottom = scrollbar.value() == scrollbar.maximum()
+        self.view.appendPlainText("\n".join(self.pending))
+        self.pending.clear()
+        if at_bottom:
+            scrollbar.setValue(scrollbar.maximum())  # Keep tailing unless the user scrolled up
+    
+    def rebuild(self):
+        """Redraw the view from the ring buffer, after a filter change or unpause."""
+        self.pending.clear()
+        self.view.setPlainText("\n".join(line for line in self.lines if self.matches(line)))
+        self.view.verticalScrollBar().setValue(self.view.verticalScrollBar().maximum())
+    
+    def set_filter(self, text):
+        self.filter_text = text.lower()
+        if not self.paused:
+            self.rebuild()
+    
+    def set_paused(self, paused):
+        self.paused = paused
+        if not paused:
+            self.rebuild()
+    
+    def find_next(self):
+        text = self.search_input.text()
+        if not text:
+            return
+        if not self.view.find(text):
+            # Wrap around to the top
+            self.view.moveCursor(QTextCursor.Start)
+            self.view.find(text)
+    
+    def clear(self):
+        self.lines.clear()
+        self.pending.clear()
+        self.view.clear()
 
 class ServerTab(QWidget):
-    def __init__(self, port, parent=None):
+    def __init__(self, port, supervisor, parent=None):
         super().__init__(parent)
         self.port = port
-        self.process = None
+        self.supervisor = supervisor
+        self.worker = supervisor.add_worker(port)
         self.parent = parent
         
         layout = QVBoxLayout()
@@ -22,14 +137,8 @@ class ServerTab(QWidget):
         info_layout.addWidget(self.status_label)
         
         # Console output
-        self.console_output = QTextEdit()
-        self.console_output.setReadOnly(True)
-        self.console_output.setStyleSheet("background-color: black; color: white;")
-        
-        scroll = QScrollArea()
-        scroll.setWidget(self.console_output)
-        scroll.setWidgetResizable(True)
-        info_layout.addWidget(scroll)
+        self.console_output = LogView()
+        info_layout.addWidget(self.console_output)
         
         # Control buttons
         btn_layout = QHBoxLayout()
@@ -42,55 +151,57 @@ class ServerTab(QWidget):
         self.stop_btn.setEnabled(False)
         btn_layout.addWidget(self.stop_btn)
         
+        self.restart_btn = QPushButton("Restart Server")
+        self.restart_btn.setToolTip("Let running matches finish, then restart (e.g. after an update)")
+        self.restart_btn.clicked.connect(self.restart_server)
+        self.restart_btn.setEnabled(False)
+        btn_layout.addWidget(self.restart_btn)
+        
         info_layout.addLayout(btn_layout)
         info_group.setLayout(info_layout)
         layout.addWidget(info_group)
         
         self.setLayout(layout)
+
+        # Refresh health, CPU and memory figures
+        self.status_timer = QTimer(self)
+        self.status_timer.timeout.connect(self.update_status)
+        self.status_timer.start(1000)
     
     def start_server(self):
-        if self.process is None:
-            self.process = QProcess()
-            self.process.readyReadStandardOutput.connect(self.handle_output)
-            self.process.readyReadStandardError.connect(self.handle_error)
-            self.process.finished.connect(self.server_finished)
-            
-            self.process.start("python", ["NetwarsServer.py", "--port", str(self.port)])
-            if self.process.waitForStarted():
-                self.status_label.setText(f"Status: Running on port {self.port}")
-                self.start_btn.setEnabled(False)
-                self.stop_btn.setEnabled(True)
-                self.console_output.append(f"Server started on port {self.port}")
+        if not self.worker.wanted:
+            self.supervisor.start_worker(self.port)
+            self.console_output.append(f"Server started on port {self.port}")
+            self.update_status()
     
     def stop_server(self):
-        if self.process:
-            self.process.terminate()
-            if not self.process.waitForFinished(2000):
-                self.process.kill()
-            self.process = None
-            self.status_label.setText("Status: Stopped")
-            self.start_btn.setEnabled(True)
-            self.stop_btn.setEnabled(False)
-            self.console_output.append("Server stopped")
-    
-    def handle_output(self):
-        data = self.process.readAllStandardOutput()
-        if data:
-            message = data.data().decode('utf-8').strip()
-            self.console_output.append(message)
+        if self.worker.wanted:
+            # Running matches are allowed to finish first, don't block the UI meanwhile
+            threading.Thread(target=self.supervisor.stop_worker, args=(self.port,),
+                             kwargs={'drain_timeout': DRAIN_TIMEOUT}, daemon=True).start()
+            self.worker.wanted = False
+            self.console_output.append("Stopping server once its matches are over")
+            self.update_status()
     
-    def handle_error(self):
-        data = self.process.readAllStandardError()
-        if data:
-            message = data.data().decode('utf-8').strip()
+    def restart_server(self):
+        if self.worker.process:
+            threading.Thread(target=self.supervisor.restart_worker, args=(self.port,), daemon=True).start()
+            self.console_output.append("Restarting server once its matches are over")
+    
+    def handle_output(self, message, is_error):
+        if is_error:
             self.console_output.append(f"ERROR: {message}")
+        else:
+            self.console_output.append(message)
     
-    def server_finished(self):
-        self.status_label.setText("Status: Stopped")
-        self.start_btn.setEnabled(True)
-        self.stop_btn.setEnabled(False)
-        self.console_output.append("Server process finished")
-        self.process = None
+    def update_status(self):
+        if self.worker.wanted or self.worker.process:
+            self.status_label.setText(f"Status: {format_status(self.worker)}")
+        else:
+            self.status_label.setText("Status: Stopped")
+        self.start_btn.setEnabled(not self.worker.wanted)
+        self.stop_btn.setEnabled(self.worker.wanted)
+        self.restart_btn.setEnabled(self.worker.wanted and self.worker.state == "running")
 
 class NetwarsLauncher(QMainWindow):
     def __init__(self):
@@ -98,6 +209,14 @@ class NetwarsLauncher(QMainWindow):
         self.setWindowTitle("Netwars Launcher")
         self.setGeometry(100, 100, 800, 600)
         
+        # Supervisor keeping the server processes alive
+        self.bridge = SupervisorBridge()
+        self.bridge.output.connect(self.route_output)
+        self.bridge.state.connect(self.route_state)
+        self.supervisor = Supervisor(on_output=self.bridge.output.emit, on_state=self.bridge.state.emit)
+        self.supervisor.start()
+        self.tabs = {}  # Port -> ServerTab
+        
         central = QWidget()
         self.setCentralWidget(central)
         
@@ -132,6 +251,18 @@ class NetwarsLauncher(QMainWindow):
         
         server_layout.addLayout(add_server_layout)
         
+        # Fleet controls
+        fleet_layout = QHBoxLayout()
+        self.start_all_btn = QPushButton("Start All Servers")
+        self.start_all_btn.clicked.connect(self.start_all_servers)
+        fleet_layout.addWidget(self.start_all_btn)
+        
+        self.stop_all_btn = QPushButton("Stop All Servers")
+        self.stop_all_btn.clicked.connect(self.stop_all_servers)
+        fleet_layout.addWidget(self.stop_all_btn)
+        
+        server_layout.addLayout(fleet_layout)
+        
         # Server tabs
         self.server_tabs = QTabWidget()
         server_layout.addWidget(self.server_tabs)
@@ -144,9 +275,29 @@ class NetwarsLauncher(QMainWindow):
             self.add_server_tab(port)
     
     def add_server_tab(self, port):
-        tab = ServerTab(port, self)
+        if port in self.tabs:
+            self.statusBar().showMessage(f"Port {port} already has a server tab", 3000)
+            return
+        tab = ServerTab(port, self.supervisor, self)
+        self.tabs[port] = tab
         self.server_tabs.addTab(tab, f"Port {port}")
     
+    def route_output(self, port, line, is_error):
+        if port in self.tabs:
+            self.tabs[port].handle_output(line, is_error)
+    
+    def route_state(self, port, state):
+        if port in self.tabs:
+            self.tabs[port].update_status()
+    
+    def start_all_servers(self):
+        for tab in self.tabs.values():
+            tab.start_server()
+    
+    def stop_all_servers(self):
+        for tab in self.tabs.values():
+            tab.stop_server()
+    
     def add_server(self):
         port_text = self.port_input.text()
         if port_text.isdigit():
@@ -164,6 +315,11 @@ class NetwarsLauncher(QMainWindow):
             subprocess.Popen(["python", "Netwars.py"])
         except Exception as e:
             self.statusBar().showMessage(f"Failed to launch client: {str(e)}", 3000)
+    
+    def closeEvent(self, event):
+        self.supervisor.stop()
+        self.supervisor.stop_all()
+        event.accept()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
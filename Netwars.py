@@ -1,15 +1,21 @@
 import sys
 import json
-import socket
+import time
 import random
 import logging
+from collections import deque
 from PyQt5.QtWidgets import (
-    QApplication, QMainWindow, QGridLayout, QPushButton, QVBoxLayout, QHBoxLayout,
-    QWidget, QLabel, QMessageBox, QRadioButton, QButtonGroup, QFrame, QLineEdit, QGroupBox
+    QApplication, QMainWindow, QPushButton, QVBoxLayout, QHBoxLayout,
+    QWidget, QLabel, QMessageBox, QRadioButton, QButtonGroup, QFrame, QLineEdit, QGroupBox, QSizePolicy
 )
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
-from PyQt5.QtGui import QFont, QColor, QPalette
+from PyQt5.QtCore import Qt, QObject, QTimer, QRect, QSize, pyqtSignal
+from PyQt5.QtNetwork import QAbstractSocket, QTcpSocket
+from PyQt5.QtGui import QFont, QColor, QPalette, QPainter, QPen
 from functools import partial
+from NetwarsServer import BOARD_SIZE, FLEET, calculate_affected_coords, random_fleet, ship_mask
+from NetwarsCards import CARDS
+from NetwarsProtocol import (HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT, COMPRESSION, Dispatcher, encode_message,
+                             make_hello, decode_state, apply_delta, compress_frame, decompress_message)
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -18,70 +24,357 @@ logger = logging.getLogger(__name__)
 # Generate a random ID for client instance
 CLIENT_ID = random.randint(1, 1000000)
 
-class NetworkThread(QThread):
+ATTACK_TIMEOUT = 5  # Seconds to wait for the server to answer an attack, e.g. one its rate limits dropped
+
+class NetworkClient(QObject):
+    """Event-loop driven connection to the server, built on QTcpSocket.
+
+    Connecting never blocks the UI: each attempt is bounded by a timeout and
+    failed attempts are retried after a short delay. Incoming data is read on
+    readyRead in the GUI thread and split into newline-delimited JSON messages.
+    Once connected, heartbeats measure the round-trip time and a server that
+    stays silent for HEARTBEAT_TIMEOUT is treated as a lost connection.
+    """
+    connected = pyqtSignal()
+    connect_failed = pyqtSignal(str)
     data_received = pyqtSignal(dict)
     connection_lost = pyqtSignal()
+    send_failed = pyqtSignal(dict, str)
+    rtt_measured = pyqtSignal(float)
 
-    def __init__(self, client_socket):
-        super().__init__()
-        self.client = client_socket
-        self.running = True
+    # Turn actions: while one is still queued, repeats of the same type are dropped
+    COALESCED_TYPES = ('placement', 'attack', 'draw_card')
+    # Stop handing frames to the socket while this much is still unsent
+    MAX_PENDING_BYTES = 256 * 1024
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.socket = QTcpSocket(self)
+        self.socket.connected.connect(self.on_connected)
+        self.socket.readyRead.connect(self.on_ready_read)
+        self.socket.disconnected.connect(self.on_disconnected)
+        self.socket.errorOccurred.connect(self.on_error)
+        self.socket.bytesWritten.connect(self.on_bytes_written)
+        self.connect_timer = QTimer(self)
+        self.connect_timer.setSingleShot(True)
+        self.connect_timer.timeout.connect(self.on_connect_timeout)
+        self.retry_timer = QTimer(self)
+        self.retry_timer.setSingleShot(True)
+        self.retry_timer.timeout.connect(self.attempt)
+        self.heartbeat_timer = QTimer(self)
+        self.heartbeat_timer.setInterval(HEARTBEAT_INTERVAL * 1000)
+        self.heartbeat_timer.timeout.connect(self.on_heartbeat)
+        self.last_received = 0.0  # Monotonic time of the last data from the server
+        self.rtt = None
+        self.outbox = deque()  # (message, frame) pairs waiting for the next flush
+        self.flush_scheduled = False
+        self.buffer = b""
+        self.host = None
+        self.port = None
+        self.username = None
+        self.reconnect_token = None  # Issued in the server's welcome, resumes our seat
+        self.attempts_left = 0
+        self.timeout_ms = 5000
+        self.retry_delay_ms = 1000
+        self.is_connected = False
+        self.redirected = False  # Connecting to the node a lobby sent us to, the window already knows we are in
+        self.compress = False  # Server agreed to compressed frames in its welcome
+
+    def connect_to_host(self, host, port, username, timeout_ms=5000, retries=2, retry_delay_ms=1000):
+        """Start connecting, the outcome is reported by connected or connect_failed."""
+        self.host = host
+        self.port = port
+        self.username = username
+        self.timeout_ms = timeout_ms
+        self.retry_delay_ms = retry_delay_ms
+        self.attempts_left = retries + 1
+        self.retry_timer.stop()
+        self.is_connected = False
+        self.socket.abort()
+        self.attempt()
+
+    def attempt(self):
+        self.attempts_left -= 1
+        self.buffer = b""
+        logger.info(f"Client {CLIENT_ID}: Connecting to {self.host}:{self.port} "
+                    f"({self.attempts_left} retries left)")
+        self.connect_timer.start(self.timeout_ms)
+        self.socket.connectToHost(self.host, self.port)
+
+    def retry_or_fail(self, reason):
+        self.connect_timer.stop()
+        self.socket.abort()
+        if self.attempts_left > 0:
+            logger.warning(f"Client {CLIENT_ID}: Connection attempt failed ({reason}), retrying")
+            self.retry_timer.start(self.retry_delay_ms)
+        else:
+            logger.error(f"Client {CLIENT_ID}: Connection failed: {reason}")
+            self.connect_failed.emit(reason)
+
+    def on_connect_timeout(self):
+        self.retry_or_fail(f"no answer within {self.timeout_ms / 1000:.0f}s")
+
+    def on_connected(self):
+        self.connect_timer.stop()
+        self.is_connected = True
+        self.compress = False  # Until this server's welcome says otherwise
+        self.socket.setSocketOption(QAbstractSocket.LowDelayOption, 1)  # Don't hold back small frames
+        self.socket.setSocketOption(QAbstractSocket.KeepAliveOption, 1)
+        self.last_received = time.monotonic()
+        self.heartbeat_timer.start()
+        self.socket.write(encode_message(make_hello(self.username, self.reconnect_token)))
+        if self.redirected:
+            self.redirected = False
+            return
+        self.connected.emit()
+
+    def on_error(self, error):
+        if not self.is_connected:
+            self.retry_or_fail(self.socket.errorString())
+        else:
+            logger.error(f"Client {CLIENT_ID}: Network error: {self.socket.errorString()}")
+
+    def reconnect(self, retries=5):
+        """Connect again to the same server, resuming our seat with the reconnect token."""
+        self.connect_to_host(self.host, self.port, self.username, self.timeout_ms, retries, self.retry_delay_ms)
 
-    def run(self):
-        buffer = ""
-        while self.running:
+    def redirect(self, host, port):
+        """Move to the server a lobby placed our match on, reconnects go there too."""
+        logger.info(f"Client {CLIENT_ID}: Lobby sent us to {host}:{port}")
+        self.is_connected = False  # Not a lost connection
+        self.heartbeat_timer.stop()
+        self.redirected = True
+        self.connect_to_host(host, port, self.username, self.timeout_ms, 2, self.retry_delay_ms)
+
+    def on_heartbeat(self):
+        silent = time.monotonic() - self.last_received
+        if silent > HEARTBEAT_TIMEOUT:
+            logger.warning(f"Client {CLIENT_ID}: Nothing from the server for {silent:.0f}s, connection is dead")
+            self.heartbeat_timer.stop()
+            self.is_connected = False
+            self.socket.abort()
+            self.connection_lost.emit()
+        else:
+            self.send_message({'type': 'ping', 't': time.monotonic()})
+
+    def on_disconnected(self):
+        self.heartbeat_timer.stop()
+        if self.is_connected:
+            self.is_connected = False
+            logger.warning(f"Client {CLIENT_ID}: Server closed the connection")
+            self.connection_lost.emit()
+
+    def on_ready_read(self):
+        data = bytes(self.socket.readAll())
+        self.last_received = time.monotonic()
+        logger.debug(f"Client {CLIENT_ID}: Received raw data: {data}")
+        self.buffer += data
+
+        # The server terminates every message with a newline
+        while b"\n" in self.buffer:
+            line, self.buffer = self.buffer.split(b"\n", 1)
+            if not line.strip():
+                continue
             try:
-                data = self.client.recv(4096).decode('utf-8')
-                if not data:
-                    logger.warning(f"Client {CLIENT_ID}: No data received from server. Connection may be closed.")
-                    self.connection_lost.emit()
-                    break
-                
-                buffer += data
-                logger.debug(f"Client {CLIENT_ID}: Received raw data: {data}")
-                
-                # Process complete JSON messages from buffer
-                while '{' in buffer and '}' in buffer:
-                    try:
-                        # Find the position of the first JSON object
-                        start = buffer.find('{')
-                        end = buffer.find('}', start) + 2
-                        
-                        # Extract the complete JSON message
-                        json_str = buffer[start:end]
-                        # Remove the processed part from buffer
-                        buffer = buffer[end:]
-                        
-                        # Parse and emit the message
-                        message = json.loads(json_str)
-                        logger.debug(f"Client {CLIENT_ID}: Processed message: {message}")
-                        self.data_received.emit(message)
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Client {CLIENT_ID}: JSON decode error: {e}")
-                        logger.error(f"Client {CLIENT_ID}: Problematic JSON: {json_str}")
-                        # Skip to the next opening brace
-                        if '{' in buffer:
-                            buffer = buffer[buffer.find('{'):]
-                        else:
-                            buffer = ""
-                            break
-            except ConnectionResetError:
-                logger.error(f"Client {CLIENT_ID}: Connection reset by server")
-                self.connection_lost.emit()
-                break
-            except ConnectionAbortedError:
-                logger.error(f"Client {CLIENT_ID}: Connection aborted")
-                self.connection_lost.emit()
-                break
-            except Exception as e:
-                logger.error(f"Client {CLIENT_ID}: Network error: {str(e)}")
-                self.connection_lost.emit()
-                break
-        
-        logger.debug(f"Client {CLIENT_ID}: Network thread stopping")
-
-    def stop(self):
-        self.running = False
+                message = json.loads(line.decode('utf-8'))
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                logger.error(f"Client {CLIENT_ID}: JSON decode error: {e}")
+                logger.error(f"Client {CLIENT_ID}: Problematic JSON: {line}")
+                continue
+            if not isinstance(message, dict):
+                logger.error(f"Client {CLIENT_ID}: Expected a JSON object: {line}")
+                continue
+            if message.get('type') == 'compressed':
+                try:
+                    message = decompress_message(message)
+                except ValueError as e:
+                    logger.error(f"Client {CLIENT_ID}: {e}")
+                    continue
+            logger.debug(f"Client {CLIENT_ID}: Processed message: {message}")
+            msg_type = message.get('type')
+            if msg_type == 'ping':
+                self.send_message({'type': 'pong', 't': message.get('t')})
+                continue
+            if msg_type == 'pong':
+                if isinstance(message.get('t'), (int, float)):
+                    self.rtt = time.monotonic() - message['t']
+                    self.rtt_measured.emit(self.rtt)
+                continue
+            if msg_type == 'redirect' and isinstance(message.get('host'), str) and isinstance(message.get('port'), int):
+                self.redirect(message['host'], message['port'])
+                return
+            if msg_type == 'welcome':
+                self.reconnect_token = message.get('reconnect_token')
+                self.compress = COMPRESSION in (message.get('capabilities') or [])
+            self.data_received.emit(message)
+
+    def send_message(self, message):
+        """Frame a message and queue it, it is written once control returns to the event loop."""
+        if not self.is_connected:
+            self.send_failed.emit(message, "not connected")
+            return False
+
+        msg_type = message.get('type')
+        if msg_type in self.COALESCED_TYPES and any(m.get('type') == msg_type for m, _ in self.outbox):
+            logger.debug(f"Client {CLIENT_ID}: Dropping repeated {msg_type}, one is already queued")
+            return True
+
+        try:
+            frame = (json.dumps(message, ensure_ascii=False) + "\n").encode('utf-8')
+        except (TypeError, ValueError) as e:
+            self.send_failed.emit(message, f"cannot encode message: {e}")
+            return False
+        if self.compress:
+            frame = compress_frame(frame)  # Only large frames, e.g. placements on big boards
+
+        self.outbox.append((message, frame))
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            QTimer.singleShot(0, self.flush)
+        return True
+
+    def flush(self):
+        """Hand every queued frame to the socket in a single write."""
+        self.flush_scheduled = False
+        if not self.outbox:
+            return
+        if self.socket.bytesToWrite() > self.MAX_PENDING_BYTES:
+            return  # Resumed from on_bytes_written once the socket drains
+
+        messages = list(self.outbox)
+        self.outbox.clear()
+        data = b"".join(frame for _, frame in messages)
+        if not self.is_connected or self.socket.write(data) != len(data):
+            reason = self.socket.errorString() if self.is_connected else "not connected"
+            for message, _ in messages:
+                self.send_failed.emit(message, reason)
+
+    def on_bytes_written(self, count):
+        if self.outbox and not self.flush_scheduled:
+            self.flush()
+
+    def close(self):
+        self.is_connected = False
+        self.connect_timer.stop()
+        self.retry_timer.stop()
+        self.heartbeat_timer.stop()
+        self.outbox.clear()
+        self.socket.abort()
+
+def mask_cells(mask, board_size):
+    """Return the (row, col) of every set bit of a board bitmask."""
+    bits = bin(mask)[:1:-1]  # Lowest bit first
+    return [divmod(i, board_size) for i, bit in enumerate(bits) if bit == '1']
+
+class BoardWidget(QWidget):
+    """A board painted cell by cell, one widget however many cells it has.
+
+    Cells hold one of the states below and are repainted only where they
+    changed, clicks are reported as cell_clicked(row, col). Cells shrink to fit
+    the widget, row and column labels and HIT/MISS text are left out once they
+    no longer fit.
+    """
+    cell_clicked = pyqtSignal(int, int)
+
+    EMPTY, SHIP, HIT, MISS, SCANNED, PENDING = range(6)
+    COLORS = {EMPTY: '#4C566A', SHIP: '#88C0D0', HIT: '#BF616A', MISS: '#D8DEE9', SCANNED: '#7B88A1',
+              PENDING: '#EBCB8B'}  # Attacked, the server hasn't answered yet
+    TEXT = {HIT: 'HIT', MISS: 'MISS'}
+    DISABLED_COLOR = '#434C5E'  # Empty cells while the board doesn't take clicks
+    GRID_COLOR = '#81A1C1'
+
+    def __init__(self, board_size=BOARD_SIZE, parent=None):
+        super().__init__(parent)
+        self.interactive = True
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.reset(board_size)
+
+    def reset(self, board_size=None):
+        """Clear every cell, optionally switching to another board size."""
+        if board_size is not None:
+            self.board_size = board_size
+        self.cells = bytearray(self.board_size * self.board_size)
+        self.updateGeometry()
+        self.update()
+
+    def cell(self, row, col):
+        return self.cells[row * self.board_size + col]
+
+    def set_cell(self, row, col, state):
+        if self.cells[row * self.board_size + col] != state:
+            self.cells[row * self.board_size + col] = state
+            self.update(self.cell_rect(row, col))
+
+    def set_interactive(self, interactive):
+        if interactive != self.interactive:
+            self.interactive = interactive
+            self.update()
+
+    def layout_metrics(self):
+        """Return (label margin, cell size in pixels) for the current widget size."""
+        n = self.board_size
+        cell = min(self.width(), self.height()) // (n + 1)
+        margin = cell if cell >= 12 else 0  # Labels take one cell's worth of room
+        cell = max(1, (min(self.width(), self.height()) - margin) // n)
+        return margin, cell
+
+    def cell_rect(self, row, col):
+        margin, cell = self.layout_metrics()
+        return QRect(margin + col * cell, margin + row * cell, cell, cell)
+
+    def sizeHint(self):
+        cell = max(6, min(35, 500 // self.board_size))
+        return QSize(cell * (self.board_size + 1), cell * (self.board_size + 1))
+
+    def minimumSizeHint(self):
+        return QSize(2 * self.board_size, 2 * self.board_size)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        margin, cell = self.layout_metrics()
+        n = self.board_size
+        area = event.rect()
+        # Only the cells inside the dirty rectangle
+        first_row = max(0, (area.top() - margin) // cell)
+        last_row = min(n - 1, (area.bottom() - margin) // cell)
+        first_col = max(0, (area.left() - margin) // cell)
+        last_col = min(n - 1, (area.right() - margin) // cell)
+        colors = {state: QColor(color) for state, color in self.COLORS.items()}
+        if not self.interactive:
+            colors[self.EMPTY] = QColor(self.DISABLED_COLOR)
+        painter.setPen(QPen(QColor(self.GRID_COLOR)) if cell >= 6 else Qt.NoPen)
+        font = painter.font()
+        font.setPixelSize(max(1, cell // 4))
+        painter.setFont(font)
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                state = self.cells[row * n + col]
+                rect = QRect(margin + col * cell, margin + row * cell, cell - 1, cell - 1)
+                painter.setBrush(colors[state])
+                painter.drawRect(rect)
+                if cell >= 30 and state in self.TEXT:
+                    painter.setPen(QColor('#2E3440'))
+                    painter.drawText(rect, Qt.AlignCenter, self.TEXT[state])
+                    painter.setPen(QPen(QColor(self.GRID_COLOR)))
+
+        if margin:
+            # Row labels (A-Z, numbers past 26 rows) and column labels (1-N)
+            painter.setPen(QColor('#D8DEE9'))
+            font.setPixelSize(max(8, margin // 2))
+            painter.setFont(font)
+            for i in range(n):
+                label = chr(65 + i) if n <= 26 else str(i + 1)
+                painter.drawText(QRect(0, margin + i * cell, margin, cell), Qt.AlignCenter, label)
+                painter.drawText(QRect(margin + i * cell, 0, cell, margin), Qt.AlignCenter, str(i + 1))
+
+    def mousePressEvent(self, event):
+        if not self.interactive or event.button() != Qt.LeftButton:
+            return
+        margin, cell = self.layout_metrics()
+        col = (event.x() - margin) // cell
+        row = (event.y() - margin) // cell
+        if event.x() >= margin and event.y() >= margin and row < self.board_size and col < self.board_size:
+            self.cell_clicked.emit(row, col)
 
 class BattleshipClient(QMainWindow):
     def __init__(self):
@@ -91,27 +384,59 @@ class BattleshipClient(QMainWindow):
         self.server_port = 5555
         self.username = None
         self.connected = False
+        self.reconnecting = False  # Lost the connection mid-match and trying to resume it
         self.placement_mode = True
         self.current_turn = False
         self.game_over = False
         self.attacks_disabled = False
         self.orientation = "horizontal"
         
-        # Board and ships
-        self.board_size = 10
-        self.grid = [[0] * self.board_size for _ in range(self.board_size)]
-        self.enemy_grid = [[0] * self.board_size for _ in range(self.board_size)]
-        self.ships_to_place = [5, 4, 3, 3, 2]  # Ship lengths
+        # Board and ships, the server's welcome and match_ready say which
+        self.board_size = BOARD_SIZE
+        self.fleet = list(FLEET)
+        self.ships_to_place = list(self.fleet)  # Ship lengths
         self.placed_ships = []
         self.attacked_coords = set()
+        self.attack_id = 0  # Last attack ID sent, the server echoes it in its answer
+        self.pending_attack = None  # (attack ID, card, {cell: state before}) until the server answers
+        self.attack_timer = QTimer(self)
+        self.attack_timer.setSingleShot(True)
+        self.attack_timer.timeout.connect(self.handle_attack_timeout)
         
         # Cards
-        self.hand = []
-        self.selected_card = None
+        self.hand = []  # Card IDs, see cards.json
+        self.hand_uses = []  # Uses left of each card in hand
+        self.selected_card = None  # Card ID
+        self.sync_seq = None  # Sequence number of sync_state
+        self.sync_state = {}  # Decoded view of the match from the server's keyframes and deltas
         
         # Network
-        self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.network_thread = None
+        self.network = NetworkClient(self)
+        self.network.connected.connect(self.handle_connected)
+        self.network.connect_failed.connect(self.handle_connect_failed)
+        self.network.data_received.connect(self.handle_message)
+        self.network.connection_lost.connect(self.handle_disconnect)
+        self.network.send_failed.connect(self.handle_send_failed)
+        self.network.rtt_measured.connect(self.handle_rtt)
+
+        # Server message handlers, each called with the validated message
+        self.dispatcher = Dispatcher()
+        self.dispatcher.register('game_start', self.handle_game_start)
+        self.dispatcher.register('turn_update', self.handle_turn_update)
+        self.dispatcher.register('new_card', self.handle_new_card)
+        self.dispatcher.register('attack_result', self.handle_attack_result)
+        self.dispatcher.register('attack_rejected', self.handle_attack_rejected)
+        self.dispatcher.register('message_rejected', self.handle_message_rejected)
+        self.dispatcher.register('game_over', self.handle_game_over)
+        self.dispatcher.register('remove_card', self.handle_remove_card)
+        self.dispatcher.register('card_used', self.handle_card_used)
+        self.dispatcher.register('match_ready', self.handle_match_ready)
+        self.dispatcher.register('welcome', self.handle_welcome)
+        self.dispatcher.register('state_keyframe', self.handle_state_keyframe)
+        self.dispatcher.register('state_delta', self.handle_state_delta)
+        self.dispatcher.register('reconnect_success', self.handle_reconnect_success)
+        self.dispatcher.register('handshake_error', self.handle_handshake_error)
+        self.dispatcher.register('server_shutdown', self.handle_server_shutdown)
         
         # Initialize UI
         self.init_ui()
@@ -208,31 +533,25 @@ class BattleshipClient(QMainWindow):
         self.connect_btn.setEnabled(False)
         self.status_label.setText(f"Connecting to {self.server_ip}:{self.server_port}...")
 
-        try:
-            logger.info(f"Client {CLIENT_ID}: Connecting to {self.server_ip}:{self.server_port} as '{username}'...")
-            self.client.connect((self.server_ip, self.server_port))
-            self.client.send(username.encode('utf-8'))
-            self.connected = True
-            
-            # Start network thread
-            self.network_thread = NetworkThread(self.client)
-            self.network_thread.data_received.connect(self.handle_message)
-            self.network_thread.connection_lost.connect(self.handle_disconnect)
-            self.network_thread.start()
-            
-            logger.info(f"Client {CLIENT_ID}: Connected successfully as '{username}'")
-            self.setup_game_ui()
-        except ConnectionRefusedError:
-            logger.error(f"Client {CLIENT_ID}: Connection refused. Server may be down.")
-            QMessageBox.critical(self, "Connection Error", 
-                               f"Could not connect to server at {self.server_ip}:{self.server_port}. Server may be down.")
-            self.connect_btn.setEnabled(True)
-            self.status_label.setText("Connection failed. Please try again.")
-        except Exception as e:
-            logger.error(f"Client {CLIENT_ID}: Connection error: {str(e)}")
-            QMessageBox.critical(self, "Connection Error", f"An error occurred: {str(e)}")
-            self.connect_btn.setEnabled(True)
-            self.status_label.setText("Connection failed. Please try again.")
+        logger.info(f"Client {CLIENT_ID}: Connecting to {self.server_ip}:{self.server_port} as '{username}'...")
+        self.network.connect_to_host(self.server_ip, self.server_port, username)
+
+    def handle_connected(self):
+        logger.info(f"Client {CLIENT_ID}: Connected successfully as '{self.username}'")
+        self.connected = True
+        if not self.reconnecting:
+            self.setup_game_ui()  # When reconnecting the board stays, the welcome says if we resumed
+
+    def handle_connect_failed(self, reason):
+        if self.reconnecting:
+            self.reconnecting = False
+            QMessageBox.critical(self, "Connection Lost", f"Could not reconnect to the server: {reason}")
+            self.close()
+            return
+        QMessageBox.critical(self, "Connection Error", 
+                           f"Could not connect to server at {self.server_ip}:{self.server_port}: {reason}")
+        self.connect_btn.setEnabled(True)
+        self.status_label.setText("Connection failed. Please try again.")
 
     def setup_game_ui(self):
         self.setWindowTitle(f"Battleship - {self.username}")
@@ -292,9 +611,13 @@ class BattleshipClient(QMainWindow):
         orientation_layout.addWidget(self.horizontal_radio)
         orientation_layout.addWidget(self.vertical_radio)
         
-        ship_info = QLabel(f"Place {self.ships_to_place[0]}-unit ship")
-        ship_info.setAlignment(Qt.AlignCenter)
-        orientation_layout.addWidget(ship_info)
+        self.ship_info = QLabel(f"Place {self.ships_to_place[0]}-unit ship")
+        self.ship_info.setAlignment(Qt.AlignCenter)
+        orientation_layout.addWidget(self.ship_info)
+
+        auto_place_btn = QPushButton("Auto-place")
+        auto_place_btn.clicked.connect(self.auto_place_ships)
+        orientation_layout.addWidget(auto_place_btn)
         
         self.orientation_frame.setLayout(orientation_layout)
         layout.addWidget(self.orientation_frame)
@@ -304,32 +627,9 @@ class BattleshipClient(QMainWindow):
         self.player_board.setStyleSheet("QGroupBox { font-size: 14px; border: 1px solid #81A1C1; margin-top: 10px; padding-top: 20px; }")
         
         player_layout = QVBoxLayout()
-        self.player_grid_layout = QGridLayout()
-        self.player_grid_layout.setSpacing(2)
-        
-        # Create grid labels
-        for i in range(10):
-            # Row labels (A-J)
-            row_label = QLabel(chr(65 + i))
-            row_label.setAlignment(Qt.AlignCenter)
-            self.player_grid_layout.addWidget(row_label, i+1, 0)
-            
-            # Column labels (1-10)
-            col_label = QLabel(str(i+1))
-            col_label.setAlignment(Qt.AlignCenter)
-            self.player_grid_layout.addWidget(col_label, 0, i+1)
-        
-        # Create grid buttons
-        self.player_buttons = [[QPushButton() for _ in range(10)] for _ in range(10)]
-        for row in range(10):
-            for col in range(10):
-                btn = self.player_buttons[row][col]
-                btn.setFixedSize(35, 35)
-                btn.setStyleSheet("background-color: #4C566A; border: 1px solid #81A1C1;")
-                btn.clicked.connect(partial(self.handle_placement_click, row, col))
-                self.player_grid_layout.addWidget(btn, row+1, col+1)
-        
-        player_layout.addLayout(self.player_grid_layout)
+        self.player_grid = BoardWidget(self.board_size)
+        self.player_grid.cell_clicked.connect(self.handle_placement_click)
+        player_layout.addWidget(self.player_grid)
         self.player_board.setLayout(player_layout)
         return self.player_board
 
@@ -338,36 +638,30 @@ class BattleshipClient(QMainWindow):
         self.enemy_board.setStyleSheet("QGroupBox { font-size: 14px; border: 1px solid #81A1C1; margin-top: 10px; padding-top: 20px; }")
         
         enemy_layout = QVBoxLayout()
-        self.enemy_grid_layout = QGridLayout()
-        self.enemy_grid_layout.setSpacing(2)
-        
-        # Create grid labels
-        for i in range(10):
-            # Row labels (A-J)
-            row_label = QLabel(chr(65 + i))
-            row_label.setAlignment(Qt.AlignCenter)
-            self.enemy_grid_layout.addWidget(row_label, i+1, 0)
-            
-            # Column labels (1-10)
-            col_label = QLabel(str(i+1))
-            col_label.setAlignment(Qt.AlignCenter)
-            self.enemy_grid_layout.addWidget(col_label, 0, i+1)
-        
-        # Create grid buttons
-        self.enemy_buttons = [[QPushButton() for _ in range(10)] for _ in range(10)]
-        for row in range(10):
-            for col in range(10):
-                btn = self.enemy_buttons[row][col]
-                btn.setFixedSize(35, 35)
-                btn.setStyleSheet("background-color: #4C566A; border: 1px solid #81A1C1;")
-                btn.clicked.connect(partial(self.handle_attack_click, row, col))
-                btn.setEnabled(False)  # Disable until game starts
-                self.enemy_grid_layout.addWidget(btn, row+1, col+1)
-        
-        enemy_layout.addLayout(self.enemy_grid_layout)
+        self.enemy_grid = BoardWidget(self.board_size)
+        self.enemy_grid.cell_clicked.connect(self.handle_attack_click)
+        self.enemy_grid.set_interactive(False)  # Disable until game starts
+        enemy_layout.addWidget(self.enemy_grid)
         self.enemy_board.setLayout(enemy_layout)
         return self.enemy_board
 
+    def configure_board(self, board_size, fleet):
+        """Switch to the server's board size and fleet, placement starts over if they changed."""
+        if (board_size, fleet) == (self.board_size, self.fleet):
+            return
+        logger.info(f"Client {CLIENT_ID}: Playing on a {board_size}x{board_size} board with fleet {fleet}")
+        self.board_size = board_size
+        self.fleet = list(fleet)
+        self.ships_to_place = list(fleet)
+        self.placed_ships = []
+        self.attacked_coords = set()
+        self.placement_mode = True
+        self.player_grid.reset(board_size)
+        self.enemy_grid.reset(board_size)
+        self.orientation_frame.show()
+        self.ship_info.setText(f"Place {self.ships_to_place[0]}-unit ship")
+        self.status_label.setText(f"Place your ships on the {board_size}x{board_size} board.")
+
     def set_orientation(self, orientation):
         self.orientation = orientation
         logger.debug(f"Client {CLIENT_ID}: Ship orientation set to {orientation}")
@@ -384,26 +678,25 @@ class BattleshipClient(QMainWindow):
         try:
             # Check if ship placement is valid
             if self.orientation == "horizontal":
-                if col + ship_length > 10:
+                if col + ship_length > self.board_size:
                     raise ValueError(f"Ship extends beyond the right edge of the board")
                 
                 for c in range(col, col + ship_length):
-                    if self.grid[row][c] == 1:
+                    if self.player_grid.cell(row, c) == BoardWidget.SHIP:
                         raise ValueError(f"Ship overlaps with existing ship at ({row}, {c})")
                     ship_coords.append((row, c))
             else:  # vertical
-                if row + ship_length > 10:
+                if row + ship_length > self.board_size:
                     raise ValueError(f"Ship extends beyond the bottom edge of the board")
                 
                 for r in range(row, row + ship_length):
-                    if self.grid[r][col] == 1:
+                    if self.player_grid.cell(r, col) == BoardWidget.SHIP:
                         raise ValueError(f"Ship overlaps with existing ship at ({r}, {col})")
                     ship_coords.append((r, col))
             
             # Place the ship
             for r, c in ship_coords:
-                self.grid[r][c] = 1
-                self.player_buttons[r][c].setStyleSheet("background-color: #88C0D0; border: 1px solid #81A1C1;")
+                self.player_grid.set_cell(r, c, BoardWidget.SHIP)
             
             self.placed_ships.append(ship_coords)
             self.ships_to_place.pop(0)
@@ -414,15 +707,36 @@ class BattleshipClient(QMainWindow):
                 # Update status for next ship
                 self.status_label.setText(f"Place {self.ships_to_place[0]}-unit ship")
                 # Also update the orientation frame label
-                for i in range(self.orientation_frame.layout().count()):
-                    widget = self.orientation_frame.layout().itemAt(i).widget()
-                    if isinstance(widget, QLabel):
-                        widget.setText(f"Place {self.ships_to_place[0]}-unit ship")
+                self.ship_info.setText(f"Place {self.ships_to_place[0]}-unit ship")
             
         except ValueError as e:
             logger.warning(f"Client {CLIENT_ID}: Invalid ship placement: {str(e)}")
             QMessageBox.warning(self, "Invalid Placement", str(e))
 
+    def auto_place_ships(self):
+        """Place the remaining ships at random around the ones already placed."""
+        if not self.placement_mode or not self.ships_to_place:
+            return
+
+        occupied = 0
+        for ship in self.placed_ships:
+            occupied |= ship_mask(ship, self.board_size)
+        try:
+            fleet = random_fleet(fleet=self.ships_to_place, occupied=occupied, board_size=self.board_size)
+        except ValueError as e:
+            logger.warning(f"Client {CLIENT_ID}: Auto-place failed: {str(e)}")
+            QMessageBox.warning(self, "Invalid Placement", str(e))
+            return
+
+        logger.debug(f"Client {CLIENT_ID}: Auto-placing ships {fleet}")
+        for ship in fleet:
+            ship_coords = [tuple(cell) for cell in ship]
+            for r, c in ship_coords:
+                self.player_grid.set_cell(r, c, BoardWidget.SHIP)
+            self.placed_ships.append(ship_coords)
+        self.ships_to_place = []
+        self.finish_placement()
+
     def finish_placement(self):
         logger.info(f"Client {CLIENT_ID}: All ships placed, finishing placement phase")
         self.placement_mode = False
@@ -449,6 +763,10 @@ class BattleshipClient(QMainWindow):
         logger.debug(f"Client {CLIENT_ID}: Attack click at ({row}, {col}). Current turn: {self.current_turn}, Attacks disabled: {self.attacks_disabled}")
         
         # Check if attack is valid
+        if self.pending_attack is not None:
+            self.status_label.setText("Waiting for the server to answer your last attack...")
+            return
+        
         if not self.current_turn:
             self.status_label.setText("Not your turn!")
             return
@@ -465,25 +783,31 @@ class BattleshipClient(QMainWindow):
             self.status_label.setText("You've already attacked this position!")
             return
         
-        if not self.selected_card:
+        if self.selected_card is None:
             self.status_label.setText("Select a card before attacking!")
             return
         
-        # Track attacked coordinate
-        self.attacked_coords.add((row, col))
+        # Show the card's footprint as pending right away, attack_result or
+        # attack_rejected with the same ID settles it
+        self.attack_id += 1
+        cells = calculate_affected_coords(row, col, CARDS[self.selected_card].effect, self.board_size)
+        self.pending_attack = (self.attack_id, self.selected_card, {})
+        self.mark_pending(cells)
+        self.attack_timer.start(ATTACK_TIMEOUT * 1000)
         
         # Send attack to server
         attack_msg = {
             'type': 'attack',
             'card': self.selected_card,
             'row': row,
-            'col': col
+            'col': col,
+            'id': self.attack_id
         }
         logger.debug(f"Client {CLIENT_ID}: Sending attack: {attack_msg}")
         self.send_message(attack_msg)
         
         # Update UI
-        self.status_label.setText(f"Attack sent to ({row}, {col}) with {self.selected_card['name']}")
+        self.status_label.setText(f"Attack sent to ({row}, {col}) with {CARDS[self.selected_card].name}")
         
         # Clear selected card
         self.selected_card = None
@@ -493,6 +817,27 @@ class BattleshipClient(QMainWindow):
         self.current_turn = False
         self.update_board_states()
 
+    def mark_pending(self, cells):
+        """Show cells of the pending attack as pending, remembering what they showed before."""
+        before = self.pending_attack[2]
+        for r, c in cells:
+            state = self.enemy_grid.cell(r, c)
+            if state not in (BoardWidget.HIT, BoardWidget.MISS):  # Already settled, the server skips these
+                before[(r, c)] = state
+                self.enemy_grid.set_cell(r, c, BoardWidget.PENDING)
+        self.update_board_states()
+
+    def settle_attack(self):
+        """Put the pending attack's cells back the way they were and return the attack."""
+        attack = self.pending_attack
+        self.pending_attack = None
+        self.attack_timer.stop()
+        for (r, c), state in attack[2].items():
+            if self.enemy_grid.cell(r, c) == BoardWidget.PENDING:
+                self.enemy_grid.set_cell(r, c, state)
+        self.update_board_states()
+        return attack
+
     def draw_card(self):
         if not self.current_turn or self.game_over:
             return
@@ -505,10 +850,10 @@ class BattleshipClient(QMainWindow):
         if not self.current_turn or self.game_over or self.attacks_disabled:
             return
         
-        logger.debug(f"Client {CLIENT_ID}: Selected card: {card['name']}")
+        logger.debug(f"Client {CLIENT_ID}: Selected card: {CARDS[card].name}")
         self.selected_card = card
         self.update_card_buttons()
-        self.status_label.setText(f"Selected {card['name']} - Choose target")
+        self.status_label.setText(f"Selected {CARDS[card].name} - Choose target")
 
     def update_card_buttons(self):
         # Remove existing card buttons
@@ -525,12 +870,14 @@ class BattleshipClient(QMainWindow):
             self.card_layout.addWidget(empty_label)
             return
         
-        for card in self.hand:
+        for card, uses in zip(self.hand, self.hand_uses):
             card_btn = QPushButton()
             card_btn.setFixedWidth(120)
             
             # Set card text with name and description
-            card_text = f"{card['name']}\n{card['description']}"
+            card_text = f"{CARDS[card].name}\n{CARDS[card].description}"
+            if CARDS[card].uses > 1:
+                card_text += f"\n{uses} left"
             card_btn.setText(card_text)
             
             # Style based on selection
@@ -559,38 +906,40 @@ class BattleshipClient(QMainWindow):
             logger.warning(f"Client {CLIENT_ID}: Received invalid message format: {data}")
             return
         
-        msg_type = data['type']
-        logger.debug(f"Client {CLIENT_ID}: Handling message type: {msg_type}")
-        
-        if msg_type == 'game_start':
-            self.handle_game_start(data)
-        elif msg_type == 'turn_update':
-            self.handle_turn_update(data)
-        elif msg_type == 'new_card':
-            self.handle_new_card(data)
-        elif msg_type == 'attack_result':
-            self.handle_attack_result(data)
-        elif msg_type == 'game_over':
-            self.handle_game_over(data)
-        elif msg_type == 'remove_card':
-            self.handle_remove_card(data)
-        else:
-            logger.warning(f"Client {CLIENT_ID}: Unknown message type: {msg_type}")
+        logger.debug(f"Client {CLIENT_ID}: Handling message type: {data['type']}")
+        error = self.dispatcher.dispatch(data)
+        if error:
+            logger.warning(f"Client {CLIENT_ID}: Ignoring message: {error}")
+
+    def handle_match_ready(self, data):
+        logger.info(f"Client {CLIENT_ID}: Match ready with players {data['players']}")
+        self.configure_board(data['board_size'], data['fleet'])
+
+    def handle_reconnect_success(self, data):
+        if data['username'] != self.username:
+            self.status_label.setText(f"{data['username']} reconnected")
 
     def handle_remove_card(self, data):
         """Handle server notification to remove a card from hand."""
-        card_name = data['card_name']
-        logger.debug(f"Client {CLIENT_ID}: Removing card {card_name} from hand")
+        card = data['card']
+        logger.debug(f"Client {CLIENT_ID}: Removing card {CARDS[card].name} from hand")
         
-        # Remove the card with the given name from the hand
-        for i, card in enumerate(self.hand):
-            if card['name'] == card_name:
-                del self.hand[i]
-                break
+        # The server always uses up the first copy of a card
+        if card in self.hand:
+            i = self.hand.index(card)
+            del self.hand[i]
+            del self.hand_uses[i]
         
         # Update the UI to reflect the card removal
         self.update_card_buttons()
 
+    def handle_card_used(self, data):
+        """A multi-use card was played and stays in hand with fewer uses."""
+        card = data['card']
+        if card in self.hand:
+            self.hand_uses[self.hand.index(card)] = data['uses']
+        self.update_card_buttons()
+
     def handle_game_start(self, data):
         logger.info(f"Client {CLIENT_ID}: Game started")
         self.current_turn = (data['current_player'] == self.username)
@@ -618,43 +967,61 @@ class BattleshipClient(QMainWindow):
 
     def handle_new_card(self, data):
         card = data['card']
-        logger.debug(f"Client {CLIENT_ID}: Received new card: {card['name']}")
+        logger.debug(f"Client {CLIENT_ID}: Received new card: {CARDS[card].name}")
         self.hand.append(card)
+        self.hand_uses.append(CARDS[card].uses)
         self.update_card_buttons()
-        self.status_label.setText(f"Drew card: {card['name']}")
+        self.status_label.setText(f"Drew card: {CARDS[card].name}")
 
     def handle_attack_result(self, data):
         logger.debug(f"Client {CLIENT_ID}: Attack result - Player: {data['player']}, Coords: {data['coords']}, Hits: {data['hits']}")
         
+        pending = self.pending_attack
+        if data['player'] == self.username and pending is not None and data.get('id') == pending[0]:
+            self.settle_attack()  # The outcome below replaces the pending cells
+        
         # Process special effects first
         if 'special_effect' in data and data['special_effect']:
             self.handle_special_effect(data['special_effect'], data)
         
         # Update appropriate grid based on who made the attack
         if data['player'] == self.username:  # I attacked
-            for coord, hit in zip(data['coords'], data['hits']):
-                row, col = coord
-                color = "#BF616A" if hit else "#D8DEE9"  # Red for hit, white for miss
-                self.enemy_buttons[row][col].setStyleSheet(f"background-color: {color}; border: 1px solid #81A1C1;")
-                self.enemy_buttons[row][col].setText("HIT" if hit else "MISS")  # Add text feedback
+            board = self.enemy_grid
+            self.attacked_coords.update(tuple(coord) for coord in data['coords'])  # Refused as targets from now on
         else:  # I was attacked
-            for coord, hit in zip(data['coords'], data['hits']):
-                row, col = coord
-                if hit:
-                    self.player_buttons[row][col].setStyleSheet("background-color: #BF616A; border: 1px solid #81A1C1;")  # Red for hit
-                    self.player_buttons[row][col].setText("HIT")  # Add text feedback
-                else:
-                    self.player_buttons[row][col].setStyleSheet("background-color: #D8DEE9; border: 1px solid #81A1C1;")  # White for miss
-                    self.player_buttons[row][col].setText("MISS")  # Add text feedback
+            board = self.player_grid
+        for coord, hit in zip(data['coords'], data['hits']):
+            row, col = coord
+            board.set_cell(row, col, BoardWidget.HIT if hit else BoardWidget.MISS)
+
+    def handle_attack_rejected(self, data):
+        """The server refused our attack, undo what we drew for it."""
+        logger.info(f"Client {CLIENT_ID}: Attack {data['id']} rejected: {data['reason']}")
+        if self.pending_attack is None or data['id'] != self.pending_attack[0]:
+            return  # Not the attack we're waiting on
+        attack_id, card, _ = self.settle_attack()
+        if card in self.hand:
+            self.selected_card = card
+            self.update_card_buttons()
+        # Whose turn it is comes from the synced state, the rejection may have been about that
+        self.current_turn = self.sync_state.get('turn') == self.username
+        self.update_board_states()
+        self.status_label.setText(f"Attack rejected: {data['reason']}")
+        # Our view was off, a keyframe brings the boards and attacked cells in line with the server's
+        self.send_message({'type': 'sync'})
+
+    def handle_message_rejected(self, data):
+        logger.warning(f"Client {CLIENT_ID}: Server refused {data['request']}: {data['reason']}")
+        self.status_label.setText(f"Server refused {data['request']}: {data['reason']}")
+
+    def handle_attack_timeout(self):
+        if self.pending_attack is not None:
+            logger.warning(f"Client {CLIENT_ID}: No answer to attack {self.pending_attack[0]}")
+            self.handle_attack_rejected({'id': self.pending_attack[0], 'reason': "no answer from the server"})
 
     def handle_special_effect(self, effect, data):
         logger.debug(f"Client {CLIENT_ID}: Handling special effect: {effect}")
         
-        # Remove the special card if it was used
-        if effect != 'single':
-            self.hand = [c for c in self.hand if c['name'] != effect]
-            self.update_card_buttons()
-        
         # Handle specific effects
         if effect == 'EMP':
             if data['player'] != self.username:  # If opponent used EMP on me
@@ -667,11 +1034,16 @@ class BattleshipClient(QMainWindow):
             if data['player'] == self.username:  # If I used sonar/recon
                 for coord in data.get('coords', []):
                     r, c = coord
-                    if self.enemy_grid[r][c] == 0:  # Only update cells that aren't already hit/missed
-                        self.enemy_buttons[r][c].setStyleSheet("background-color: #7B88A1; border: 1px solid #81A1C1;")  # Light gray for scanned
+                    if self.enemy_grid.cell(r, c) == BoardWidget.EMPTY:  # Only update cells that aren't already hit/missed
+                        self.enemy_grid.set_cell(r, c, BoardWidget.SCANNED)
 
     def handle_game_over(self, data):
         logger.info(f"Client {CLIENT_ID}: Game over - {data['message']}")
+        if self.pending_attack is not None:
+            # The winning attack gets no attack_result, the state synced before game_over has it
+            self.settle_attack()
+            if self.sync_state:
+                self.render_state()
         self.game_over = True
         self.current_turn = False
         self.update_board_states()
@@ -685,55 +1057,123 @@ class BattleshipClient(QMainWindow):
         # Disable draw button
         self.draw_btn.setEnabled(False)
 
+    def handle_welcome(self, data):
+        logger.info(f"Client {CLIENT_ID}: Server speaks protocol version {data['version']}")
+        if not self.reconnecting:
+            self.configure_board(data['board_size'], data['fleet'])
+            return
+        self.reconnecting = False
+        if self.pending_attack is not None:
+            self.settle_attack()  # Sent while we were away, or answered on the old connection
+        if data['resumed']:
+            logger.info(f"Client {CLIENT_ID}: Resumed the match")
+            self.status_label.setText("Reconnected!")
+        else:
+            QMessageBox.critical(self, "Connection Lost", "Reconnected, but the match is no longer running.")
+            self.close()
+
+    def handle_state_keyframe(self, data):
+        """Replace our view of the match, e.g. after resuming it or falling behind."""
+        logger.debug(f"Client {CLIENT_ID}: State keyframe {data['seq']}")
+        self.sync_seq = data['seq']
+        self.sync_state = decode_state(data['state'])
+        self.render_state()
+        if self.pending_attack is not None:
+            self.mark_pending(self.pending_attack[2])  # Not in the keyframe yet, the server answers it later
+
+    def handle_state_delta(self, data):
+        if data['base'] != self.sync_seq:
+            # Missed an update, ask for a keyframe instead of guessing
+            logger.info(f"Client {CLIENT_ID}: State delta {data['seq']} doesn't follow {self.sync_seq}, resyncing")
+            self.send_message({'type': 'sync'})
+            return
+        apply_delta(self.sync_state, data['changes'])
+        self.sync_seq = data['seq']
+        if 'hand' in data['changes'] or 'uses' in data['changes']:
+            self.hand = list(self.sync_state['hand'])
+            self.hand_uses = list(self.sync_state['uses'])
+            self.update_card_buttons()
+
+    def render_state(self):
+        """Redraw boards, hand and turn from sync_state."""
+        state = self.sync_state
+        self.hand = list(state['hand'])
+        self.hand_uses = list(state['uses'])
+        self.update_card_buttons()
+        if state['turn'] is not None:
+            self.placement_mode = False
+        # Later layers win, only the set bits are visited
+        n = self.board_size
+        for board, layers in ((self.player_grid, (('fleet', BoardWidget.SHIP), ('misses_taken', BoardWidget.MISS),
+                                                  ('hits_taken', BoardWidget.HIT))),
+                              (self.enemy_grid, (('revealed', BoardWidget.SCANNED), ('misses', BoardWidget.MISS),
+                                                 ('hits', BoardWidget.HIT)))):
+            board.reset()
+            for field, cell_state in layers:
+                for row, col in mask_cells(state[field], n):
+                    board.set_cell(row, col, cell_state)
+        self.attacked_coords.update(mask_cells(state['hits'] | state['misses'], n))
+        self.current_turn = (state['turn'] == self.username)
+        self.attacks_disabled = False
+        self.update_board_states()
+
+    def handle_rtt(self, rtt):
+        self.setWindowTitle(f"Battleship - {self.username} ({rtt * 1000:.0f} ms)")
+
+    def handle_handshake_error(self, data):
+        logger.error(f"Client {CLIENT_ID}: Server refused the connection: {data['message']}")
+        self.connected = False
+        QMessageBox.critical(self, "Connection Refused", data['message'])
+        self.close()
+
+    def handle_server_shutdown(self, data):
+        logger.info(f"Client {CLIENT_ID}: Server is shutting down: {data['message']}")
+        self.connected = False
+        QMessageBox.information(self, "Server Restarting", data['message'])
+        self.close()
+
     def handle_disconnect(self):
         if self.connected:
             logger.warning(f"Client {CLIENT_ID}: Connection to server lost")
             self.connected = False
+            if self.pending_attack is not None:
+                self.settle_attack()  # Its answer is lost, the keyframe after resuming shows whether it landed
+            if self.network.reconnect_token and not self.game_over:
+                self.reconnecting = True
+                self.status_label.setText("Connection lost, reconnecting...")
+                self.network.reconnect()
+                return
             QMessageBox.critical(self, "Connection Lost", "Connection to the server has been lost.")
             self.close()
 
     def update_board_states(self):
-        # Enable/disable enemy board based on turn
-        for row in range(10):
-            for col in range(10):
-                btn = self.enemy_buttons[row][col]
-                # Only enable buttons for positions not already attacked and when it's our turn
-                can_attack = (self.current_turn and 
-                              not self.game_over and 
-                              not self.attacks_disabled and 
-                              (row, col) not in self.attacked_coords)
-                btn.setEnabled(can_attack)
+        # Enable/disable enemy board based on turn, clicks on attacked cells are refused in handle_attack_click
+        self.enemy_grid.set_interactive(self.current_turn and not self.game_over and not self.attacks_disabled
+                                        and self.pending_attack is None)
         
         # Update draw button state
         self.draw_btn.setEnabled(self.current_turn and not self.game_over)
 
     def send_message(self, message):
-        try:
-            if self.connected:
-                # Ensure the message is properly serialized to JSON
-                json_message = json.dumps(message, ensure_ascii=False)
-                logger.debug(f"Client {CLIENT_ID}: Sending message: {json_message}")
-                self.client.send(json_message.encode('utf-8'))
-            else:
-                logger.warning(f"Client {CLIENT_ID}: Cannot send message - not connected")
-        except json.JSONDecodeError as e:
-            logger.error(f"Client {CLIENT_ID}: JSON decode error: {e}")
-        except Exception as e:
-            logger.error(f"Client {CLIENT_ID}: Error sending message: {str(e)}")
+        if not self.connected:
+            logger.warning(f"Client {CLIENT_ID}: Cannot send message - not connected")
+            return
+        logger.debug(f"Client {CLIENT_ID}: Sending message: {message}")
+        self.network.send_message(message)
+
+    def handle_send_failed(self, message, reason):
+        logger.error(f"Client {CLIENT_ID}: Error sending {message.get('type')} message: {reason}")
+        if not self.network.is_connected:
             self.handle_disconnect()
+        else:
+            self.status_label.setText(f"Could not send {message.get('type')}: {reason}")
+            if message.get('type') == 'attack':
+                self.handle_attack_rejected({'id': message.get('id'), 'reason': reason})
 
     def closeEvent(self, event):
         logger.info(f"Client {CLIENT_ID}: Closing application")
-        if self.network_thread and self.network_thread.isRunning():
-            self.network_thread.stop()
-            self.network_thread.wait(1000)  # Wait up to 1 second for thread to finish
-        
-        if self.connected and self.client:
-            try:
-                self.client.close()
-            except:
-                pass
-        
+        self.connected = False
+        self.network.close()
         event.accept()
 
 if __name__ == "__main__":
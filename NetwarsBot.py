@@ -0,0 +1,328 @@
+import time
+import socket
+import threading
+import random
+import json
+import argparse
+import numpy as np
+
+from NetwarsServer import (BOARD_SIZE, FLEET, EFFECT_SHAPES, calculate_affected_coords, placement_table,
+                           random_fleet)
+from NetwarsProtocol import encode_message, make_hello, configure_socket, decompress_message
+from NetwarsCards import CARDS
+
+EFFECTS = ['single', 'vertical', 'horizontal', 'bombardment', 'recon', 'sonar', 'EMP']
+HIT_WEIGHT = 30  # Boost for placements running through known hits (target mode)
+THINK_TIME = 0.5  # Seconds between moves, keeps a bot within the server's rate limits
+MAX_PLACEMENT_MATRIX = 64 * 1024 * 1024  # Bytes the density bot may spend on it, e.g. 30x30 takes about 30 MB
+
+def placement_matrix(fleet=FLEET, board_size=BOARD_SIZE):
+    """Build a matrix with one row per straight placement and one column per cell.
+
+    Returns the 0/1 matrix, the length of each row's ship and the weight of each
+    row (how many ships of that length the fleet still holds).
+    """
+    counts = {}
+    for length in fleet:
+        counts[length] = counts.get(length, 0) + 1
+
+    rows, lengths, weights = [], [], []
+    for length, count in counts.items():
+        for cells in placement_table(length, board_size).values():
+            row = np.zeros(board_size * board_size, dtype=np.float32)
+            for r, c in cells:
+                row[r * board_size + c] = 1
+            rows.append(row)
+            lengths.append(length)
+            weights.append(count)
+    return (np.array(rows), np.array(lengths, dtype=np.int32),
+            np.array(weights, dtype=np.float32))
+
+def effect_footprints(board_size=BOARD_SIZE):
+    """Build a (target x cell) 0/1 matrix per effect from the server's geometry."""
+    footprints = {}
+    for effect in EFFECTS:
+        matrix = np.zeros((board_size * board_size, board_size * board_size), dtype=np.float32)
+        for r in range(board_size):
+            for c in range(board_size):
+                for ar, ac in calculate_affected_coords(r, c, effect, board_size):
+                    matrix[r * board_size + c, ar * board_size + ac] = 1
+        footprints[effect] = matrix
+    return footprints
+
+def footprint_scores(value, effect, board_size=BOARD_SIZE):
+    """Sum `value` over every target's footprint, cells off the board count as 0.
+
+    Equal to effect_footprints(board_size)[effect] @ value, but a few shifted
+    adds instead of a (cells x cells) matrix, so it works on large boards too.
+    """
+    shape = EFFECT_SHAPES.get(effect, ((0, 0),))
+    pad = max(max(abs(dr), abs(dc)) for dr, dc in shape)
+    grid = np.pad(value.reshape(board_size, board_size), pad)
+    scores = np.zeros((board_size, board_size), dtype=value.dtype)
+    for dr, dc in shape:
+        scores += grid[pad + dr:pad + dr + board_size, pad + dc:pad + dc + board_size]
+    return scores.ravel()
+
+def placement_matrix_bytes(fleet, board_size):
+    """Return how large placement_matrix(fleet, board_size) would be, without building it."""
+    rows = sum(board_size * (board_size - length + 1) * (1 if length == 1 else 2) for length in set(fleet))
+    return rows * board_size * board_size * 4  # float32
+
+_placement_matrices = {}  # (fleet, board_size) -> placement_matrix(), shared by every bot instance
+
+def shared_placement_matrix(fleet, board_size):
+    key = (tuple(fleet), board_size)
+    if key not in _placement_matrices:
+        _placement_matrices[key] = placement_matrix(fleet, board_size)  # The only slow part of a bot
+    return _placement_matrices[key]
+
+class ProbabilityBot:
+    """Hunt/target player driven by a placement-density heat map.
+
+    Every placement of every remaining ship that doesn't cross a known miss is
+    counted, placements through known hits are boosted, and the resulting per-cell
+    hit probabilities are used to score each card in hand by expected hits plus
+    expected information (binary entropy of the cells it would uncover). A decision
+    is a handful of small matrix products, well under a millisecond on the
+    default board. The placement matrix grows with the square of the cell
+    count, BotClient plays hunt instead where it would exceed
+    MAX_PLACEMENT_MATRIX.
+    """
+
+    def __init__(self, rng=None, board_size=BOARD_SIZE, fleet=FLEET):
+        self.rng = rng or random.Random()
+        self.board_size = board_size
+        self.fleet = list(fleet)
+        self.placements = None  # Built on first use, the other strategies never need it
+        self.total_cells = sum(fleet)
+        self.hits = np.zeros(board_size * board_size, dtype=np.float32)
+        self.misses = np.zeros(board_size * board_size, dtype=np.float32)
+        self.hand = []  # Card IDs
+
+    def place_ships(self):
+        """Pick a uniformly random legal fleet, in the order the server expects."""
+        return random_fleet(self.rng, self.fleet, board_size=self.board_size)
+
+    def heat_map(self):
+        """Return the per-cell probability that an unattacked cell holds a ship."""
+        if self.placements is None:
+            self.placements, self.lengths, self.weights = shared_placement_matrix(self.fleet, self.board_size)
+        blocked = (self.placements @ self.misses) > 0
+        covered = self.placements @ self.hits
+        weights = self.weights * ~blocked * (1 + HIT_WEIGHT * covered)
+        density = weights @ self.placements
+        density[(self.hits + self.misses) > 0] = 0
+
+        total = density.sum()
+        if total == 0:
+            return density
+        remaining = self.total_cells - self.hits.sum()
+        return np.clip(density / total * remaining, 0, 0.999)
+
+    def choose_action(self):
+        """Return the next protocol message to send on our turn."""
+        if not self.hand:
+            return {'type': 'draw_card'}
+
+        p = self.heat_map()
+        q = 1 - p
+        entropy = -(p * np.log2(p + 1e-9) + q * np.log2(q + 1e-9))
+        value = p + entropy  # Expected hits plus expected bits of information
+        attacked = (self.hits + self.misses) > 0
+
+        best_card, best_target, best_score = None, None, -1.0
+        for card in self.hand:
+            scores = footprint_scores(value, CARDS[card].effect, self.board_size)
+            scores[attacked] = -1  # The server rejects attacks on an attacked target
+            target = int(np.argmax(scores))
+            if scores[target] > best_score:
+                best_card, best_target, best_score = card, target, scores[target]
+
+        return {
+            'type': 'attack',
+            'card': best_card,
+            'row': best_target // self.board_size,
+            'col': best_target % self.board_size
+        }
+
+    def new_card(self, card):
+        self.hand.append(card)
+
+    def remove_card(self, card):
+        if card in self.hand:
+            self.hand.remove(card)  # The first copy, like the server
+
+    def observe_attack(self, coords, hits):
+        """Record the outcome of one of our attacks."""
+        for (r, c), hit in zip(coords, hits):
+            if hit:
+                self.hits[r * self.board_size + c] = 1
+            else:
+                self.misses[r * self.board_size + c] = 1
+
+class RandomBot(ProbabilityBot):
+    """Baseline player: random card from hand at a random unattacked cell."""
+
+    def choose_action(self):
+        if not self.hand:
+            return {'type': 'draw_card'}
+        target = self.rng.choice(np.flatnonzero((self.hits + self.misses) == 0))
+        return {
+            'type': 'attack',
+            'card': self.rng.choice(self.hand),
+            'row': int(target) // self.board_size,
+            'col': int(target) % self.board_size
+        }
+
+class HuntBot(ProbabilityBot):
+    """Classic hunt/target player: fire next to known hits, otherwise on a checkerboard."""
+
+    def choose_action(self):
+        if not self.hand:
+            return {'type': 'draw_card'}
+        size = self.board_size
+        grid = (self.hits > 0).reshape(size, size)
+        near = np.zeros_like(grid)
+        near[1:, :] |= grid[:-1, :]
+        near[:-1, :] |= grid[1:, :]
+        near[:, 1:] |= grid[:, :-1]
+        near[:, :-1] |= grid[:, 1:]
+        free = (self.hits + self.misses) == 0
+        candidates = np.flatnonzero(near.ravel() & free)
+        if not len(candidates):
+            parity = (np.arange(size * size) // size + np.arange(size * size) % size) % 2 == 0
+            candidates = np.flatnonzero(parity & free)
+            if not len(candidates):
+                candidates = np.flatnonzero(free)
+        target = int(self.rng.choice(candidates))
+        return {
+            'type': 'attack',
+            'card': self.rng.choice(self.hand),
+            'row': target // size,
+            'col': target % size
+        }
+
+# Strategies selectable by name from the command line and the tournament runner
+STRATEGIES = {
+    'density': ProbabilityBot,
+    'hunt': HuntBot,
+    'random': RandomBot
+}
+
+def playable_strategy(strategy, board_size, fleet):
+    """Return strategy, or 'hunt' where its placement matrix would be too large to build."""
+    if STRATEGIES[strategy] is ProbabilityBot and placement_matrix_bytes(fleet, board_size) > MAX_PLACEMENT_MATRIX:
+        return 'hunt'
+    return strategy
+
+class BotClient(threading.Thread):
+    """Plays a bot strategy against a server over the normal client protocol."""
+
+    def __init__(self, host='127.0.0.1', port=5555, username=None, rng=None, strategy='density',
+                 think_time=THINK_TIME):
+        super().__init__(daemon=True)
+        self.host = host
+        self.port = port
+        self.username = username or f"Bot-{random.randint(1000, 9999)}"
+        self.strategy = strategy
+        self.bot = STRATEGIES[strategy](rng)
+        self.think_time = think_time
+        self.client = None
+        self.redirect = None  # (host, port) a lobby sent us to
+
+    def run(self):
+        address = (self.host, self.port)
+        while address:
+            self.redirect = None
+            self.play(*address)
+            address = self.redirect  # Set when a lobby sent us to the node running our match
+
+    def play(self, host, port):
+        self.client = socket.create_connection((host, port))
+        configure_socket(self.client)
+        self.client.sendall(encode_message(make_hello(self.username)))
+        print(f"{self.username} joined {host}:{port}")
+
+        buffer = ""
+        try:
+            while True:
+                data = self.client.recv(4096).decode('utf-8')
+                if not data:
+                    break  # Server closed the connection
+                buffer += data
+                while '\n' in buffer:
+                    line, buffer = buffer.split('\n', 1)
+                    if not line.strip():
+                        continue
+                    msg = json.loads(line)
+                    if msg.get('type') == 'compressed':
+                        msg = decompress_message(msg)
+                    if not self.handle_message(msg):
+                        return
+        except OSError as e:
+            print(f"{self.username} connection error: {e}")
+        finally:
+            self.client.close()
+
+    def handle_message(self, msg):
+        """React to a server message, returns False once the game is over."""
+        msg_type = msg.get('type')
+        if msg_type == 'ping':
+            self.send({'type': 'pong', 't': msg['t']})
+        elif msg_type == 'redirect':
+            self.redirect = (msg['host'], msg['port'])
+            return False
+        elif msg_type in ('handshake_error', 'server_shutdown'):
+            print(f"{self.username} was sent away: {msg['message']}")
+            return False
+        elif msg_type in ('match_ready', 'invalid_placement'):
+            if msg_type == 'match_ready' and (msg['board_size'], msg['fleet']) != (self.bot.board_size, self.bot.fleet):
+                strategy = playable_strategy(self.strategy, msg['board_size'], msg['fleet'])
+                if strategy != self.strategy:
+                    print(f"{self.username}: {msg['board_size']}x{msg['board_size']} is too large for "
+                          f"{self.strategy}, playing {strategy}")
+                self.bot = STRATEGIES[strategy](self.bot.rng, msg['board_size'], msg['fleet'])
+            try:
+                ships = self.bot.place_ships()
+            except ValueError as e:
+                print(f"{self.username} can't place its fleet, leaving the match: {e}")
+                return False
+            self.send({'type': 'placement', 'ships': ships})
+        elif msg_type == 'new_card':
+            self.bot.new_card(msg['card'])
+        elif msg_type == 'remove_card':
+            self.bot.remove_card(msg['card'])
+        elif msg_type == 'attack_result':
+            if msg['player'] == self.username:
+                self.bot.observe_attack(msg['coords'], msg['hits'])
+        elif msg_type in ('attack_rejected', 'message_rejected'):
+            print(f"{self.username} was refused: {msg['reason']}")
+        elif msg_type == 'game_over':
+            print(f"{self.username}: {msg['message']}")
+            return False
+
+        if msg_type in ('game_start', 'turn_update') and msg['current_player'] == self.username:
+            time.sleep(self.think_time)
+            self.send(self.bot.choose_action())
+        return True
+
+    def send(self, message):
+        self.client.sendall(encode_message(message))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Netwars AI opponent')
+    parser.add_argument('--host', default='127.0.0.1',
+                       help='Server address (default: 127.0.0.1)')
+    parser.add_argument('-p', '--port', type=int, default=5555,
+                       help='Server port (default: 5555)')
+    parser.add_argument('-u', '--username', default=None,
+                       help='Bot username (default: random)')
+    parser.add_argument('-s', '--strategy', choices=sorted(STRATEGIES), default='density',
+                       help='Playing strategy (default: density)')
+
+    args = parser.parse_args()
+
+    bot = BotClient(args.host, args.port, args.username, strategy=args.strategy)
+    bot.start()
+    bot.join()
@@ -0,0 +1,122 @@
+import json
+import time
+import queue
+import struct
+import argparse
+import threading
+
+# A capture file is MAGIC, a length-prefixed JSON header, then one record per
+# event: RECORD (seconds since the capture started, connection ID, kind,
+# payload length) followed by the payload
+MAGIC = b"NWCAP\x01"
+HEADER_LENGTH = struct.Struct('<I')
+RECORD = struct.Struct('<dIBI')
+
+# Record kinds
+CONNECT = 0  # Payload: the hello as JSON
+FRAME = 1  # Payload: one inbound frame without its newline
+DISCONNECT = 2  # No payload
+
+KIND_NAMES = {CONNECT: 'connect', FRAME: 'frame', DISCONNECT: 'disconnect'}
+
+class CaptureWriter:
+    """Records inbound traffic to a capture file.
+
+    record() only stamps the event and queues it, a writer thread packs
+    whatever has queued up and writes it in one go, so connection threads
+    never wait on the disk.
+    """
+
+    def __init__(self, path, header=None):
+        self.path = path
+        self.file = open(path, 'wb')
+        meta = json.dumps(dict(header or {}, started=time.time())).encode('utf-8')
+        self.file.write(MAGIC + HEADER_LENGTH.pack(len(meta)) + meta)
+        self.start = time.monotonic()
+        self.records = 0
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.write_loop, daemon=True)
+        self.thread.start()
+
+    def record(self, conn_id, kind, payload=b""):
+        self.queue.put((time.monotonic() - self.start, conn_id, kind, payload))
+
+    def write_loop(self):
+        """Write queued records in batches until close() is called."""
+        pack = RECORD.pack
+        while True:
+            item = self.queue.get()
+            chunks = []
+            while item is not None:
+                t, conn_id, kind, payload = item
+                chunks.append(pack(t, conn_id, kind, len(payload)))
+                chunks.append(payload)
+                self.records += 1
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.file.write(b"".join(chunks))
+            self.file.flush()
+            if item is None:
+                self.file.close()
+                return
+
+    def close(self):
+        """Write everything still queued and close the file."""
+        self.queue.put(None)
+        self.thread.join()
+
+def read_capture(path):
+    """Return a capture's header and an iterator over its (time, conn_id, kind, payload) records."""
+    f = open(path, 'rb')
+    if f.read(len(MAGIC)) != MAGIC:
+        f.close()
+        raise ValueError(f"{path} is not a Netwars capture")
+    length, = HEADER_LENGTH.unpack(f.read(HEADER_LENGTH.size))
+    header = json.loads(f.read(length).decode('utf-8'))
+
+    def records():
+        with f:
+            while True:
+                head = f.read(RECORD.size)
+                if len(head) < RECORD.size:
+                    return  # End of file, or a record cut short by a crash
+                t, conn_id, kind, size = RECORD.unpack(head)
+                payload = f.read(size)
+                if len(payload) < size:
+                    return
+                yield t, conn_id, kind, payload
+    return header, records()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Summarize a Netwars traffic capture')
+    parser.add_argument('capture', help='Capture file written by NetwarsServer.py --capture')
+
+    args = parser.parse_args()
+    header, records = read_capture(args.capture)
+    kinds = {}
+    types = {}
+    connections = set()
+    duration = 0.0
+    for t, conn_id, kind, payload in records:
+        duration = t
+        connections.add(conn_id)
+        kinds[kind] = kinds.get(kind, 0) + 1
+        if kind == FRAME:
+            try:
+                msg_type = json.loads(payload.decode('utf-8')).get('type')
+            except (ValueError, AttributeError):
+                msg_type = None  # Malformed frames are captured too
+            types[msg_type] = types.get(msg_type, 0) + 1
+
+    print(f"Captured {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(header['started']))}, "
+          f"{duration:.1f}s, {len(connections)} connections")
+    for key, value in header.items():
+        if key != 'started':
+            print(f"  {key:<12} {value}")
+    for kind, count in sorted(kinds.items()):
+        print(f"{KIND_NAMES.get(kind, kind):<12} {count:>10}")
+    print("Frames by type:")
+    for msg_type, count in sorted(types.items(), key=lambda item: -item[1]):
+        print(f"  {str(msg_type):<12} {count:>10}")
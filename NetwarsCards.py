@@ -0,0 +1,45 @@
+import os
+import json
+from types import MappingProxyType
+from dataclasses import dataclass
+
+CARDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cards.json")
+MAX_CARDS = 256  # Hands store card IDs in a bytearray
+
+@dataclass(frozen=True, slots=True)
+class Card:
+    id: int
+    name: str
+    description: str
+    effect: str
+    uses: int = 1
+
+def load_cards(path=CARDS_FILE):
+    """Load the card catalog as a tuple of Cards, a card's ID is its position in the file.
+
+    Cards have 1 use unless the file says otherwise. Client and server must
+    load the same catalog, messages only carry the IDs. The catalog is
+    immutable and shared by every match.
+    """
+    with open(path, encoding='utf-8') as f:
+        cards = json.load(f)
+    if len(cards) > MAX_CARDS:
+        raise ValueError(f"{path} defines {len(cards)} cards, at most {MAX_CARDS} are supported")
+    names = set()
+    catalog = []
+    for card_id, card in enumerate(cards):
+        for field in ('name', 'description', 'effect'):
+            if not isinstance(card.get(field), str):
+                raise ValueError(f"card {card_id} in {path} has no {field}")
+        if card['name'] in names:
+            raise ValueError(f"card name {card['name']!r} appears twice in {path}")
+        names.add(card['name'])
+        uses = int(card.get('uses', 1))
+        if not 1 <= uses <= 255:
+            raise ValueError(f"card {card['name']!r} in {path} must have 1 to 255 uses")
+        catalog.append(Card(card_id, card['name'], card['description'], card['effect'], uses))
+    return tuple(catalog)
+
+CARDS = load_cards()
+CARD_IDS = MappingProxyType({card.name: card.id for card in CARDS})  # Name -> ID
+CARD_POOL = tuple(card.id for card in CARDS)  # What a draw picks from
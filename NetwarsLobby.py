@@ -0,0 +1,367 @@
+import os
+import json
+import time
+import select
+import socket
+import argparse
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+
+from NetwarsProtocol import encode_message, configure_socket
+from NetwarsServer import HANDSHAKE_TIMEOUT, MAX_HELLO, MAX_USERNAME
+from NetwarsSupervisor import admin_port_for, admin_request, parse_ports
+
+REFRESH_INTERVAL = 1.0  # Seconds a node's load figures are trusted before it is pinged again
+ROUTE_TTL = 90  # Seconds a proxied player's node is remembered after they drop, so a reconnect finds the match
+POLL_INTERVAL = 0.1  # How often a waiting player's thread checks whether their match was placed
+RELAY_CHUNK = 64 * 1024  # Most bytes moved per splice/recv call
+
+class Node:
+    """One game server the lobby can place matches on."""
+    __slots__ = ('host', 'port', 'handle', 'load', 'healthy', 'draining', 'checked')
+
+    def __init__(self, host, port, handle):
+        self.host = host  # None: the address clients reached the lobby at
+        self.port = port
+        self.handle = handle  # How the broker reaches the node, e.g. its admin port
+        self.load = 0  # Connected and reserved players
+        self.healthy = False
+        self.draining = False
+        self.checked = 0.0  # Monotonic time of the last ping
+
+class Broker(ABC):
+    """Knows the game server nodes and places matches on the least loaded one.
+
+    query() is the transport: it sends one admin request to a node and returns
+    the reply. Subclasses provide it along with the node list, so the lobby
+    works the same whether the nodes are local processes, servers in this
+    process or something reached through a shared registry.
+    """
+
+    def __init__(self, nodes, refresh=REFRESH_INTERVAL):
+        self.nodes = list(nodes)
+        self.refresh = refresh
+        self.lock = threading.Lock()
+
+    @abstractmethod
+    def query(self, node, request):
+        """Send one admin request to a node and return its reply, OSError or ValueError if it can't be reached."""
+
+    def check(self, node):
+        """Ping a node and update its load figures."""
+        try:
+            reply = self.query(node, {'cmd': 'ping'})
+        except (OSError, ValueError):
+            reply = {'ok': False}
+        node.checked = time.monotonic()
+        node.healthy = bool(reply.get('ok'))
+        node.draining = bool(reply.get('draining'))
+        node.load = reply.get('clients', 0) + reply.get('reserved', 0)
+
+    def assign(self, players):
+        """Reserve a match for two players on the least loaded node, returns the node or None."""
+        with self.lock:
+            now = time.monotonic()
+            for node in self.nodes:
+                if now - node.checked >= self.refresh:
+                    self.check(node)
+            for node in sorted(self.nodes, key=lambda n: n.load):
+                if not node.healthy or node.draining:
+                    continue
+                try:
+                    reply = self.query(node, {'cmd': 'reserve', 'players': list(players)})
+                except (OSError, ValueError):
+                    node.healthy = False
+                    continue
+                if reply.get('ok'):
+                    node.load += len(players)  # Until the next ping brings the real figure
+                    return node
+            return None
+
+class LocalBroker(Broker):
+    """Nodes on this machine, reached through their local admin sockets."""
+
+    def __init__(self, ports, host=None, refresh=REFRESH_INTERVAL, timeout=1.0):
+        super().__init__([Node(host, port, admin_port_for(port)) for port in ports], refresh)
+        self.timeout = timeout
+
+    def query(self, node, request):
+        return admin_request(node.handle, request, self.timeout)
+
+class InProcessBroker(Broker):
+    """BattleshipServer objects running in this process, handy for tests."""
+
+    def __init__(self, servers, refresh=REFRESH_INTERVAL):
+        super().__init__([Node(None, server.port, server) for server in servers], refresh)
+
+    def query(self, node, request):
+        return node.handle.handle_admin_command(request)
+
+def relay(src, dst):
+    """Copy bytes from src to dst until src closes, then close dst for writing.
+
+    Where os.splice exists the bytes go socket -> pipe -> socket inside the
+    kernel and never reach Python.
+    """
+    try:
+        if hasattr(os, 'splice'):
+            read_end, write_end = os.pipe()
+            try:
+                while True:
+                    count = os.splice(src.fileno(), write_end, RELAY_CHUNK)
+                    if not count:
+                        break
+                    while count:
+                        count -= os.splice(read_end, dst.fileno(), count)
+            finally:
+                os.close(read_end)
+                os.close(write_end)
+        else:
+            while True:
+                data = src.recv(RELAY_CHUNK)
+                if not data:
+                    break
+                dst.sendall(data)
+    except OSError:
+        pass  # Either side reset, the other direction sees it too
+    finally:
+        try:
+            dst.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+class LobbyPlayer:
+    """A connection waiting in the lobby for an opponent."""
+    __slots__ = ('username', 'sock', 'addr', 'hello', 'leftover', 'node', 'placed')
+
+    def __init__(self, username, sock, addr, hello, leftover):
+        self.username = username
+        self.sock = sock
+        self.addr = addr  # (ip, port) the player connected from
+        self.hello = hello
+        self.leftover = leftover  # Bytes that came after the hello, forwarded when proxying
+        self.node = None  # Node the match was placed on
+        self.placed = threading.Event()  # Set once the broker placed the match, node None if it couldn't
+
+class Lobby:
+    """Front door of a multi-node deployment: pairs players and hands each match to a node.
+
+    Clients connect and send their hello as they would to a server. Once two
+    players wait, the broker reserves their match on the least loaded node
+    and each player is sent there: redirected if their client offers the
+    'redirect' capability and the lobby runs in redirect mode, otherwise
+    proxied through this process. Capacity grows by adding nodes to the
+    broker.
+    """
+
+    def __init__(self, broker, host='0.0.0.0', port=5554, mode='redirect'):
+        self.broker = broker
+        self.host = host
+        self.port = port
+        self.mode = mode  # 'redirect' or 'proxy'
+        self.waiting = deque()  # LobbyPlayers without an opponent yet
+        self.routes = {}  # Username -> (node, expiry) of proxied players, expiry None while connected
+        self.lock = threading.Lock()
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(socket.SOMAXCONN)
+
+    def run(self):
+        print(f"Lobby listening on port {self.port}, {len(self.broker.nodes)} nodes, {self.mode} mode")
+        while True:
+            try:
+                client, addr = self.server.accept()
+            except OSError:
+                break  # Closed by shutdown()
+            configure_socket(client)
+            threading.Thread(target=self.handle_client, args=(client, addr), daemon=True).start()
+
+    def shutdown(self):
+        try:
+            self.server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.server.close()
+
+    def handle_client(self, client, addr):
+        try:
+            player = self.read_hello(client, addr)
+            if player is None:
+                return
+            node = self.route(player)
+            if node is None:
+                if not self.enqueue(player):
+                    self.reject(client, addr, player.username, f"{player.username} is already waiting in the lobby")
+                    return
+                if not self.wait(player):
+                    return
+                node = player.node
+                if node is None:
+                    self.reject(client, addr, player.username, "No game server is available, please try again later")
+                    return
+            if self.mode == 'redirect' and 'redirect' in (player.hello.get('capabilities') or []):
+                self.redirect(player, node)
+            else:
+                self.proxy(player, node)
+        except OSError as e:
+            print(f"Connection error with {addr}: {e}")
+        finally:
+            client.close()
+
+    def reject(self, client, addr, username, error):
+        print(f"Rejected {username!r} from {addr}: {error}")
+        try:
+            client.sendall(encode_message({'type': 'handshake_error', 'message': error}))
+        except OSError:
+            pass
+
+    def read_hello(self, client, addr):
+        """Read a connection's hello, returns its LobbyPlayer or None if it was turned away."""
+        client.settimeout(HANDSHAKE_TIMEOUT)
+        buffer = b""
+        try:
+            while b"\n" not in buffer:
+                data = client.recv(MAX_HELLO)
+                if not data or len(buffer) > MAX_HELLO:
+                    return None
+                buffer += data
+        except OSError:
+            return None  # Timed out or reset, like the server's handshake
+        line, leftover = buffer.split(b"\n", 1)
+        try:
+            hello = json.loads(line.decode('utf-8'))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            hello = None
+        if not isinstance(hello, dict) or hello.get('type') != 'hello':
+            self.reject(client, addr, None, "First message must be a hello")
+            return None
+        username = hello.get('username')
+        if not isinstance(username, str) or not username or len(username) > MAX_USERNAME:
+            self.reject(client, addr, username, f"Username must be 1 to {MAX_USERNAME} characters")
+            return None
+        client.settimeout(None)
+        return LobbyPlayer(username, client, addr, hello, leftover)
+
+    def route(self, player):
+        """Return the node of a proxied player's match if they are reconnecting to it."""
+        with self.lock:
+            now = time.monotonic()
+            for username, (node, expiry) in list(self.routes.items()):
+                if expiry is not None and expiry <= now:
+                    del self.routes[username]
+            if player.hello.get('reconnect_token') and player.username in self.routes:
+                return self.routes[player.username][0]
+        return None
+
+    def enqueue(self, player):
+        """Queue a player and place a match as soon as two are waiting, False if the name is taken."""
+        with self.lock:
+            if any(p.username == player.username for p in self.waiting):
+                return False
+            self.waiting.append(player)
+            if len(self.waiting) < 2:
+                return True
+            pair = (self.waiting.popleft(), self.waiting.popleft())
+        node = self.broker.assign([p.username for p in pair])  # Outside the lock, it talks to the nodes
+        if node is None:
+            print(f"No node could take {pair[0].username} vs {pair[1].username}")
+        else:
+            print(f"{pair[0].username} vs {pair[1].username} placed on port {node.port}")
+        for p in pair:
+            p.node = node
+            p.placed.set()
+        return True
+
+    def wait(self, player):
+        """Keep a waiting connection alive until its match is placed, False if it went away.
+
+        The lobby answers heartbeat pings itself, anything else the client
+        sends is kept and forwarded to the node if the player is proxied.
+        """
+        client = player.sock
+        buffer = b""
+        try:
+            while not player.placed.is_set():
+                readable, _, _ = select.select([client], [], [], POLL_INTERVAL)
+                if not readable:
+                    continue
+                data = client.recv(4096)
+                if not data or len(buffer) > MAX_HELLO:
+                    break
+                buffer += data
+                while b"\n" in buffer:
+                    line, buffer = buffer.split(b"\n", 1)
+                    try:
+                        message = json.loads(line.decode('utf-8'))
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        message = None
+                    if isinstance(message, dict) and message.get('type') == 'ping':
+                        client.sendall(encode_message({'type': 'pong', 't': message.get('t')}))
+                    else:
+                        player.leftover += line + b"\n"
+            else:
+                player.leftover += buffer
+                return True
+        except OSError:
+            pass  # A reset connection went away like a closed one
+        with self.lock:
+            if player in self.waiting:
+                self.waiting.remove(player)
+        return False
+
+    def redirect(self, player, node):
+        """Point the client at its node, it connects there and sends its hello again."""
+        client = player.sock
+        host = node.host or client.getsockname()[0]
+        client.sendall(encode_message({'type': 'redirect', 'host': host, 'port': node.port}))
+        # Let the client close first, so the redirect isn't lost to a reset
+        client.shutdown(socket.SHUT_WR)
+        client.settimeout(HANDSHAKE_TIMEOUT)
+        try:
+            while client.recv(4096):
+                pass
+        except OSError:
+            pass
+
+    def proxy(self, player, node):
+        """Connect to the node on the player's behalf and relay both ways until either side closes."""
+        upstream = socket.create_connection((node.host or '127.0.0.1', node.port), timeout=HANDSHAKE_TIMEOUT)
+        try:
+            upstream.settimeout(None)
+            configure_socket(upstream)
+            # Nodes started with --trusted-proxy for our address ban and log the player, not us
+            hello = dict(player.hello, peer=list(player.addr))
+            upstream.sendall(encode_message(hello) + player.leftover)
+            with self.lock:
+                self.routes[player.username] = (node, None)
+            back = threading.Thread(target=relay, args=(upstream, player.sock), daemon=True)
+            back.start()
+            relay(player.sock, upstream)
+            back.join()
+        finally:
+            upstream.close()
+            with self.lock:
+                self.routes[player.username] = (node, time.monotonic() + ROUTE_TTL)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Netwars lobby in front of several server nodes')
+    parser.add_argument('nodes', nargs='*', default=['5555-5558'],
+                       help='Game ports of the local server nodes, e.g. 5555-5558 5560 (default: 5555-5558)')
+    parser.add_argument('-p', '--port', type=int, default=5554,
+                       help='Port players connect to (default: 5554)')
+    parser.add_argument('--host', default='0.0.0.0',
+                       help='Address to listen on (default: 0.0.0.0)')
+    parser.add_argument('--mode', choices=['redirect', 'proxy'], default='redirect',
+                       help='Send clients to their node, or relay their traffic through the lobby (default: redirect)')
+    parser.add_argument('--node-host', default=None,
+                       help='Address clients are redirected to (default: the one they reached the lobby at)')
+
+    args = parser.parse_args()
+
+    lobby = Lobby(LocalBroker(parse_ports(args.nodes), args.node_host), args.host, args.port, args.mode)
+    try:
+        lobby.run()
+    except KeyboardInterrupt:
+        lobby.shutdown()
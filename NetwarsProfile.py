@@ -0,0 +1,94 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+MIN_SAMPLE_INTERVAL = 0.001  # Seconds, sampling faster mostly measures the sampler
+
+class Timings:
+    """Call counts and durations per key, e.g. per message type."""
+
+    def __init__(self):
+        self.stats = {}  # Key -> [count, total seconds, max seconds]
+        self.lock = threading.Lock()
+
+    def add(self, key, seconds):
+        with self.lock:
+            entry = self.stats.get(key)
+            if entry is None:
+                entry = self.stats[key] = [0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += seconds
+            if seconds > entry[2]:
+                entry[2] = seconds
+
+    def report(self):
+        """Return the totals as plain numbers, slowest keys first."""
+        with self.lock:
+            items = sorted(self.stats.items(), key=lambda item: item[1][1], reverse=True)
+            return {key: {
+                'count': count,
+                'total_ms': round(total * 1000, 3),
+                'mean_us': round(total / count * 1e6, 1),
+                'max_us': round(longest * 1e6, 1)
+            } for key, (count, total, longest) in items}
+
+def process_stats():
+    """Return this process's resident memory, open file descriptors and thread count.
+
+    Memory and descriptors come from /proc and are None where it doesn't exist.
+    """
+    stats = {'rss_kb': None, 'fds': None, 'threads': threading.active_count()}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    stats['rss_kb'] = int(line.split()[1])
+        stats['fds'] = len(os.listdir('/proc/self/fd'))
+    except OSError:
+        pass
+    return stats
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})"
+
+class SamplingProfiler(threading.Thread):
+    """Samples the stack of every other thread at a fixed interval.
+
+    Stacks are counted in the collapsed format ("outer;inner;leaf count" per
+    line) that flamegraph.pl, speedscope and similar tools read. Sampling only
+    costs anything while the profiler runs.
+    """
+
+    def __init__(self, seconds, interval=0.005, on_done=None):
+        super().__init__(daemon=True)
+        self.seconds = seconds
+        self.interval = interval
+        self.on_done = on_done or (lambda profiler: None)
+        self.stacks = Counter()
+        self.samples = 0
+
+    def run(self):
+        own = threading.get_ident()
+        deadline = time.monotonic() + self.seconds
+        try:
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(frame_name(frame))
+                        frame = frame.f_back
+                    self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+                time.sleep(self.interval)
+        finally:
+            self.on_done(self)  # Also when sampling failed, the owner waits for it
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
@@ -0,0 +1,236 @@
+import sys
+import json
+import zlib
+import base64
+import socket
+
+# Version of the client/server protocol, sent in the hello/welcome handshake
+PROTOCOL_VERSION = 2
+MIN_PROTOCOL_VERSION = 2  # Oldest client version the server still accepts
+
+def encode_message(message):
+    """Serialize a message as one newline-terminated UTF-8 frame."""
+    return (json.dumps(message) + "\n").encode('utf-8')
+
+def make_hello(username, reconnect_token=None, capabilities=None):
+    """Build the first message a client sends after connecting."""
+    return {
+        'type': 'hello',
+        'version': PROTOCOL_VERSION,
+        'username': username,
+        'capabilities': list(CAPABILITIES if capabilities is None else capabilities),
+        'reconnect_token': reconnect_token
+    }
+
+# Application-level heartbeat: each side pings every interval and gives up on a
+# peer it hasn't heard anything from within the timeout
+HEARTBEAT_INTERVAL = 5
+HEARTBEAT_TIMEOUT = 15
+
+# TCP keepalive, catches half-open connections even when heartbeats are disabled
+KEEPALIVE_IDLE = 10  # Seconds of silence before the first probe
+KEEPALIVE_INTERVAL = 5  # Seconds between probes
+KEEPALIVE_COUNT = 3  # Unanswered probes before the connection is dropped
+
+def configure_socket(sock, nodelay=True, keepalive=True):
+    """Apply the latency and keepalive options to a connected TCP socket."""
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(nodelay))  # Don't hold back small frames
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, int(keepalive))
+    if keepalive:
+        # Not every platform exposes the tuning knobs, the OS defaults apply there
+        for name, value in (('TCP_KEEPIDLE', KEEPALIVE_IDLE), ('TCP_KEEPINTVL', KEEPALIVE_INTERVAL),
+                            ('TCP_KEEPCNT', KEEPALIVE_COUNT)):
+            if hasattr(socket, name):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, name), value)
+
+# State sync: a match view is a dict of plain fields and board bitmasks (bit =
+# row * board size + col). Clients get a keyframe with the full view, then deltas
+# holding only what changed, masks as the XOR of old and new
+KEYFRAME_INTERVAL = 20  # A keyframe replaces the delta at least every this many changes
+MASK_FIELDS = ('fleet', 'hits_taken', 'misses_taken', 'hits', 'misses', 'revealed')
+
+def encode_state(state):
+    """Return a view ready for JSON, bitmasks as hex strings."""
+    return {k: format(v, 'x') if k in MASK_FIELDS else v for k, v in state.items()}
+
+def decode_state(state):
+    """Inverse of encode_state."""
+    return {k: int(v, 16) if k in MASK_FIELDS else v for k, v in state.items()}
+
+def diff_state(old, new):
+    """Return the encoded changes that turn view `old` into view `new`."""
+    changes = {}
+    for k, v in new.items():
+        if old.get(k) != v:
+            changes[k] = format(v ^ old.get(k, 0), 'x') if k in MASK_FIELDS else v
+    return changes
+
+def apply_delta(state, changes):
+    """Apply diff_state changes to a decoded view in place."""
+    for k, v in changes.items():
+        state[k] = state.get(k, 0) ^ int(v, 16) if k in MASK_FIELDS else v
+
+NUMBER = (int, float)
+
+def is_coord(value):
+    return (isinstance(value, list) and len(value) == 2 and
+            isinstance(value[0], int) and isinstance(value[1], int))
+
+def is_coord_list(value):
+    return isinstance(value, list) and all(is_coord(c) for c in value)
+
+def is_fleet(value):
+    return isinstance(value, list) and all(is_coord_list(ship) for ship in value)
+
+def is_lengths(value):
+    return isinstance(value, list) and all(isinstance(n, int) and n > 0 for n in value)
+
+def compile_schema(fields):
+    """Turn a {field: rule} schema into a validator function.
+
+    A rule is a type, a tuple of types, or a predicate returning True for valid
+    values. A trailing '?' on a field name makes the field optional. The returned
+    function gives None for a valid message, otherwise the reason it is invalid.
+    """
+    checks = []
+    for name, rule in fields.items():
+        optional = name.endswith('?')
+        if isinstance(rule, (type, tuple)):
+            rule = (lambda types: lambda value: isinstance(value, types))(rule)
+        checks.append((name.rstrip('?'), optional, rule))
+    checks = tuple(checks)
+
+    def validate(message):
+        for name, optional, rule in checks:
+            if name not in message:
+                if optional:
+                    continue
+                return f"missing field '{name}'"
+            if not rule(message[name]):
+                return f"invalid field '{name}'"
+        return None
+    return validate
+
+# Fields every message type must carry, in both directions
+SCHEMAS = {
+    # Client -> server
+    'ping': {'t?': NUMBER},
+    'pong': {'t?': NUMBER},
+    'placement': {'ships': is_fleet},
+    'attack': {'row': int, 'col': int, 'card': int, 'id?': int},  # id is echoed in the answer
+    'draw_card': {},
+    'reconnect': {},
+    'sync': {},
+    # Both directions, once COMPRESSION was agreed in the handshake
+    'compressed': {'data': str},
+    # Server -> client
+    'welcome': {'version': int, 'reconnect_token': str, 'resumed': bool, 'board_size': int, 'fleet': is_lengths},
+    'handshake_error': {'message': str},
+    'redirect': {'host': str, 'port': int},  # From a lobby: connect there and send the hello again
+    'match_ready': {'players': list, 'board_size': int, 'fleet': is_lengths},
+    'game_start': {'current_player': str},
+    'turn_update': {'current_player': str},
+    'new_card': {'card': int},
+    'remove_card': {'card': int},
+    'card_used': {'card': int, 'uses': int},
+    'disable_draw': {},
+    'invalid_placement': {},
+    'attack_result': {'player': str, 'coords': is_coord_list, 'hits': list, 'special_effect': str,
+                      'id?': (int, type(None))},
+    'attack_rejected': {'id': (int, type(None)), 'reason': str},
+    'message_rejected': {'request': str, 'reason': str},  # Any other refused message, e.g. over the rate limit
+    'special_effect': {'effect': str, 'player': str},
+    'game_over': {'winner': (str, type(None)), 'message': str},
+    'server_shutdown': {'message': str},
+    'reconnect_success': {'username': str},
+    'state_keyframe': {'seq': int, 'state': dict},
+    'state_delta': {'seq': int, 'base': int, 'changes': dict}
+}
+VALIDATORS = {msg_type: compile_schema(fields) for msg_type, fields in SCHEMAS.items()}
+
+class Dispatcher:
+    """Routes decoded messages to the handler registered for their type.
+
+    Each message is checked against its type's precompiled schema first, so
+    handlers can index the fields they need directly. New message types are
+    added with register(), the dispatch path itself is one dict lookup.
+    """
+
+    def __init__(self):
+        self.routes = {}
+
+    def register(self, msg_type, handler, schema=None):
+        """Route msg_type to handler, validated by schema or else by SCHEMAS."""
+        validate = compile_schema(schema) if schema is not None else VALIDATORS.get(msg_type)
+        if validate is None:
+            raise ValueError(f"no schema for message type {msg_type!r}")
+        self.routes[sys.intern(msg_type)] = (handler, validate)
+
+    def dispatch(self, message, *args):
+        """Validate message and call its handler with args + (message,).
+
+        Returns None when the message was handled, otherwise why it was rejected,
+        by the schema or by the handler returning a reason.
+        """
+        msg_type = message.get('type')
+        if not isinstance(msg_type, str):
+            return f"invalid message type {msg_type!r}"
+        route = self.routes.get(msg_type)
+        if route is None:
+            return f"unknown message type {msg_type!r}"
+        handler, validate = route
+        error = validate(message)
+        if error:
+            return f"{message['type']}: {error}"
+        return handler(*args, message)
+
+# Compression: frames of COMPRESS_THRESHOLD bytes or more are deflated with a
+# dictionary of the protocol's own keys and sent as {'type': 'compressed',
+# 'data': base64}, when that comes out smaller. Smaller frames are sent as they
+# are, compressing them would cost more time than it saves bytes. Both ends must
+# prime the same dictionary, so the capability is named after a checksum of it
+# and builds whose SCHEMAS differ never agree on compression.
+COMPRESS_THRESHOLD = 512
+COMPRESS_LEVEL = 1  # Large frames still shrink 5-10x, in a quarter of the time level 6 takes
+MAX_DECOMPRESSED = 1024 * 1024  # Largest frame a compressed message may expand to
+
+def build_zdict():
+    """Return the preset dictionary: the JSON fragments every Netwars frame is made of."""
+    fragments = []
+    for field in ('turn', 'hand', 'uses') + MASK_FIELDS:
+        fragments.append(f'"{field}": ')
+    for msg_type, fields in SCHEMAS.items():
+        fragments.append(f'{{"type": "{msg_type}"')
+        fragments.extend(f', "{name.rstrip("?")}": ' for name in fields)
+    # deflate finds matches near the end of the dictionary cheapest, the frequent types go last
+    for msg_type in ('attack_result', 'turn_update', 'state_keyframe', 'state_delta'):
+        fragments.append(f'{{"type": "{msg_type}", ')
+    return ''.join(fragments).encode('utf-8')
+
+ZDICT = build_zdict()
+COMPRESSION = f"zlib-{zlib.crc32(ZDICT):08x}"  # Capability name for compression with this ZDICT
+
+CAPABILITIES = ['redirect', COMPRESSION]  # Optional protocol features this build supports
+
+def compress_frame(frame):
+    """Return the compressed form of an encoded frame, or the frame itself where that isn't smaller."""
+    if len(frame) < COMPRESS_THRESHOLD:
+        return frame
+    deflate = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -15, zdict=ZDICT)  # Raw deflate, no header
+    data = deflate.compress(frame[:-1]) + deflate.flush()
+    compressed = b'{"type": "compressed", "data": "' + base64.b64encode(data) + b'"}\n'
+    return compressed if len(compressed) < len(frame) else frame
+
+def decompress_message(message, limit=MAX_DECOMPRESSED):
+    """Return the message inside a 'compressed' one, ValueError if it is corrupt or expands past limit."""
+    try:
+        inflate = zlib.decompressobj(-15, zdict=ZDICT)
+        frame = inflate.decompress(base64.b64decode(message['data'], validate=True), limit)
+    except (KeyError, TypeError, ValueError, zlib.error) as e:
+        raise ValueError(f"corrupt compressed message: {e}")
+    if inflate.unconsumed_tail:
+        raise ValueError(f"compressed message expands past {limit} bytes")
+    inner = json.loads(frame)
+    if not isinstance(inner, dict) or inner.get('type') == 'compressed':
+        raise ValueError("compressed message must hold one plain message")
+    return inner
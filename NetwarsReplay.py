@@ -0,0 +1,161 @@
+import json
+import time
+import socket
+import argparse
+import selectors
+import threading
+from collections import deque
+
+from NetwarsCapture import CONNECT, FRAME, DISCONNECT, read_capture
+from NetwarsProtocol import configure_socket
+
+HANGUP_DELAY = 0.1  # Seconds a captured hang-up is held back, clients usually hang up on a reply
+
+class Replay:
+    """Plays a capture's inbound traffic against a server.
+
+    Every captured connection is opened again and sends its hello and frames
+    at the recorded offsets divided by `speed` (0 sends everything as fast as
+    possible), then closes where the original did. Replies are read and
+    dropped on one selector thread. Only welcomes are decoded, so reconnect
+    tokens in later hellos can be swapped for the ones this server issued.
+
+    Frames keep their order per connection. Across connections only the
+    timing orders them, so with the capture's seed matches play out as
+    captured at real and moderate speeds, while at full speed they diverge
+    and the replay is pure load.
+    """
+
+    def __init__(self, host='127.0.0.1', port=5555, speed=1.0):
+        self.host = host
+        self.port = port
+        self.speed = speed
+        self.sockets = {}  # Captured connection ID -> socket
+        self.pending = {}  # Socket -> bytes after the last newline it sent us
+        self.names = {}  # Socket -> username it said hello with
+        self.tokens = {}  # Username -> reconnect token issued during the replay
+        self.hangups = deque()  # (deadline, connection ID) of hang-ups due, in deadline order
+        self.selector = selectors.DefaultSelector()
+        self.running = False
+        self.connects = 0
+        self.frames = 0
+        self.errors = 0  # Connections refused or reset while we still had frames for them
+        self.received = 0  # Bytes the server sent back
+        self.max_lag = 0.0  # Furthest behind schedule a record was sent, in seconds
+
+    def run(self, records):
+        """Replay records, returns the wall time it took."""
+        self.running = True
+        reader = threading.Thread(target=self.read_loop, daemon=True)
+        reader.start()
+        start = time.monotonic()
+        for t, conn_id, kind, payload in records:
+            if self.speed:
+                delay = start + t / self.speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    self.max_lag = max(self.max_lag, -delay)
+            if kind == CONNECT:
+                self.connect(conn_id, payload)
+            elif kind == FRAME:
+                self.send(conn_id, payload + b"\n")
+            elif kind == DISCONNECT:
+                self.hangups.append((time.monotonic() + HANGUP_DELAY, conn_id))
+        elapsed = time.monotonic() - start
+        for conn_id in list(self.sockets):
+            self.hangups.append((time.monotonic() + HANGUP_DELAY, conn_id))  # The capture ended before these did
+        self.running = False
+        reader.join()
+        return elapsed
+
+    def connect(self, conn_id, payload):
+        hello = json.loads(payload.decode('utf-8'))
+        if hello.get('reconnect_token'):
+            hello['reconnect_token'] = self.tokens.get(hello.get('username'))
+        try:
+            sock = socket.create_connection((self.host, self.port))
+        except OSError:
+            self.errors += 1
+            return
+        configure_socket(sock)
+        self.sockets[conn_id] = sock
+        self.pending[sock] = b""
+        self.names[sock] = hello.get('username')
+        self.selector.register(sock, selectors.EVENT_READ)
+        self.connects += 1
+        try:
+            sock.sendall((json.dumps(hello) + "\n").encode('utf-8'))
+        except OSError:
+            self.errors += 1
+            self.hang_up(conn_id)
+
+    def send(self, conn_id, data):
+        sock = self.sockets.get(conn_id)
+        if sock is None:
+            return  # Refused at connect, or already gone
+        try:
+            sock.sendall(data)
+            self.frames += 1
+        except OSError:
+            self.errors += 1
+            self.hang_up(conn_id)
+
+    def hang_up(self, conn_id):
+        """Close a connection for writing, the reader closes it once the server has too."""
+        sock = self.sockets.pop(conn_id, None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def read_loop(self):
+        while self.running or self.pending or self.hangups:
+            for key, _ in self.selector.select(0.01 if self.hangups else 0.1):
+                self.read(key.fileobj)
+            now = time.monotonic()
+            while self.hangups and self.hangups[0][0] <= now:
+                self.hang_up(self.hangups.popleft()[1])
+
+    def read(self, sock):
+        try:
+            data = sock.recv(65536)
+        except OSError:
+            data = b""
+        if not data:
+            self.selector.unregister(sock)
+            self.pending.pop(sock, None)
+            self.names.pop(sock, None)
+            sock.close()
+            return
+        self.received += len(data)
+        lines = (self.pending[sock] + data).split(b"\n")
+        self.pending[sock] = lines.pop()
+        for line in lines:
+            if b'"welcome"' in line:
+                token = json.loads(line.decode('utf-8')).get('reconnect_token')
+                if token:
+                    self.tokens[self.names[sock]] = token
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Replay a Netwars traffic capture against a server')
+    parser.add_argument('capture', help='Capture file written by NetwarsServer.py --capture')
+    parser.add_argument('--host', default='127.0.0.1',
+                       help='Server address (default: 127.0.0.1)')
+    parser.add_argument('-p', '--port', type=int, default=5555,
+                       help='Server port (default: 5555)')
+    parser.add_argument('-s', '--speed', type=float, default=1.0,
+                       help='Playback speed, e.g. 1 or 10, 0 for as fast as possible (default: 1)')
+
+    args = parser.parse_args()
+    header, records = read_capture(args.capture)
+    if header.get('seed') is not None:
+        print(f"Captured with --seed {header['seed']}, start the server with the same seed for identical matches")
+    if args.speed != 1:
+        print("Faster than real time, start the server with --no-rate-limit")
+    replay = Replay(args.host, args.port, args.speed)
+    elapsed = replay.run(records)
+    print(f"Replayed {replay.connects} connections and {replay.frames} frames in {elapsed:.1f}s "
+          f"({replay.frames / max(elapsed, 1e-9):.0f} frames/s), {replay.received} bytes back, "
+          f"{replay.errors} errors, up to {replay.max_lag * 1000:.0f} ms behind schedule")
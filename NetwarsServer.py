@@ -1,342 +1,1647 @@
 import socket
+import selectors
 import threading
 import random
 import json
-from collections import defaultdict
+import copy
+import os
+import secrets
+import cProfile
+import tracemalloc
+import itertools
+from collections import deque
 import time
 import argparse  # Added for command-line argument parsing
+from NetwarsProtocol import (PROTOCOL_VERSION, MIN_PROTOCOL_VERSION, CAPABILITIES, COMPRESSION, HEARTBEAT_INTERVAL,
+                             HEARTBEAT_TIMEOUT, KEYFRAME_INTERVAL, Dispatcher, encode_message,
+                             encode_state, diff_state, configure_socket, compress_frame, decompress_message)
+from NetwarsCards import CARDS, CARD_POOL
+from NetwarsProfile import MIN_SAMPLE_INTERVAL, Timings, SamplingProfiler, process_stats
+from NetwarsStats import STATS_FILE, StatsStore
+from NetwarsCapture import CONNECT, FRAME, DISCONNECT, CaptureWriter
 
-class GameState:
-    def __init__(self, player1, player2):
-        self.players = [player1, player2]
-        self.ships = {player1: [], player2: []}  # Stores ships for each player
-        self.hands = {player1: [], player2: []}  # Stores cards for each player
+BOARD_SIZE = 10  # Default board, matches can be configured per server, see check_settings
+FLEET = [5, 4, 3, 3, 2]  # Default ship lengths, in placement order
+MAX_BOARD_SIZE = 100
+
+PLACEMENT_TRIALS = 5  # Random fleets check_settings draws to make sure the fleet can be placed
+_placement_tables = {}  # (length, board_size) -> {bitmask: cells}
+
+def check_settings(board_size, fleet):
+    """Raise ValueError unless a board size and fleet make a playable match."""
+    if not isinstance(board_size, int) or not 2 <= board_size <= MAX_BOARD_SIZE:
+        raise ValueError(f"board size must be 2 to {MAX_BOARD_SIZE}")
+    if not fleet or not all(isinstance(length, int) and 1 <= length <= board_size for length in fleet):
+        raise ValueError(f"the fleet needs at least one ship, each 1 to {board_size} cells long")
+    if sum(fleet) > board_size * board_size // 2:
+        raise ValueError("the fleet may cover at most half of the board")
+    # Some fleets within that fit the board in theory but are too crowded to draw
+    # at random, which bots and auto-placement rely on
+    rng = random.Random(0)
+    for _ in range(PLACEMENT_TRIALS):
+        try:
+            random_fleet(rng, fleet, board_size=board_size)
+        except ValueError:
+            raise ValueError("the fleet is too crowded to place at random on this board") from None
+
+def placement_table(length, board_size=BOARD_SIZE):
+    """Return every straight placement of a ship as {bitmask: [(row, col), ...]}.
+
+    Cell (row, col) is bit row * board_size + col. Tables are built once per
+    ship length and board size, the bots and the simulator use them to
+    enumerate placements on small boards.
+    """
+    key = (length, board_size)
+    if key not in _placement_tables:
+        table = {}
+        for r in range(board_size):
+            for c in range(board_size):
+                for dr, dc in ((0, 1), (1, 0)):
+                    if r + dr * (length - 1) >= board_size or c + dc * (length - 1) >= board_size:
+                        continue
+                    cells = [(r + dr * i, c + dc * i) for i in range(length)]
+                    mask = 0
+                    for cr, cc in cells:
+                        mask |= 1 << (cr * board_size + cc)
+                    table[mask] = cells  # A 1-cell ship gets one entry, not one per orientation
+        _placement_tables[key] = table
+    return _placement_tables[key]
+
+def ship_mask(ship, board_size=BOARD_SIZE):
+    """Return the bitmask of a ship's cells, or None if a cell is off the board."""
+    mask = 0
+    for coord in ship:
+        x, y = coord
+        if not (0 <= x < board_size and 0 <= y < board_size):
+            return None
+        mask |= 1 << (x * board_size + y)
+    return mask
+
+def straight_ship_mask(ship, length, board_size=BOARD_SIZE):
+    """Return the bitmask of a ship of `length` cells in one row or column, else None."""
+    if len(ship) != length:
+        return None
+    cells = sorted(tuple(cell) for cell in ship)
+    rows = {r for r, _ in cells}
+    cols = {c for _, c in cells}
+    (r0, c0), (r1, c1) = cells[0], cells[-1]
+    if not (len(rows) == 1 and len(cols) == length and c1 - c0 == length - 1 or
+            len(cols) == 1 and len(rows) == length and r1 - r0 == length - 1):
+        return None  # Bent, gapped or repeating a cell
+    return ship_mask(cells, board_size)
+
+def validate_fleet(ships, fleet=FLEET, board_size=BOARD_SIZE):
+    """Return the bitmask of a legal fleet placement, or None if it breaks a rule."""
+    if len(ships) != len(fleet):
+        return None  # Incorrect number of ships
+    placed = 0  # Bitmask of all cells occupied by ships
+    for ship, length in zip(ships, fleet):
+        mask = straight_ship_mask(ship, length, board_size)
+        if mask is None or mask & placed:
+            return None  # Wrong length, bent, off the board or overlapping
+        placed |= mask
+    return placed
+
+def random_placement(rng, length, board_size=BOARD_SIZE):
+    """Return the cells of a uniformly random straight placement of a ship."""
+    span = board_size - length + 1  # Starting cells along the ship's direction
+    options = board_size * span
+    vertical, pick = divmod(rng.randrange(options if length == 1 else 2 * options), options)
+    r, c = divmod(pick, span)
+    if vertical:
+        return [(c + i, r) for i in range(length)]
+    return [(r, c + i) for i in range(length)]
+
+def random_fleet(rng=random, fleet=FLEET, occupied=0, board_size=BOARD_SIZE, attempts=10000):
+    """Draw a fleet uniformly among all legal fleets that avoid the `occupied` mask.
+
+    Each ship is an O(length) random placement, and the whole fleet is redrawn
+    on any overlap so every legal fleet is equally likely.
+    """
+    for _ in range(attempts):
+        placed = occupied
+        ships = []
+        for length in fleet:
+            cells = random_placement(rng, length, board_size)
+            mask = ship_mask(cells, board_size)
+            if mask & placed:
+                break
+            placed |= mask
+            ships.append([list(cell) for cell in cells])
+        else:
+            return ships
+    raise ValueError("No room left on the board for the remaining ships")
+
+def _square(radius):
+    return tuple((dr, dc) for dr in range(-radius, radius + 1) for dc in range(-radius, radius + 1))
+
+# Cells each effect hits, as (row, col) offsets from the target in row-major order
+EFFECT_SHAPES = {
+    'single': ((0, 0),),
+    'horizontal': ((0, -1), (0, 0), (0, 1)),
+    'vertical': ((-1, 0), (0, 0), (1, 0)),
+    'bombardment': _square(1),
+    'sonar': _square(2),
+    'EMP': ((0, 0),)
+}
+
+def calculate_affected_coords(row, col, effect, board_size=BOARD_SIZE):
+    """Calculate the coordinates affected by a card's effect."""
+    return [(row + dr, col + dc) for dr, dc in EFFECT_SHAPES.get(effect, ((0, 0),))
+            if 0 <= row + dr < board_size and 0 <= col + dc < board_size]
+
+def popcount(mask):
+    return bin(mask).count('1')
+
+class Player:
+    """One seat of a match: the player's fleet, hand and what they have attacked."""
+    __slots__ = ('name', 'ships', 'fleet_mask', 'hand', 'uses', 'attack_mask', 'hit_mask',
+                 'revealed_mask', 'plays', 'away', 'shared')
+
+    def __init__(self, name):
+        self.name = name
+        self.ships = ()  # Ships as placed, lists of [row, col]
+        self.fleet_mask = 0  # Bitmask of our ship cells
+        self.hand = bytearray()  # Card IDs in hand
+        self.uses = bytearray()  # Uses left of each card in hand
+        self.attack_mask = 0  # Bitmask of the cells we attacked
+        self.hit_mask = 0  # Bitmask of our ship cells that were hit
+        self.revealed_mask = 0  # Bitmask of our cells uncovered by the opponent's recon/sonar
+        self.plays = None  # Uses per card ID, allocated with the first attack
+        self.away = False  # Disconnected, waiting for them to come back
+        self.shared = False  # hand and uses are still shared with a fork
+
+    def fork(self):
+        """Return a copy that shares hand and uses with this player until either side writes."""
+        clone = Player.__new__(Player)
+        for slot in Player.__slots__:
+            setattr(clone, slot, getattr(self, slot))
+        clone.plays = list(self.plays) if self.plays else None
+        self.shared = clone.shared = True
+        return clone
+
+    def unshare(self):
+        """Take private copies of the containers still shared with a fork."""
+        if self.shared:
+            self.hand = self.hand.copy()
+            self.uses = self.uses.copy()
+            self.shared = False
+
+class Match:
+    """Rules and state of one match between two players.
+
+    Everything per player lives in a Player record, boards are bitmasks and
+    the card pool is the shared catalog, so an idle match is a handful of
+    small objects.
+    """
+    __slots__ = ('players', 'seats', 'rng', 'board_size', 'fleet', 'current_turn', 'seq', 'frozen')
+
+    def __init__(self, player1, player2, rng=None, board_size=BOARD_SIZE, fleet=FLEET):
+        self.players = (player1, player2)
+        self.seats = (Player(player1), Player(player2))
+        self.rng = rng or random  # Source of randomness, seeded for reproducible games
+        self.board_size = board_size
+        self.fleet = tuple(fleet)  # Ship lengths every player must place, in order
         self.current_turn = None  # Tracks whose turn it is
-        self.revealed_cells = defaultdict(set)  # Tracks revealed cells (for Recon/Sonar)
-        self.attacked_coords = defaultdict(set)  # Tracks all attacks made by each player
-        self.card_pool = self.init_cards()  # Initializes the pool of available cards
-        self.disconnected_players = set()  # Tracks disconnected players
-        self.last_action_time = time.time()  # Tracks the last action time for reconnection
-
-    def init_cards(self):
-        """Initialize the pool of cards with their effects."""
-        return [
-            {'name': 'Standard', 'description': 'Basic attack', 'effect': 'single'},
-            {'name': 'Vertical', 'description': '3 vertical cells', 'effect': 'vertical'},
-            {'name': 'Horizontal', 'description': '3 horizontal cells', 'effect': 'horizontal'},
-            {'name': 'Bombardment', 'description': '2x2 area', 'effect': 'bombardment'},  # Reduced area
-            {'name': 'Recon Drone', 'description': 'Reveal 3x3 area (2 uses)', 'effect': 'recon', 'uses': 2},
-            {'name': 'Sonar Ping', 'description': 'Detect in 5x5 area (1 use)', 'effect': 'sonar', 'uses': 1},
-            {'name': 'EMP', 'description': 'Disable enemy attacks for one turn (also disables your next attack)', 'effect': 'EMP'}
-        ]
-
-    def get_random_card(self):
-        """Draw a random card from the card pool."""
-        return random.choice(self.card_pool)
+        self.seq = 0  # Bumped on every change, orders the state sync messages
+        self.frozen = False  # Snapshots refuse every write
+
+    def fork(self):
+        """Return a copy-on-write clone for search and what-if evaluation.
+
+        Boards are immutable bitmasks and hands are only copied once either
+        side is about to modify them, so forking costs a few small objects no
+        matter how far the game has progressed or how large the board is.
+        """
+        clone = Match.__new__(Match)
+        for slot in Match.__slots__:
+            setattr(clone, slot, getattr(self, slot))
+        clone.seats = tuple(seat.fork() for seat in self.seats)
+        if isinstance(self.rng, random.Random):
+            clone.rng = copy.copy(self.rng)  # Same future draws, without advancing ours
+        clone.frozen = False
+        return clone
+
+    def snapshot(self):
+        """Return a read-only fork, fork() it again to get a mutable state."""
+        snapshot = self.fork()
+        snapshot.frozen = True
+        return snapshot
+
+    def _writable(self, username):
+        """Return a player's seat, ready to be modified."""
+        if self.frozen:
+            raise RuntimeError("Match snapshot is read-only")
+        seat = self.seat(username)
+        seat.unshare()
+        return seat
+
+    def seat(self, username):
+        """Return the Player record of a player of this match."""
+        first, second = self.seats
+        return first if first.name == username else second
+
+    def opponent(self, username):
+        """Return the other player of the match."""
+        return self.players[1] if self.players[0] == username else self.players[0]
+
+    def disconnected(self):
+        """Return the players who left and may still come back."""
+        return [seat.name for seat in self.seats if seat.away]
+
+    def placed(self):
+        """Whether both fleets are in place."""
+        return all(seat.ships for seat in self.seats)
 
     def validate_ships(self, username, ships):
         """Validate the ship placements for a player."""
-        required_lengths = [5, 4, 3, 3, 2]  # Required ship lengths
-        placed_coords = set()  # Tracks all coordinates occupied by ships
-
-        if len(ships) != len(required_lengths):
-            return False  # Incorrect number of ships
-
-        for i, ship in enumerate(ships):
-            if len(ship) != required_lengths[i]:
-                return False  # Ship length mismatch
-            for coord in ship:
-                x, y = coord
-                if not (0 <= x < 10 and 0 <= y < 10):
-                    return False  # Ship out of bounds
-                if tuple(coord) in placed_coords:
-                    return False  # Overlapping ships
-                placed_coords.add(tuple(coord))
+        return validate_fleet(ships, self.fleet, self.board_size) is not None
+
+    def place_ships(self, username, ships):
+        """Set a player's fleet, ships must have passed validate_ships."""
+        seat = self._writable(username)
+        seat.ships = ships
+        seat.fleet_mask = validate_fleet(ships, self.fleet, self.board_size)
+
+    def view(self, player):
+        """Return everything `player` may know about the match, boards as bitmasks."""
+        own = self.seat(player)
+        other = self.seat(self.opponent(player))
+        return {
+            'turn': self.current_turn,
+            'fleet': own.fleet_mask,  # Our ship cells, hit or not
+            'hits_taken': own.hit_mask,
+            'misses_taken': other.attack_mask & ~own.hit_mask,
+            'hits': other.hit_mask,
+            'misses': own.attack_mask & ~other.hit_mask,
+            'revealed': other.revealed_mask,  # Opponent cells uncovered by our recon and sonar
+            'hand': list(own.hand),
+            'uses': list(own.uses)
+        }
+
+    def summary(self):
+        """Return each player's shots, hits and card plays, as recorded in the stats."""
+        return {seat.name: {
+            'shots': popcount(seat.attack_mask),
+            'hits': popcount(self.seat(self.opponent(seat.name)).hit_mask),
+            'cards': {CARDS[card].name: plays for card, plays in enumerate(seat.plays or ()) if plays}
+        } for seat in self.seats}
+
+    def attack_error(self, attacker, row, col, card_id):
+        """Return why an attack isn't allowed, or None if it is."""
+        size = self.board_size
+        seat = self.seat(attacker)
+        if self.current_turn != attacker:
+            return "Not your turn"
+        if not (0 <= card_id < len(CARDS) and seat.hand.find(card_id) >= 0):
+            return "Card not in hand"
+        if not (0 <= row < size and 0 <= col < size):
+            return "Target off the board"
+        if seat.attack_mask >> (row * size + col) & 1:
+            return "Target already attacked"
+        return None
+
+    def apply_attack(self, attacker, row, col, card_id):
+        """Resolve an attack and return its outcome, or None if it isn't allowed."""
+        if self.attack_error(attacker, row, col, card_id) is not None:
+            return None
+        defender = self.opponent(attacker)
+        size = self.board_size
+        seat = self.seat(attacker)
+        slot = seat.hand.find(card_id)
+
+        # Use the card up, it leaves the hand with its last use
+        seat = self._writable(attacker)
+        target = self._writable(defender)
+        seat.uses[slot] -= 1
+        uses_left = seat.uses[slot]
+        if not uses_left:
+            del seat.hand[slot]
+            del seat.uses[slot]
+        if seat.plays is None:
+            seat.plays = [0] * len(CARDS)
+        seat.plays[card_id] += 1
+        effect = CARDS[card_id].effect
+
+        # Calculate affected coordinates based on the card's effect
+        coords = calculate_affected_coords(row, col, effect, size)
+        attacked = seat.attack_mask
+        fleet = target.fleet_mask
+        new_attacks, hits = [], []
+        footprint = 0
+        for r, c in coords:
+            bit = 1 << (r * size + c)
+            footprint |= bit
+            if not attacked & bit:
+                new_attacks.append((r, c))
+                hits.append(bool(fleet & bit))
+
+        # One bitwise update per board, however large the footprint
+        seat.attack_mask = attacked | footprint
+        target.hit_mask |= footprint & fleet
+
+        self.seq += 1
+        result = {
+            'defender': defender,
+            'card': card_id,
+            'effect': effect,
+            'uses_left': uses_left,
+            'coords': new_attacks,
+            'hits': hits,
+            'winner': None
+        }
+
+        # Check for win condition
+        if target.hit_mask == fleet:
+            result['winner'] = attacker
+            return result
+
+        # Handle special effects
+        if effect in ('recon', 'sonar'):
+            target.revealed_mask |= footprint
+
+        self.current_turn = defender
+        return result
+
+    def draw_card(self, username):
+        """Deal a card to a player and pass the turn, returns its ID or None if the hand is full."""
+        if len(self.seat(username).hand) >= 5:
+            return None  # Hand limit reached
+        seat = self._writable(username)
+        card = self.rng.choice(CARD_POOL)
+        seat.hand.append(card)
+        seat.uses.append(CARDS[card].uses)
+        self.seq += 1
+        self.current_turn = self.opponent(username)
+        return card
+
+MAX_BUFFER = 64 * 1024  # Longest unterminated frame a client may send, in bytes
+RATE_LIMITS = {  # Message type -> (messages per second, burst)
+    'placement': (0.5, 3),
+    'attack': (2, 5),  # Out of turn only, see TURN_MESSAGES
+    'draw_card': (2, 5),
+    'reconnect': (0.2, 2),
+    'sync': (1, 3)
+}
+DEFAULT_RATE_LIMIT = (5, 10)  # Shared by every other message type
+TURN_MESSAGES = ('attack', 'draw_card')  # Unlimited on the sender's turn while the game accepts them
+CONNECTION_RATE_LIMIT = (10, 20)  # All messages of a connection together
+STRIKE_LIMIT = (0.5, 20)  # Rejected messages tolerated: 20 at once, then one every 2 s
+BAN_SECONDS = 300  # How long an abusive address is refused
+
+class TokenBucket:
+    """Allow `rate` events per second on average, in bursts of up to `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def allow(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+class RateLimiter:
+    """Flood protection for one connection, O(1) per message.
+
+    A message must fit both the connection-wide bucket and its type's bucket.
+    Every rejected or malformed message is a strike, and a connection that runs
+    out of strikes is considered abusive.
+    """
+
+    def __init__(self):
+        self.total = TokenBucket(*CONNECTION_RATE_LIMIT)
+        self.by_type = {}
+        self.strikes = TokenBucket(*STRIKE_LIMIT)
+        self.abusive = False
+
+    def allow(self, msg_type):
+        if msg_type not in RATE_LIMITS:
+            msg_type = None  # Unknown types share a bucket so they can't grow the dict
+        bucket = self.by_type.get(msg_type)
+        if bucket is None:
+            bucket = self.by_type[msg_type] = TokenBucket(*RATE_LIMITS.get(msg_type, DEFAULT_RATE_LIMIT))
+        if self.total.allow() and bucket.allow():
+            return True
+        self.strike()
+        return False
+
+    def strike(self):
+        if not self.strikes.allow():
+            self.abusive = True
+
+class Unlimited:
+    """Stands in for RateLimiter when limits are off, e.g. for replays faster than real time."""
+    abusive = False
+
+    def allow(self, msg_type):
         return True
 
+    def strike(self):
+        pass
+
+HANDSHAKE_TIMEOUT = 5  # Seconds a new connection has to send its hello
+MAX_HELLO = 4096  # Longest hello message, in bytes
+MAX_USERNAME = 32
+RESERVATION_TIMEOUT = 30  # Seconds a lobby-assigned pair has to arrive before they join the normal queue
+
+class HandshakeWorker(threading.Thread):
+    """Reads the hello of every new connection on one thread, off the accept path.
+
+    Sockets are non-blocking and multiplexed with a selector, so a client that
+    connects and never speaks only costs a selector slot until its deadline.
+    Completed handshakes are handed to BattleshipServer.admit.
+    """
+
+    def __init__(self, server, timeout=HANDSHAKE_TIMEOUT):
+        super().__init__(daemon=True)
+        self.server = server
+        self.timeout = timeout
+        self.selector = selectors.DefaultSelector()
+        self.incoming = deque()  # (socket, addr) accepted but not registered yet
+        self.pending = {}  # socket -> [addr, deadline, buffer]
+        self.deadlines = deque()  # (deadline, socket), in deadline order as the timeout is fixed
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_r.setblocking(False)
+        self.wake_w.setblocking(False)
+        self.selector.register(self.wake_r, selectors.EVENT_READ)
+
+    def add(self, client, addr):
+        """Queue an accepted connection, called from the accept loop."""
+        self.incoming.append((client, addr))
+        try:
+            self.wake_w.send(b"x")
+        except BlockingIOError:
+            pass  # Already awake
+
+    def run(self):
+        while True:
+            timeout = None
+            if self.deadlines:
+                timeout = max(0, self.deadlines[0][0] - time.monotonic())
+            for key, _ in self.selector.select(timeout):
+                if key.fileobj is self.wake_r:
+                    self.register_incoming()
+                    continue
+                client = key.fileobj
+                try:
+                    self.read(client)
+                except Exception as e:
+                    # One bad handshake must not stop this thread, it admits everyone
+                    if client in self.pending:
+                        self.drop(client, f"handshake failed: {e!r}")
+                    else:
+                        print(f"Handshake failed after admission started: {e!r}")
+                        client.close()
+            self.expire()
+
+    def register_incoming(self):
+        try:
+            while self.wake_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while self.incoming:
+            client, addr = self.incoming.popleft()
+            client.setblocking(False)
+            deadline = time.monotonic() + self.timeout
+            self.pending[client] = [addr, deadline, b""]
+            self.deadlines.append((deadline, client))
+            self.selector.register(client, selectors.EVENT_READ)
+
+    def expire(self):
+        now = time.monotonic()
+        while self.deadlines and self.deadlines[0][0] <= now:
+            _, client = self.deadlines.popleft()
+            if client in self.pending:
+                self.drop(client, "handshake timed out")
+
+    def drop(self, client, reason):
+        addr = self.pending.pop(client)[0]
+        self.selector.unregister(client)
+        print(f"Rejected connection from {addr}: {reason}")
+        client.close()
+
+    def read(self, client):
+        entry = self.pending[client]
+        try:
+            data = client.recv(MAX_HELLO)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self.drop(client, str(e))
+            return
+        if not data:
+            self.drop(client, "closed during handshake")
+            return
+        entry[2] += data
+        buffer = entry[2]
+
+        if not buffer.lstrip().startswith(b"{"):
+            self.drop(client, "first message must be a hello")
+            return
+        if b"\n" not in buffer:
+            if len(buffer) > MAX_HELLO:
+                self.drop(client, "hello too long")
+            return
+        line, leftover = buffer.split(b"\n", 1)
+        try:
+            hello = json.loads(line.decode('utf-8'))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            self.drop(client, "malformed hello")
+            return
+        if not isinstance(hello, dict) or hello.get('type') != 'hello':
+            self.drop(client, "first message must be a hello")
+            return
+
+        addr = self.pending.pop(client)[0]
+        self.selector.unregister(client)
+        client.setblocking(True)
+        self.server.admit(client, addr, hello, leftover)
+
+class Connection:
+    """A player's open connection and what the server tracks about it."""
+    __slots__ = ('id', 'username', 'sock', 'addr', 'last_seen', 'rtt', 'view', 'compress')
+
+    def __init__(self, conn_id, username, sock, addr):
+        self.id = conn_id  # Unique for the server's lifetime, names the connection in captures
+        self.username = username
+        self.sock = sock
+        self.addr = addr  # (ip, port) of the client
+        self.last_seen = None  # Monotonic time we last heard from them, None once heartbeats gave up on them
+        self.rtt = None  # Last measured round-trip time in seconds
+        self.view = None  # (seq, view) of the last state sync they were sent
+        self.compress = False  # Client agreed to compressed frames in the handshake
+
 class BattleshipServer:
-    def __init__(self, host='0.0.0.0', port=5555):
+    def __init__(self, host='0.0.0.0', port=5555, nodelay=True, keepalive=True,
+                 heartbeat_interval=HEARTBEAT_INTERVAL, heartbeat_timeout=HEARTBEAT_TIMEOUT,
+                 board_size=BOARD_SIZE, fleet=FLEET):
+        check_settings(board_size, fleet)
         self.host = host
         self.port = port
+        self.board_size = board_size  # Settings of the matches formed from now on
+        self.fleet = list(fleet)
+        self.nodelay = nodelay
+        self.keepalive = keepalive
+        self.heartbeat_interval = heartbeat_interval  # 0 disables heartbeats
+        self.heartbeat_timeout = heartbeat_timeout
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # Allow quick restarts
         self.server.bind((self.host, self.port))
-        self.server.listen(2)  # Allow up to 2 players
+        self.server.listen(socket.SOMAXCONN)
 
-        self.clients = []  # Stores connected clients
-        self.usernames = []  # Stores usernames of connected players
-        self.game_state = None  # Tracks the game state
-        self.lock = threading.Lock()  # Ensures thread-safe operations
+        self.connections = {}  # Username -> Connection of every connected player
+        self.games = {}  # Username -> Match they are playing
+        self.waiting = deque()  # Usernames in the lobby waiting for an opponent
+        self.lobby_ships = {}  # Username -> (board_size, fleet, ships) placed before an opponent was found
+        self.tokens = {}  # Username -> reconnect token
+        self.lock = threading.RLock()  # Ensures thread-safe operations
         self.reconnect_timeout = 60  # Timeout for reconnection in seconds
+        self.reconnect_timers = {}  # Username -> Timer ending their match unless they reconnect
+        self.reservations = {}  # Username -> (partner, deadline) of pairs a lobby placed here, not arrived yet
+        self.held = {}  # Username -> (partner, deadline) of reserved players waiting for their partner
+        self.memory_baseline = None  # tracemalloc snapshot the memory admin command compares against
+        self.started = time.time()  # Reported to the supervisor by admin probes
+        self.banned = {}  # Address -> time until which its connections are refused
+        self.trusted_proxies = set()  # Addresses whose hellos name the player's own, e.g. a lobby in proxy mode
+        self.admin = None  # Local admin socket, see start_admin
+        self.draining = False  # No new matches, exit once the running ones are over
+        self.running = True
+        self.profile_dir = 'profiles'  # Where admin-triggered profiles are written
+        self.profiler = None  # cProfile.Profile while a cProfile run is active
+        self.sampler = None  # SamplingProfiler while a sampling run is active
+        self.timings = None  # Timings while per-message timing is enabled
+        self.stats = None  # StatsStore that finished matches are recorded in, if any
+        self.capture = None  # CaptureWriter recording inbound traffic, if any
+        self.connection_ids = itertools.count(1)
+        self.seed = None  # Seeds every match's RNG when set, so replayed captures play out the same
+        self.matches_formed = 0
+        self.rate_limit = True  # Off for benchmarks that replay traffic faster than real time
+        self.admin_commands = {
+            'ping': self.admin_ping,
+            'list': self.admin_list,
+            'inspect': self.admin_inspect,
+            'end_match': self.admin_end_match,
+            'drain': self.admin_drain,
+            'profile': self.admin_profile,
+            'timings': self.admin_timings,
+            'memory': self.admin_memory,
+            'settings': self.admin_settings,
+            'leaderboard': self.admin_leaderboard,
+            'player': self.admin_player,
+            'reserve': self.admin_reserve,
+            'capture': self.admin_capture
+        }
+        self.handshaker = HandshakeWorker(self)
+
+        # Client message handlers, each called as handler(username, msg)
+        self.dispatcher = Dispatcher()
+        self.dispatcher.register('ping', self.handle_ping)
+        self.dispatcher.register('pong', self.handle_pong)
+        self.dispatcher.register('placement', self.handle_placement)
+        self.dispatcher.register('attack', self.process_attack)
+        self.dispatcher.register('draw_card', self.handle_card_draw)
+        self.dispatcher.register('reconnect', self.handle_reconnect)
+        self.dispatcher.register('sync', self.handle_sync)
+
+    def admit(self, client, addr, hello, leftover=b""):
+        """Seat a client whose handshake completed, or turn it away."""
+        username = hello.get('username')
+        version = hello.get('version', 0)
+        token = hello.get('reconnect_token')
+
+        offered = hello.get('capabilities') or []
+        peer = hello.get('peer')
+        forwarded = (addr[0] in self.trusted_proxies and isinstance(peer, list) and len(peer) == 2
+                     and isinstance(peer[0], str) and isinstance(peer[1], int))
+        if forwarded:
+            addr = (peer[0], peer[1])  # Bans and logs apply to the player behind the proxy
+        if not isinstance(username, str) or not username or len(username) > MAX_USERNAME:
+            username = None  # Not safe to use as a key
+
+        with self.lock:
+            error = None
+            resumed = False
+            game = self.games.get(username) if username else None
+            if forwarded and self.is_banned(addr[0]):
+                error = "Too many rejected messages, try again later"  # Direct connections are refused on accept
+            elif username is None:
+                error = f"Username must be 1 to {MAX_USERNAME} characters"
+            elif not isinstance(version, int) or version < MIN_PROTOCOL_VERSION:
+                error = f"Protocol version {version} is no longer supported, please update"
+            elif not isinstance(offered, list) or not all(isinstance(c, str) for c in offered):
+                error = "Capabilities must be a list of names"
+            elif token and token == self.tokens.get(username):
+                if username in self.connections:
+                    # The client gave up on a connection we haven't noticed is dead yet
+                    self.handle_disconnect(self.connections[username].sock, username)
+                resumed = game is not None and game.seat(username).away
+            elif username in self.connections:
+                error = f"{username} is already connected"
+            elif game and game.seat(username).away:
+                error = f"{username} is reserved for a player reconnecting to a match"
+            if not error and self.draining and not resumed:
+                error = "Server is shutting down, please connect again shortly"
+
+            if error:
+                print(f"Rejected {hello.get('username')!r} from {addr}: {error}")
+                try:
+                    client.sendall(encode_message({'type': 'handshake_error', 'message': error}))
+                except OSError:
+                    pass
+                client.close()
+                return
+
+            if not resumed:
+                self.tokens[username] = secrets.token_hex(16)
+            conn = self.connections[username] = Connection(next(self.connection_ids), username, client, addr)
+            if self.capture is not None:
+                self.capture.record(conn.id, CONNECT, json.dumps(hello).encode('utf-8'))
+            print(f"{username} connected from {addr}")
+            conn.last_seen = time.monotonic()
+            self.send_to(username, {
+                'type': 'welcome',
+                'version': min(version, PROTOCOL_VERSION),
+                'capabilities': [c for c in CAPABILITIES if c in offered],
+                'reconnect_token': self.tokens[username],
+                'resumed': resumed,
+                'board_size': self.board_size,  # What the next match will be played on
+                'fleet': self.fleet
+            })
+            conn.compress = COMPRESSION in offered  # From the next frame on, the client learns it from the welcome
+
+            if resumed:
+                self.handle_reconnect(username, {})
+            else:
+                self.join_lobby(username)
+
+        threading.Thread(target=self.handle_client, args=(conn, leftover)).start()
+
+    def join_lobby(self, username):
+        """Queue a player for a match and pair them as soon as an opponent waits.
+
+        Players a lobby reserved a match for wait for their reserved partner
+        instead, see admin_reserve.
+        """
+        self.expire_reservations()
+        partner, deadline = self.reservations.pop(username, (None, None))
+        if partner is not None:
+            if partner in self.held:
+                del self.held[partner]
+                self.form_match(partner, username)
+            else:
+                self.held[username] = (partner, deadline)
+            return
+        self.waiting.append(username)
+        if len(self.waiting) < 2:
+            return
+        self.form_match(self.waiting.popleft(), self.waiting.popleft())
+
+    def expire_reservations(self):
+        """Forget reservations past their deadline, held players whose partner never came join the queue."""
+        now = time.monotonic()
+        for username, (partner, deadline) in list(self.reservations.items()):
+            if deadline <= now:
+                del self.reservations[username]
+        for username, (partner, deadline) in list(self.held.items()):
+            if deadline <= now and self.held.pop(username, None):
+                print(f"{partner} didn't arrive, {username} joins the lobby")
+                self.join_lobby(username)
+
+    def form_match(self, player1, player2):
+        """Start a match between two players, they place their ships next."""
+        rng = random.Random(f"{self.seed}:{self.matches_formed}") if self.seed is not None else None
+        self.matches_formed += 1
+        game = Match(player1, player2, rng=rng, board_size=self.board_size, fleet=self.fleet)
+        for player in game.players:
+            self.games[player] = game
+        # Let both players know the match is formed so they can place ships
+        self.broadcast({
+            'type': 'match_ready',
+            'players': game.players,
+            'board_size': game.board_size,
+            'fleet': list(game.fleet)
+        }, game.players)
+        for player in game.players:
+            board_size, fleet, ships = self.lobby_ships.pop(player, (None, None, None))
+            if (board_size, fleet) == (game.board_size, game.fleet):
+                game.place_ships(player, ships)  # Placed for these settings, the client starts over otherwise
+        if game.placed():
+            self.start_game(game)
+
+    def end_game(self, game, winner=None):
+        """Record and forget a finished match, its players stay connected."""
+        if self.stats and winner is not None:
+            self.stats.record_game(game.players, winner, game.summary())  # Only queued, written in the background
+        for player in game.players:
+            self.cancel_reconnect_timer(player)
+            if self.games.get(player) is game:
+                del self.games[player]
+            conn = self.connections.get(player)
+            if conn is None:
+                self.tokens.pop(player, None)
+            else:
+                conn.view = None
+        self.check_drained()
+
+    def drain(self):
+        """Stop matchmaking, send lobby players away and exit after the last match."""
+        if not self.draining:
+            self.draining = True
+            print(f"Draining: {len(self.games) // 2} matches left, no new ones will start")
+            self.reservations.clear()
+            leaving = list(self.waiting) + list(self.held)
+            self.waiting.clear()
+            self.held.clear()
+            for username in leaving:
+                self.send_to(username, {'type': 'server_shutdown', 'message': "Server is restarting, please reconnect"})
+                try:
+                    self.connections[username].sock.shutdown(socket.SHUT_RDWR)
+                except (KeyError, OSError):
+                    pass
+        self.check_drained()
 
-    def handle_client(self, client, username):
+    def check_drained(self):
+        if self.draining and self.running and not self.games:
+            print("Drained, shutting down")
+            self.shutdown()
+
+    def shutdown(self):
+        """Stop accepting and close every connection, run() returns."""
+        self.running = False
+        for conn in list(self.connections.values()):
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        try:
+            self.server.shutdown(socket.SHUT_RDWR)  # Wakes the accept() in run()
+        except OSError:
+            pass
+        self.server.close()
+
+    def handle_client(self, conn, leftover=b""):
         """Handle communication with a connected client."""
+        client, username, addr = conn.sock, conn.username, conn.addr
+        limiter = RateLimiter() if self.rate_limit else Unlimited()
         try:
-            buffer = ""
+            buffer = leftover  # Bytes that arrived together with the hello
+            scanned = 0  # Bytes of buffer already searched for a delimiter
             while True:
-                data = client.recv(4096).decode('utf-8')
+                # Process all complete newline-terminated messages in the buffer
+                while True:
+                    end = buffer.find(b"\n", scanned)
+                    if end == -1:
+                        scanned = len(buffer)
+                        break
+                    frame = buffer[:end]
+                    buffer = buffer[end + 1:]
+                    scanned = 0
+                    if frame.strip():
+                        capture = self.capture  # Can be stopped from the admin thread meanwhile
+                        if capture is not None:
+                            capture.record(conn.id, FRAME, frame)
+                        self.handle_frame(username, frame, limiter)
+                    if limiter.abusive:
+                        self.ban(addr, username, "too many rejected messages")
+                        return
+
+                if len(buffer) > MAX_BUFFER:
+                    self.ban(addr, username, f"over {MAX_BUFFER} bytes without a message delimiter")
+                    return
+
+                data = client.recv(4096)
                 if not data:
                     break  # Client disconnected
+                if conn.last_seen is not None:
+                    conn.last_seen = time.monotonic()
                 buffer += data
-
-                # Process all complete JSON messages in the buffer
-                while True:
-                    start = buffer.find('{')
-                    if start == -1:
-                        break  # No JSON object starts
-                    brace_count = 0
-                    end = start
-                    for i, c in enumerate(buffer[start:]):
-                        if c == '{':
-                            brace_count += 1
-                        elif c == '}':
-                            brace_count -= 1
-                            if brace_count == 0:
-                                end = start + i + 1  # Include the closing brace
-                                break
-                    if brace_count != 0:
-                        break  # Incomplete JSON object
-
-                    msg_str = buffer[start:end]
-                    buffer = buffer[end:]
-
-                    try:
-                        msg = json.loads(msg_str)
-                        with self.lock:
-                            self.process_message(username, msg)
-                    except json.JSONDecodeError as e:
-                        print(f"JSON decode error for {username}: {e}")
         except Exception as e:
             print(f"Connection error with {username}: {e}")
         finally:
             self.handle_disconnect(client, username)
 
+    def handle_frame(self, username, frame, limiter):
+        """Decode one frame and process it if the client is within its rate limits."""
+        timings = self.timings
+        if timings is not None:
+            start = time.perf_counter()
+        try:
+            msg = json.loads(frame.decode('utf-8'))
+            if timings is not None:
+                timings.add('decode', time.perf_counter() - start)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            print(f"JSON decode error for {username}: {e}")
+            limiter.strike()
+            return
+        if not isinstance(msg, dict):
+            limiter.strike()
+            return
+        if msg.get('type') == 'compressed':
+            try:
+                msg = decompress_message(msg, MAX_BUFFER)
+            except ValueError as e:
+                print(f"Rejected message from {username}: {e}")
+                limiter.strike()
+                return
+        if not isinstance(msg.get('type'), str):
+            print(f"Rejected message from {username}: invalid message type {msg.get('type')!r}")
+            limiter.strike()  # Before the limiter, which keys its buckets on the type
+            return
+        msg_type = msg['type']
+        # Legal moves are paced by the opponent's, refused ones are charged below like any other message
+        turn_move = msg_type in TURN_MESSAGES and self.is_turn(username)
+        if not turn_move and not limiter.allow(msg_type):
+            self.reject(username, msg, "Too many messages, slow down")
+            return
+        try:
+            if self.timings is None and self.profiler is None:
+                with self.lock:
+                    error = self.process_message(username, msg)
+            else:
+                error = self.process_message_instrumented(username, msg)
+        except Exception as e:
+            error = f"{msg.get('type')} handler failed: {e!r}"  # Don't let one message end the connection
+        if error:
+            print(f"Rejected message from {username}: {error}")
+            if turn_move:
+                limiter.allow(msg_type)  # Into the buckets after all, it wasn't a legal move
+            limiter.strike()
+            self.reject(username, msg, error)
+
+    def is_turn(self, username):
+        """Whether a player is in a match and it's their turn, read without the lock."""
+        game = self.games.get(username)
+        return game is not None and game.current_turn == username
+
+    def reject(self, username, msg, reason):
+        """Tell a client a message was refused, so it doesn't wait for an answer that never comes."""
+        if msg['type'] == 'attack':
+            attack_id = msg.get('id')
+            self.send_to(username, {'type': 'attack_rejected', 'id': attack_id if type(attack_id) is int else None,
+                                    'reason': reason})
+        else:
+            self.send_to(username, {'type': 'message_rejected', 'request': msg['type'], 'reason': reason})
+
+    def ban(self, addr, username, reason):
+        """Refuse new connections from a client's address for BAN_SECONDS."""
+        print(f"Dropping {username}: {reason}")
+        if addr:
+            now = time.time()
+            for ip, until in list(self.banned.items()):
+                if until <= now:
+                    del self.banned[ip]  # Don't keep every address ever banned
+            self.banned[addr[0]] = now + BAN_SECONDS
+
+    def is_banned(self, ip):
+        until = self.banned.get(ip)
+        if until is None:
+            return False
+        if until > time.time():
+            return True
+        del self.banned[ip]  # Ban expired
+        return False
+
     def process_message(self, username, msg):
-        """Process incoming messages from clients."""
-        if msg['type'] == 'placement':
-            if self.game_state.validate_ships(username, msg['ships']):
-                self.game_state.ships[username] = msg['ships']
-                if all(len(v) > 0 for v in self.game_state.ships.values()):
-                    self.start_game()  # Start the game if both players have placed ships
+        """Process an incoming message, returns None or why it was rejected."""
+        return self.dispatcher.dispatch(msg, username)
+
+    def process_message_instrumented(self, username, msg):
+        """process_message while timings or the cProfile profiler are on."""
+        start = time.perf_counter()
+        with self.lock:
+            acquired = time.perf_counter()
+            profiler, timings = self.profiler, self.timings
+            if profiler is not None:
+                error = profiler.runcall(self.process_message, username, msg)
             else:
-                self.send_to(username, {'type': 'invalid_placement'})
+                error = self.process_message(username, msg)
+            if timings is not None:
+                msg_type = msg.get('type')
+                timings.add('lock_wait', acquired - start)
+                timings.add(msg_type if msg_type in self.dispatcher.routes else 'unknown',
+                            time.perf_counter() - acquired)
+        return error
 
-        elif msg['type'] == 'attack':
-            self.process_attack(username, msg)
+    def handle_ping(self, username, msg):
+        self.send_to(username, {'type': 'pong', 't': msg.get('t')})
 
-        elif msg['type'] == 'draw_card':
-            self.handle_card_draw(username)
+    def handle_pong(self, username, msg):
+        if 't' in msg:
+            conn = self.connections.get(username)
+            if conn:
+                conn.rtt = time.monotonic() - msg['t']
 
-        elif msg['type'] == 'reconnect':
-            self.handle_reconnect(username, msg)
+    def handle_placement(self, username, msg):
+        """Store a player's ships, before or after they have been matched."""
+        game = self.games.get(username)
+        board_size, fleet = (game.board_size, game.fleet) if game else (self.board_size, self.fleet)
+        if validate_fleet(msg['ships'], fleet, board_size) is None:
+            self.send_to(username, {'type': 'invalid_placement'})
+        elif game is None:
+            self.lobby_ships[username] = (board_size, tuple(fleet), msg['ships'])  # Applied once a match is formed
+        elif game.current_turn is None:
+            game.place_ships(username, msg['ships'])
+            if game.placed():
+                self.start_game(game)  # Start the game if both players have placed ships
 
-    def start_game(self):
+    def start_game(self, game):
         """Start the game and notify both players."""
-        first_player = random.choice(self.game_state.players)
-        self.game_state.current_turn = first_player
+        first_player = game.rng.choice(game.players)
+        game.current_turn = first_player
         self.broadcast({
             'type': 'game_start',
             'current_player': first_player
-        })
+        }, game.players)
+        self.sync(game)
 
     def process_attack(self, attacker, msg):
-        """Process an attack from a player."""
-        defender = [p for p in self.game_state.players if p != attacker][0]
-        row, col = msg['row'], msg['col']
-        card = msg.get('card', {'effect': 'single'})
-
-        # Validate the attack
-        if not (self.game_state.current_turn == attacker and
-                0 <= row < 10 and 0 <= col < 10 and
-                (row, col) not in self.game_state.attacked_coords[attacker]):
-            return
+        """Process an attack from a player, returns why it was refused if it was."""
+        game = self.games.get(attacker)
+        if game is None:
+            return "No match running"
+        error = game.attack_error(attacker, msg['row'], msg['col'], msg['card'])
+        if error:
+            return error  # handle_frame answers with attack_rejected, the client undoes what it drew
+        result = game.apply_attack(attacker, msg['row'], msg['col'], msg['card'])
 
-        # Remove the used card from the attacker's hand
-        card_to_remove = None
-        for c in self.game_state.hands[attacker]:
-            if c['name'] == card['name']:
-                card_to_remove = c
-                break
-        
-        if card_to_remove:
-            self.game_state.hands[attacker].remove(card_to_remove)
+        if result['uses_left']:
+            self.send_to(attacker, {
+                'type': 'card_used',
+                'card': result['card'],
+                'uses': result['uses_left']
+            })
+        else:
             # Notify client to remove the card from their hand
             self.send_to(attacker, {
                 'type': 'remove_card',
-                'card_name': card_to_remove['name']
+                'card': result['card']
             })
 
-        # Calculate affected coordinates based on the card's effect
-        coords = self.calculate_affected_coords(row, col, card['effect'])
-        new_attacks = [(r, c) for r, c in coords 
-                      if (r, c) not in self.game_state.attacked_coords[attacker]]
-
-        # Check for hits
-        hits = []
-        for r, c in new_attacks:
-            self.game_state.attacked_coords[attacker].add((r, c))
-            hit = any([r, c] in ship for ship in self.game_state.ships[defender])
-            hits.append(hit)
-            if hit:
-                for ship in self.game_state.ships[defender][:]:
-                    if [r, c] in ship:
-                        ship.remove([r, c])
-                        if not ship:
-                            self.game_state.ships[defender].remove(ship)
-
-        # Check for win condition
-        if not self.game_state.ships[defender]:
+        if result['winner']:
+            self.sync(game)
             self.broadcast({
                 'type': 'game_over',
                 'winner': attacker,
                 'message': f"{attacker} destroyed all ships!"
-            })
+            }, game.players)
+            self.end_game(game, attacker)
             return
 
-        # Handle special effects
-        if card['effect'] == 'recon':
-            self.game_state.revealed_cells[defender].update(coords)
-        elif card['effect'] == 'sonar':
-            self.game_state.revealed_cells[defender].update(coords)
-        elif card['effect'] == 'EMP':
+        defender = result['defender']
+        if result['effect'] == 'EMP':
             self.broadcast({
                 'type': 'special_effect',
                 'effect': 'EMP',
                 'player': defender
-            })
+            }, game.players)
 
-        # Update game state and notify players
-        self.game_state.current_turn = defender
+        # Notify players
         self.broadcast({
             'type': 'attack_result',
             'player': attacker,
-            'coords': new_attacks,
-            'hits': hits,
-            'special_effect': card['effect']
-        })
+            'coords': result['coords'],
+            'hits': result['hits'],
+            'special_effect': result['effect'],
+            'id': msg.get('id')  # The attacker's, matches the result to its pending attack
+        }, game.players)
         self.broadcast({
             'type': 'turn_update',
             'current_player': defender
-        })
+        }, game.players)
+        self.sync(game)
 
-    def calculate_affected_coords(self, row, col, effect):
-        """Calculate the coordinates affected by a card's effect."""
-        if effect == 'single':
-            return [(row, col)]
-        elif effect == 'horizontal':
-            return [(row, c) for c in range(max(0, col-1), min(10, col+2))]
-        elif effect == 'vertical':
-            return [(r, col) for r in range(max(0, row-1), min(10, row+2))]
-        elif effect == 'bombardment':
-            return [(r, c) for r in range(max(0, row-1), min(10, row+2)) 
-                    for c in range(max(0, col-1), min(10, col+2))]
-        elif effect == 'sonar':
-            return [(r, c) for r in range(max(0, row-2), min(10, row+3))
-                    for c in range(max(0, col-2), min(10, col+3))]
-        elif effect == 'EMP':
-            return [(row, col)]
-        return [(row, col)]
-
-    def handle_card_draw(self, username):
-        """Handle a card draw request from a player."""
-        if len(self.game_state.hands[username]) >= 5:
-            return  # Hand limit reached
-        card = self.game_state.get_random_card()
-        self.game_state.hands[username].append(card)
+    def handle_card_draw(self, username, msg):
+        """Handle a card draw request from a player, returns why it was refused if it was."""
+        game = self.games.get(username)
+        if game is None:
+            return "No match running"
+        if game.current_turn != username:
+            return "Not your turn"
+        card = game.draw_card(username)
+        if card is None:
+            return "Hand limit reached"
         self.send_to(username, {
             'type': 'new_card',
             'card': card
         })
         # Disable further card draws for this turn
         self.send_to(username, {'type': 'disable_draw'})
-        # Switch turn to the other player
-        defender = [p for p in self.game_state.players if p != username][0]
-        self.game_state.current_turn = defender
+        # Notify both players of the turn switch
         self.broadcast({
             'type': 'turn_update',
-            'current_player': defender
-        })
+            'current_player': game.current_turn
+        }, game.players)
+        self.sync(game)
 
     def handle_reconnect(self, username, msg):
         """Handle a reconnection request from a player."""
-        if username in self.game_state.disconnected_players:
-            self.game_state.disconnected_players.remove(username)
+        game = self.games.get(username)
+        if game and game.seat(username).away:
+            game.seat(username).away = False
+            self.cancel_reconnect_timer(username)
             self.broadcast({
                 'type': 'reconnect_success',
                 'username': username
-            })
+            }, game.players)
             # Send the current game state to the reconnected player
-            self.send_to(username, {
-                'type': 'game_state_update',
-                'ships': self.game_state.ships[username],
-                'hand': self.game_state.hands[username],
-                'current_turn': self.game_state.current_turn
+            self.send_keyframe(username, game)
+
+    def sync(self, game):
+        """Send each connected player of a match what changed since their last sync."""
+        for player in game.players:
+            conn = self.connections.get(player)
+            if conn is None or game.seat(player).away:
+                continue
+            last = conn.view
+            if last is None or last[0] // KEYFRAME_INTERVAL != game.seq // KEYFRAME_INTERVAL:
+                self.send_keyframe(player, game)
+                continue
+            view = game.view(player)
+            conn.view = (game.seq, view)
+            self.send_to(player, {
+                'type': 'state_delta',
+                'seq': game.seq,
+                'base': last[0],
+                'changes': diff_state(last[1], view)
             })
 
-    def handle_disconnect(self, client, username):
+    def send_keyframe(self, username, game):
+        """Send a player the full state of their match."""
+        view = game.view(username)
+        conn = self.connections.get(username)
+        if conn:
+            conn.view = (game.seq, view)
+        self.send_to(username, {
+            'type': 'state_keyframe',
+            'seq': game.seq,
+            'state': encode_state(view)
+        })
+
+    def handle_sync(self, username, msg):
+        """A client that lost track of the state asks for a keyframe."""
+        game = self.games.get(username)
+        if game and game.current_turn is not None:
+            self.send_keyframe(username, game)
+
+    def handle_disconnect(self, client, username=None):
         """Handle a client disconnection."""
         with self.lock:
-            if client in self.clients:
-                index = self.clients.index(client)
-                self.clients.pop(index)
-                self.usernames.pop(index)
+            conn = self.connections.get(username)
+            if conn is None or conn.sock is not client:
+                # Found by socket, whoever the connection belongs to, whatever the caller knew
+                conn = next((c for c in self.connections.values() if c.sock is client), None)
+            if conn is not None:
+                username = conn.username
+                del self.connections[username]  # A reconnect gets a new Connection and starts from a keyframe
+                if self.capture is not None:
+                    self.capture.record(conn.id, DISCONNECT)
                 print(f"{username} disconnected")
                 client.close()
 
-                if username in self.game_state.players:
-                    self.game_state.disconnected_players.add(username)
+                if username in self.waiting:
+                    self.waiting.remove(username)
+                self.held.pop(username, None)
+                self.lobby_ships.pop(username, None)
+                game = self.games.get(username)
+                if game:
+                    game.seat(username).away = True
                     # Start a timer for reconnection
-                    threading.Timer(self.reconnect_timeout, self.handle_reconnect_timeout, args=[username]).start()
+                    self.cancel_reconnect_timer(username)
+                    timer = threading.Timer(self.reconnect_timeout, self.handle_reconnect_timeout, args=[username])
+                    timer.daemon = True  # Don't hold up shutdown
+                    self.reconnect_timers[username] = timer
+                    timer.start()
+                else:
+                    self.tokens.pop(username, None)
+
+    def cancel_reconnect_timer(self, username):
+        """Stop a player's reconnect timer, e.g. once they are back or the match is over."""
+        timer = self.reconnect_timers.pop(username, None)
+        if timer is not None:
+            timer.cancel()
 
     def handle_reconnect_timeout(self, username):
         """Handle the reconnection timeout for a disconnected player."""
-        if username in self.game_state.disconnected_players:
-            self.game_state.disconnected_players.remove(username)
-            self.broadcast({
-                'type': 'game_over',
-                'winner': [p for p in self.game_state.players if p != username][0],
-                'message': f"{username} disconnected. Game over!"
-            })
+        with self.lock:
+            self.reconnect_timers.pop(username, None)
+            game = self.games.get(username)
+            if game and game.seat(username).away:
+                game.seat(username).away = False
+                self.broadcast({
+                    'type': 'game_over',
+                    'winner': game.opponent(username),
+                    'message': f"{username} disconnected. Game over!"
+                }, game.players)
+                self.end_game(game, game.opponent(username))
+
+    def heartbeat_loop(self):
+        """Ping heartbeat clients and cut off the ones that went silent."""
+        while True:
+            time.sleep(self.heartbeat_interval)
+            with self.lock:
+                now = time.monotonic()
+                for username, conn in list(self.connections.items()):
+                    seen = conn.last_seen
+                    if seen is None:
+                        continue
+                    if now - seen > self.heartbeat_timeout:
+                        print(f"No heartbeat from {username} for {now - seen:.0f}s, dropping connection")
+                        conn.last_seen = None
+                        try:
+                            conn.sock.shutdown(socket.SHUT_RDWR)  # Wakes its handle_client, which disconnects it
+                        except OSError:
+                            pass
+                        continue
+                    try:
+                        self.send_to(username, {'type': 'ping', 't': now})
+                    except OSError:
+                        pass  # handle_client notices the broken connection
 
-    def broadcast(self, message):
-        """Send a message to all connected clients."""
-        json_message = json.dumps(message) + "\n"  # Add newline delimiter
-        for client in self.clients:
+    def broadcast(self, message, players=None):
+        """Send a message to the given players, or to all connected clients."""
+        frame = (json.dumps(message) + "\n").encode('utf-8')  # Add newline delimiter
+        compressed = None  # Compressed once, for the first target that takes it
+        if players is None:
+            targets = list(self.connections.values())
+        else:
+            targets = [self.connections[p] for p in players if p in self.connections]
+        for conn in targets:
+            data = frame
+            if conn.compress:
+                if compressed is None:
+                    compressed = compress_frame(frame)
+                data = compressed
             try:
-                client.send(json_message.encode('utf-8'))
-            except:
-                self.handle_disconnect(client, None)
+                conn.sock.send(data)
+            except OSError:
+                self.handle_disconnect(conn.sock, conn.username)
 
     def send_to(self, username, message):
         """Send a message to a specific player."""
-        if username in self.usernames:
-            index = self.usernames.index(username)
-            json_message = json.dumps(message) + "\n"  # Add newline delimiter
-            self.clients[index].send(json_message.encode('utf-8'))
+        conn = self.connections.get(username)
+        if conn is not None:
+            frame = (json.dumps(message) + "\n").encode('utf-8')  # Add newline delimiter
+            conn.sock.send(compress_frame(frame) if conn.compress else frame)
 
-    def run(self):
-        """Start the server and accept connections."""
-        print(f"Server listening on port {self.port}...")
-        while len(self.clients) < 2:
-            client, addr = self.server.accept()
-            username = client.recv(1024).decode('utf-8')
-            print(f"{username} connected from {addr}")
+    def start_admin(self, port):
+        """Serve newline-delimited JSON admin requests on 127.0.0.1:port."""
+        self.admin = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.admin.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.admin.bind(('127.0.0.1', port))
+        self.admin.listen(8)
+        threading.Thread(target=self.admin_loop, daemon=True).start()
+        print(f"Admin interface listening on 127.0.0.1:{port}")
+
+    def admin_loop(self):
+        """Accept admin connections for as long as the server runs."""
+        while True:
+            conn, _ = self.admin.accept()
+            # Not a daemon, so the reply to a drain still goes out when the server exits
+            threading.Thread(target=self.handle_admin, args=(conn,), daemon=False).start()
+
+    def handle_admin(self, conn):
+        """Answer admin requests on one connection until the peer closes it."""
+        with conn:
+            conn.settimeout(30)
+            buffer = ""
+            try:
+                while True:
+                    data = conn.recv(4096).decode('utf-8')
+                    if not data:
+                        break
+                    buffer += data
+                    while '\n' in buffer:
+                        line, buffer = buffer.split('\n', 1)
+                        if not line.strip():
+                            continue
+                        try:
+                            reply = self.handle_admin_command(json.loads(line))
+                        except (json.JSONDecodeError, AttributeError) as e:
+                            reply = {'ok': False, 'error': f"bad request: {e}"}
+                        conn.sendall((json.dumps(reply) + "\n").encode('utf-8'))
+            except OSError:
+                pass  # Prober went away or timed out
+
+    def handle_admin_command(self, request):
+        """Run one admin command and return the reply."""
+        handler = self.admin_commands.get(request.get('cmd'))
+        if handler is None:
+            return {'ok': False, 'error': f"unknown command: {request.get('cmd')}"}
+        return handler(request)
+
+    def admin_ping(self, request):
+        # A server stuck holding the game lock is alive but not healthy
+        if not self.lock.acquire(timeout=1):
+            return {'ok': False, 'error': 'game lock held for over 1s'}
+        try:
+            self.expire_reservations()  # Lobbies ping often, so expiry doesn't need a timer of its own
+            rtts = [conn.rtt for conn in self.connections.values() if conn.rtt is not None]
+            return {
+                'ok': True,
+                'pid': os.getpid(),
+                'port': self.port,
+                'uptime': time.time() - self.started,
+                'clients': len(self.connections),
+                'matches': len(self.games) // 2,
+                'waiting': len(self.waiting),
+                'draining': self.draining,
+                'reserved': len(self.reservations) + len(self.held),
+                'rtt_ms': round(1000 * sum(rtts) / len(rtts), 1) if rtts else None
+            }
+        finally:
+            self.lock.release()
+
+    def admin_list(self, request):
+        """List running matches and open connections."""
+        with self.lock:
+            games = {id(game): game for game in self.games.values()}
+            return {
+                'ok': True,
+                'matches': [{
+                    'players': game.players,
+                    'turn': game.current_turn,
+                    'seq': game.seq,
+                    'disconnected': game.disconnected()
+                } for game in games.values()],
+                'connections': [{
+                    'username': username,
+                    'addr': f"{conn.addr[0]}:{conn.addr[1]}" if conn.addr else None,
+                    'rtt_ms': round(1000 * conn.rtt, 1) if conn.rtt is not None else None,
+                    'in_match': username in self.games
+                } for username, conn in self.connections.items()],
+                'waiting': list(self.waiting)
+            }
+
+    def admin_inspect(self, request):
+        """Describe the match a player is in."""
+        with self.lock:
+            game = self.games.get(request.get('player'))
+            if game is None:
+                return {'ok': False, 'error': f"{request.get('player')!r} is not in a match"}
+            return {
+                'ok': True,
+                'players': game.players,
+                'turn': game.current_turn,
+                'seq': game.seq,
+                'disconnected': game.disconnected(),
+                'hands': {s.name: [CARDS[c].name for c in s.hand] for s in game.seats},
+                'uses': {s.name: list(s.uses) for s in game.seats},
+                'board_size': game.board_size,
+                'fleet': list(game.fleet),
+                'ship_cells_left': {s.name: popcount(s.fleet_mask & ~s.hit_mask) for s in game.seats},
+                'attacks': {s.name: popcount(s.attack_mask) for s in game.seats},
+                'hits': {s.name: popcount(game.seat(game.opponent(s.name)).hit_mask) for s in game.seats}
+            }
+
+    def admin_end_match(self, request):
+        """Force-end a player's match, optionally declaring a winner."""
+        with self.lock:
+            game = self.games.get(request.get('player'))
+            if game is None:
+                return {'ok': False, 'error': f"{request.get('player')!r} is not in a match"}
+            winner = request.get('winner')
+            if winner is not None and winner not in game.players:
+                return {'ok': False, 'error': f"{winner!r} doesn't play in this match"}
+            self.broadcast({
+                'type': 'game_over',
+                'winner': winner,
+                'message': request.get('reason') or "The match was ended by the server"
+            }, game.players)
+            print(f"Match {' vs '.join(game.players)} ended by admin")
+            self.end_game(game, winner)  # Without a winner the match isn't rated
+            return {'ok': True}
 
-            self.clients.append(client)
-            self.usernames.append(username)
+    def admin_profile(self, request):
+        """Profile the server for a few seconds and write the result to profile_dir.
 
-            if len(self.clients) == 2:
-                self.game_state = GameState(*self.usernames)  # Initialize game state
+        'sample' (default) samples every thread's stack and writes collapsed
+        stacks for flamegraphs. 'cprofile' profiles message handling with
+        cProfile and writes a pstats file.
+        """
+        mode = request.get('mode', 'sample')
+        seconds = request.get('seconds', 10)
+        interval = request.get('interval', 0.005)
+        if mode not in ('sample', 'cprofile') or not isinstance(seconds, (int, float)) or not 0 < seconds <= 600:
+            return {'ok': False, 'error': "mode must be 'sample' or 'cprofile', seconds 0 to 600"}
+        if (not isinstance(interval, (int, float)) or isinstance(interval, bool)
+                or not MIN_SAMPLE_INTERVAL <= interval <= seconds):
+            return {'ok': False, 'error': f"interval must be {MIN_SAMPLE_INTERVAL} to {seconds} seconds"}
+        with self.lock:
+            if self.profiler is not None or self.sampler is not None:
+                return {'ok': False, 'error': 'a profile is already running'}
+            os.makedirs(self.profile_dir, exist_ok=True)
+            stamp = time.strftime('%Y%m%d-%H%M%S')
+            path = os.path.join(self.profile_dir, f"{mode}-{self.port}-{stamp}.{'collapsed' if mode == 'sample' else 'prof'}")
+
+            if mode == 'sample':
+                def done(sampler):
+                    try:
+                        sampler.write(path)
+                        print(f"Profile written to {path} ({sampler.samples} samples)")
+                    except OSError as e:
+                        print(f"Could not write {path}: {e}")
+                    finally:
+                        self.sampler = None  # Or no profile could be started again
+                self.sampler = SamplingProfiler(seconds, interval, done)
+                self.sampler.start()
+            else:
+                def done():
+                    with self.lock:
+                        profiler, self.profiler = self.profiler, None
+                    profiler.create_stats()
+                    if not profiler.stats:
+                        print(f"No messages handled while profiling, {path} not written")
+                        return
+                    profiler.dump_stats(path)
+                    print(f"Profile written to {path}")
+                self.profiler = cProfile.Profile()
+                timer = threading.Timer(seconds, done)
+                timer.daemon = True
+                timer.start()
+        print(f"Profiling ({mode}) for {seconds}s")
+        return {'ok': True, 'path': path}
 
-            threading.Thread(target=self.handle_client, args=(client, username)).start()
+    def admin_timings(self, request):
+        """Turn per-message-type timings on or off and return what was measured.
+
+        {'enable': true} starts (and resets) them, {'enable': false} stops them,
+        without 'enable' the current figures are returned.
+        """
+        timings = self.timings
+        if request.get('enable') is True:
+            self.timings = Timings()
+        elif request.get('enable') is False:
+            self.timings = None
+        return {'ok': True, 'enabled': self.timings is not None,
+                'timings': timings.report() if timings else {}}
+
+    def admin_settings(self, request):
+        """Show or change the board size and fleet of matches formed from now on."""
+        with self.lock:
+            board_size = request.get('board_size', self.board_size)
+            fleet = request.get('fleet', self.fleet)
+            try:
+                check_settings(board_size, fleet)
+            except (TypeError, ValueError) as e:
+                return {'ok': False, 'error': str(e)}
+            if (board_size, fleet) != (self.board_size, self.fleet):
+                self.board_size, self.fleet = board_size, list(fleet)
+                print(f"New matches use a {board_size}x{board_size} board and fleet {fleet}")
+            return {'ok': True, 'board_size': self.board_size, 'fleet': self.fleet}
+
+    def admin_reserve(self, request):
+        """Hold a match for two players a lobby is sending here, see NetwarsLobby.
+
+        Whichever arrives first waits for the other rather than being paired
+        with someone else, for up to RESERVATION_TIMEOUT seconds.
+        """
+        players = request.get('players')
+        if (not isinstance(players, list) or len(players) != 2 or players[0] == players[1] or
+                not all(isinstance(p, str) and 0 < len(p) <= MAX_USERNAME for p in players)):
+            return {'ok': False, 'error': "players must be two different usernames"}
+        with self.lock:
+            if self.draining:
+                return {'ok': False, 'error': "server is draining"}
+            busy = [p for p in players if p in self.connections or p in self.games or p in self.reservations]
+            if busy:
+                return {'ok': False, 'error': f"{', '.join(busy)} already connected or reserved here"}
+            deadline = time.monotonic() + RESERVATION_TIMEOUT
+            a, b = players
+            self.reservations[a] = (b, deadline)
+            self.reservations[b] = (a, deadline)
+            return {'ok': True, 'host': self.host, 'port': self.port}
+
+    def admin_leaderboard(self, request):
+        """Return the top rated players, see NetwarsStats."""
+        if self.stats is None:
+            return {'ok': False, 'error': 'stats are disabled'}
+        limit, offset = request.get('limit', 10), request.get('offset', 0)
+        if not isinstance(limit, int) or not isinstance(offset, int) or not 0 < limit <= 100 or offset < 0:
+            return {'ok': False, 'error': 'limit must be 1 to 100, offset 0 or more'}
+        return {'ok': True, 'leaderboard': self.stats.leaderboard(limit, offset)}
+
+    def admin_player(self, request):
+        """Return a player's stats and leaderboard rank."""
+        if self.stats is None:
+            return {'ok': False, 'error': 'stats are disabled'}
+        player = request.get('player')
+        if not isinstance(player, str) or not player:
+            return {'ok': False, 'error': 'player must be a username'}
+        stats = self.stats.player(player)
+        if stats is None:
+            return {'ok': False, 'error': f"no finished matches for {player!r}"}
+        return {'ok': True, 'player': stats}
+
+    def admin_capture(self, request):
+        """Start recording inbound traffic to {'path'}, stop with {'stop': true}, see NetwarsCapture."""
+        with self.lock:
+            capture = self.capture
+            if request.get('stop'):
+                if capture is None:
+                    return {'ok': False, 'error': "not capturing"}
+                self.capture = None
+                capture.close()  # Only waits for what is already queued
+                print(f"Capture {capture.path} closed, {capture.records} records")
+                return {'ok': True, 'path': capture.path, 'records': capture.records}
+            path = request.get('path')
+            if path is None:
+                return {'ok': True, 'path': capture.path if capture else None}
+            if capture is not None:
+                return {'ok': False, 'error': f"already capturing to {capture.path}"}
+            try:
+                self.start_capture(path)
+            except (OSError, TypeError) as e:
+                return {'ok': False, 'error': f"can't capture to {path!r}: {e}"}
+            return {'ok': True, 'path': path}
+
+    def start_capture(self, path):
+        """Record every inbound frame from now on, connections already open are captured from their next frame."""
+        self.capture = CaptureWriter(path, {
+            'port': self.port,
+            'seed': self.seed,
+            'board_size': self.board_size,
+            'fleet': self.fleet,
+            'version': PROTOCOL_VERSION
+        })
+        print(f"Capturing inbound traffic to {path}")
+
+    def admin_memory(self, request):
+        """Report process resources, the size of every per-player table and heap growth.
+
+        With --trace-memory the reply also lists the allocation sites that grew
+        most since the first memory request, or since one with 'baseline': true.
+        """
+        with self.lock:
+            tables = {name: len(getattr(self, name)) for name in (
+                'connections', 'games', 'waiting', 'lobby_ships', 'tokens', 'banned', 'reconnect_timers',
+                'reservations', 'held')}
+        reply = {'ok': True, 'tables': tables, **process_stats()}
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>')
+            ])
+            if self.memory_baseline is None or request.get('baseline'):
+                self.memory_baseline = snapshot
+            top = request.get('top', 10)
+            reply['heap_kb'] = round(tracemalloc.get_traced_memory()[0] / 1024)
+            reply['growth'] = [{
+                'site': f"{stat.traceback[0].filename.rsplit('/', 1)[-1]}:{stat.traceback[0].lineno}",
+                'kb': round(stat.size_diff / 1024, 1),
+                'blocks': stat.count_diff
+            } for stat in snapshot.compare_to(self.memory_baseline, 'lineno')[:top if isinstance(top, int) else 10]]
+        return reply
+
+    def admin_drain(self, request):
+        """Finish the running matches without starting new ones, then exit."""
+        with self.lock:
+            self.drain()
+            return {'ok': True, 'matches': len(self.games) // 2}
+
+    def run(self):
+        """Start the server and accept connections."""
+        print(f"Server listening on port {self.port}...")
+        self.handshaker.start()
+        if self.heartbeat_interval:
+            threading.Thread(target=self.heartbeat_loop, daemon=True).start()
+        while self.running:
+            try:
+                client, addr = self.server.accept()
+            except OSError:
+                if not self.running:
+                    break  # Closed by shutdown()
+                raise
+            if self.is_banned(addr[0]):
+                client.close()
+                continue
+            configure_socket(client, self.nodelay, self.keepalive)
+            self.handshaker.add(client, addr)
 
 if __name__ == "__main__":
     # Set up argument parser
     parser = argparse.ArgumentParser(description='Battleship Game Server')
     parser.add_argument('-p', '--port', type=int, default=5555,
                        help='Port number to listen on (default: 5555)')
+    parser.add_argument('--bot', action='store_true',
+                       help='Keep the built-in AI opponent waiting in the lobby')
+    parser.add_argument('--admin-port', type=int, default=None,
+                       help='Serve admin requests on this local port (default: disabled)')
+    parser.add_argument('--heartbeat', type=float, default=HEARTBEAT_INTERVAL,
+                       help=f'Seconds between pings to clients, 0 to disable (default: {HEARTBEAT_INTERVAL})')
+    parser.add_argument('--heartbeat-timeout', type=float, default=HEARTBEAT_TIMEOUT,
+                       help=f'Drop clients silent for this many seconds (default: {HEARTBEAT_TIMEOUT})')
+    parser.add_argument('--no-nodelay', action='store_true',
+                       help='Leave Nagle\'s algorithm enabled on client sockets')
+    parser.add_argument('--no-keepalive', action='store_true',
+                       help='Disable TCP keepalive on client sockets')
+    parser.add_argument('--profile-dir', default='profiles',
+                       help='Directory for profiles requested over the admin socket (default: profiles)')
+    parser.add_argument('--board-size', type=int, default=BOARD_SIZE,
+                       help=f'Rows and columns of the board, up to {MAX_BOARD_SIZE} (default: {BOARD_SIZE})')
+    parser.add_argument('--fleet', default=','.join(map(str, FLEET)),
+                       help=f"Comma separated ship lengths (default: {','.join(map(str, FLEET))})")
+    parser.add_argument('--reconnect-timeout', type=float, default=60,
+                       help='Seconds a disconnected player has to return to their match (default: 60)')
+    parser.add_argument('--trace-memory', action='store_true',
+                       help='Trace allocations for the memory admin command, slows the server down')
+    parser.add_argument('--stats-db', default=STATS_FILE,
+                       help=f'SQLite database for player stats and ratings, empty to disable (default: {STATS_FILE})')
+    parser.add_argument('--capture', default=None,
+                       help='Record inbound traffic to this file for NetwarsReplay.py (default: off)')
+    parser.add_argument('--seed', default=None,
+                       help='Seed the matches\' randomness, for reproducible replays (default: random)')
+    parser.add_argument('--no-rate-limit', action='store_true',
+                       help='Disable per-connection rate limits, for replays faster than real time')
+    parser.add_argument('--trusted-proxy', action='append', default=[],
+                       help='Address of a lobby in proxy mode, trusted to name its players\' addresses; '
+                            'repeat for several (default: none)')
     
     args = parser.parse_args()
+    if args.trace_memory:
+        tracemalloc.start()
+    try:
+        fleet = [int(length) for length in args.fleet.split(',')]
+        check_settings(args.board_size, fleet)
+    except ValueError as e:
+        parser.error(f"invalid board settings: {e}")
     
     # Start the server with the specified port
-    server = BattleshipServer(port=args.port)
-    server.run()
\ No newline at end of file
+    server = BattleshipServer(port=args.port, nodelay=not args.no_nodelay, keepalive=not args.no_keepalive,
+                              heartbeat_interval=args.heartbeat, heartbeat_timeout=args.heartbeat_timeout,
+                              board_size=args.board_size, fleet=fleet)
+    server.profile_dir = args.profile_dir
+    server.reconnect_timeout = args.reconnect_timeout
+    server.seed = args.seed
+    server.rate_limit = not args.no_rate_limit
+    server.trusted_proxies = set(args.trusted_proxy)
+    if args.capture:
+        server.start_capture(args.capture)
+    if args.stats_db:
+        server.stats = StatsStore(args.stats_db)
+    if args.admin_port:
+        server.start_admin(args.admin_port)
+    if args.bot:
+        from NetwarsBot import BotClient  # Needs NumPy, only imported when requested
+
+        def keep_bot_seated():
+            # A bot plays one match, then a fresh one takes its place in the lobby
+            while not server.draining:
+                bot = BotClient('127.0.0.1', args.port)
+                bot.start()
+                bot.join()
+                time.sleep(1)
+
+        threading.Thread(target=keep_bot_seated, daemon=True).start()
+    server.run()
+    if server.stats:
+        server.stats.close()  # Write the results still queued
+    if server.capture:
+        server.capture.close()
@@ -0,0 +1,210 @@
+import time
+import argparse
+import numpy as np
+
+from NetwarsServer import BOARD_SIZE, FLEET
+from NetwarsCards import CARDS
+from NetwarsBot import placement_matrix, effect_footprints
+
+CELLS = BOARD_SIZE * BOARD_SIZE
+
+# Each card's uses and footprint from the server's geometry
+USES = np.array([card.uses for card in CARDS], dtype=np.int8)
+_footprints = effect_footprints()
+FOOTPRINTS = np.array([_footprints[card.effect] > 0 for card in CARDS])  # (card, target, cell)
+_placements, _lengths, _ = placement_matrix()
+PLACEMENTS = _placements > 0
+
+def random_fleets(count, rng):
+    """Place a full fleet on each of `count` boards, one board per row.
+
+    Like NetwarsServer.random_fleet, a board whose ships overlap is redrawn
+    from scratch so every legal fleet is equally likely.
+    """
+    boards = np.zeros((count, CELLS), dtype=bool)
+    pending = np.arange(count)
+    while len(pending):
+        board = np.zeros((len(pending), CELLS), dtype=bool)
+        clash = np.zeros(len(pending), dtype=bool)
+        for length in FLEET:
+            candidates = np.flatnonzero(_lengths == length)
+            cells = PLACEMENTS[candidates[rng.integers(0, len(candidates), len(pending))]]
+            clash |= (board & cells).any(axis=1)
+            board |= cells
+        boards[pending[~clash]] = board[~clash]
+        pending = pending[clash]  # Retry only the boards that overlapped
+    return boards
+
+def neighbours(cells):
+    """Return the cells orthogonally adjacent to any cell set in each row."""
+    grid = cells.reshape(-1, BOARD_SIZE, BOARD_SIZE)
+    near = np.zeros_like(grid)
+    near[:, 1:, :] |= grid[:, :-1, :]
+    near[:, :-1, :] |= grid[:, 1:, :]
+    near[:, :, 1:] |= grid[:, :, :-1]
+    near[:, :, :-1] |= grid[:, :, 1:]
+    return near.reshape(-1, CELLS)
+
+def simulate(games, rng, card_probs=None, targeting='hunt', max_turns=500):
+    """Play `games` games in lockstep and return their raw statistics.
+
+    Every array has one row per game, and ships/attacks keep one board plane per
+    player. Players follow the server rules: a draw or an attack ends the turn,
+    attacks must target an unattacked cell, and a player wins as soon as every
+    cell of the opponent's fleet has been hit. Simulated players draw when their
+    hand is empty, otherwise they play a random card from their hand. A card with
+    several uses counts once per use left, both in the hand and when picking.
+    """
+    n_cards = len(CARDS)
+    ships = np.stack([random_fleets(games, rng), random_fleets(games, rng)], axis=1)
+    attacked = np.zeros((games, 2, CELLS), dtype=bool)  # Cells each player has attacked
+    remaining = np.full((games, 2), sum(FLEET), dtype=np.int16)  # Unhit ship cells per fleet
+    hands = np.zeros((games, 2, n_cards), dtype=np.int8)
+    plays = np.zeros((games, 2, n_cards), dtype=np.int16)
+    first = rng.integers(0, 2, games)  # Random first player, like start_game
+    turn = first.copy()
+    winner = np.full(games, -1, dtype=np.int8)
+    length = np.zeros(games, dtype=np.int32)
+    draws = np.zeros(n_cards, dtype=np.int64)
+    cells = np.zeros(n_cards, dtype=np.int64)
+    hits = np.zeros(n_cards, dtype=np.int64)
+
+    active = np.arange(games)
+    for _ in range(max_turns):
+        if not len(active):
+            break
+        player = turn[active]
+        drawing = hands[active, player].sum(axis=1) == 0
+
+        # Draws
+        d = active[drawing]
+        if len(d):
+            card = rng.choice(n_cards, size=len(d), p=card_probs)
+            hands[d, turn[d], card] += USES[card]
+            np.add.at(draws, card, 1)
+
+        # Attacks
+        a = active[~drawing]
+        if len(a):
+            pa = turn[a]
+            oa = 1 - pa
+            cumulative = hands[a, pa].cumsum(axis=1)
+            pick = rng.random(len(a)) * cumulative[:, -1]
+            card = (cumulative > pick[:, None]).argmax(axis=1)
+            hands[a, pa, card] -= 1
+            plays[a, pa, card] += 1
+
+            seen = attacked[a, pa]
+            score = rng.random((len(a), CELLS))
+            if targeting == 'hunt':
+                score += neighbours(seen & ships[a, oa])
+            score[seen] = -1
+            target = score.argmax(axis=1)
+
+            new = FOOTPRINTS[card, target] & ~seen
+            hit = new & ships[a, oa]
+            attacked[a, pa] = seen | new
+            hit_count = hit.sum(axis=1)
+            remaining[a, oa] -= hit_count
+            np.add.at(cells, card, new.sum(axis=1))
+            np.add.at(hits, card, hit_count)
+
+            won = remaining[a, oa] == 0
+            winner[a[won]] = pa[won]
+
+        length[active] += 1
+        turn[active] = 1 - turn[active]
+        active = active[winner[active] < 0]
+
+    finished = winner >= 0
+    rows = np.flatnonzero(finished)
+    return {
+        'games': games,
+        'finished': int(finished.sum()),
+        'first_wins': int((winner[finished] == first[finished]).sum()),
+        'lengths': length[finished],
+        'draws': draws,
+        'plays': plays[finished].sum(axis=(0, 1)),
+        'winner_plays': plays[rows, winner[rows]].sum(axis=0),
+        'cells': cells,
+        'hits': hits
+    }
+
+def run(games, batch, seed, card_probs=None, targeting='hunt'):
+    """Simulate `games` games in batches and merge their statistics."""
+    rng = np.random.default_rng(seed)
+    total = None
+    done = 0
+    while done < games:
+        stats = simulate(min(batch, games - done), rng, card_probs, targeting)
+        if total is None:
+            total = stats
+        else:
+            for key, value in stats.items():
+                if key == 'lengths':
+                    total[key] = np.concatenate([total[key], value])
+                else:
+                    total[key] = total[key] + value
+        done += stats['games']
+    return total
+
+def print_report(stats, elapsed):
+    """Print win rates, game lengths and per-card impact."""
+    lengths = stats['lengths']
+    finished = max(stats['finished'], 1)
+    print(f"{stats['games']} games in {elapsed:.1f}s ({stats['games'] / elapsed:.0f} games/s), "
+          f"{stats['games'] - stats['finished']} hit the turn limit")
+    print(f"First player win rate: {stats['first_wins'] / finished:.3f}")
+    print(f"Game length (turns): mean {lengths.mean():.1f}, median {np.median(lengths):.0f}, "
+          f"p10 {np.percentile(lengths, 10):.0f}, p90 {np.percentile(lengths, 90):.0f}")
+
+    counts, edges = np.histogram(lengths, bins=10)
+    for count, low, high in zip(counts, edges[:-1], edges[1:]):
+        bar = '#' * int(50 * count / max(counts.max(), 1))
+        print(f"  {low:5.0f}-{high:5.0f} {count:9d} {bar}")
+
+    total_hits = max(stats['hits'].sum(), 1)
+    print(f"{'Card':<12} {'draws':>10} {'plays':>10} {'cells/play':>10} "
+          f"{'hits/play':>10} {'hit share':>10} {'winner %':>10}")
+    for i, card in enumerate(CARDS):
+        plays = max(stats['plays'][i], 1)
+        print(f"{card.name:<12} {stats['draws'][i]:>10} {stats['plays'][i]:>10} "
+              f"{stats['cells'][i] / plays:>10.2f} {stats['hits'][i] / plays:>10.2f} "
+              f"{stats['hits'][i] / total_hits:>10.3f} {stats['winner_plays'][i] / plays:>10.3f}")
+
+def sweep(base, games, batch, seed, targeting):
+    """Remove each card from the pool in turn and compare against the full pool."""
+    base_length = base['lengths'].mean()
+    base_first = base['first_wins'] / max(base['finished'], 1)
+    print(f"{'Without':<12} {'mean length':>12} {'delta':>8} {'first win':>10} {'delta':>8}")
+    print(f"{'(full pool)':<12} {base_length:>12.1f} {0:>8.1f} {base_first:>10.3f} {0:>8.3f}")
+    for i, card in enumerate(CARDS):
+        probs = np.ones(len(CARDS))
+        probs[i] = 0
+        stats = run(games, batch, seed, probs / probs.sum(), targeting)
+        length = stats['lengths'].mean()
+        first = stats['first_wins'] / max(stats['finished'], 1)
+        print(f"{card.name:<12} {length:>12.1f} {length - base_length:>+8.1f} "
+              f"{first:>10.3f} {first - base_first:>+8.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Netwars card balance simulator')
+    parser.add_argument('-n', '--games', type=int, default=100000,
+                       help='Number of games to simulate (default: 100000)')
+    parser.add_argument('--batch', type=int, default=50000,
+                       help='Games simulated together in one array batch (default: 50000)')
+    parser.add_argument('--seed', type=int, default=0,
+                       help='Random seed (default: 0)')
+    parser.add_argument('--targeting', choices=['random', 'hunt'], default='hunt',
+                       help='Target selection of the simulated players (default: hunt)')
+    parser.add_argument('--sweep', action='store_true',
+                       help='Also rerun the simulation once without each card')
+
+    args = parser.parse_args()
+
+    start = time.time()
+    stats = run(args.games, args.batch, args.seed, targeting=args.targeting)
+    print_report(stats, time.time() - start)
+    if args.sweep:
+        print()
+        sweep(stats, args.games, args.batch, args.seed, args.targeting)
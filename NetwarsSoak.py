@@ -0,0 +1,199 @@
+import sys
+import time
+import socket
+import random
+import argparse
+import threading
+import subprocess
+
+from NetwarsBot import BotClient, STRATEGIES
+from NetwarsSupervisor import SERVER_SCRIPT, admin_port_for, admin_request
+
+MATCH_TIMEOUT = 600  # A match still running after this long is cut off and counted as stuck
+SETTLE_TIMEOUT = 60  # Longest the server may take to drop all state once the bots have left
+THREAD_SLACK = 2  # Threads and descriptors the server may hold beyond the baseline
+FD_SLACK = 4
+
+class Soak:
+    """Plays bot matches against a local server and watches it for leaks.
+
+    The server runs in its own process with allocation tracing on. A warm-up
+    round of matches loads every code path, then the server is left to settle
+    and a baseline is taken. After the soak it is left to settle again and
+    compared with the baseline: every per-player table must be empty again,
+    threads and descriptors back to the baseline, and heap and RSS within the
+    allowed growth. Some bots hang up mid-match so reconnect timers and
+    abandoned matches get exercised too.
+    """
+
+    def __init__(self, port, pairs=4, drop_rate=0.2, think_time=0.2, interval=30):
+        self.port = port
+        self.admin_port = admin_port_for(port)
+        self.pairs = pairs
+        self.drop_rate = drop_rate
+        self.think_time = think_time
+        self.interval = interval
+        self.rng = random.Random()
+        self.server = None
+        self.playing = threading.Event()  # Cleared to let the running matches finish
+        self.lock = threading.Lock()
+        self.matches = 0
+        self.dropped = 0
+        self.stuck = 0
+
+    def start_server(self, reconnect_timeout):
+        self.server = subprocess.Popen([
+            sys.executable, SERVER_SCRIPT, '-p', str(self.port), '--admin-port', str(self.admin_port),
+            '--trace-memory', '--stats-db', '', '--reconnect-timeout', str(reconnect_timeout)
+        ], stdout=subprocess.DEVNULL)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                return self.sample()
+            except OSError:
+                time.sleep(0.5)
+        raise RuntimeError("server didn't come up")
+
+    def sample(self, baseline=False):
+        """Return the server's memory report."""
+        return admin_request(self.admin_port, {'cmd': 'memory', 'baseline': baseline, 'top': 5}, timeout=60)
+
+    def play_match(self, slot, number):
+        """Play one match between two bots, maybe hanging one up halfway."""
+        strategies = sorted(STRATEGIES)
+        bots = [BotClient('127.0.0.1', self.port, f"soak{slot}-{number}{side}",
+                          random.Random(self.rng.random()), self.rng.choice(strategies), self.think_time)
+                for side in 'ab']
+        for bot in bots:
+            bot.start()
+        if self.rng.random() < self.drop_rate:
+            time.sleep(self.rng.uniform(1, 10))
+            try:
+                bots[0].client.shutdown(socket.SHUT_RDWR)  # The server sees a dead connection
+                with self.lock:
+                    self.dropped += 1
+            except (AttributeError, OSError):
+                pass  # Not connected yet or already done
+        deadline = time.monotonic() + MATCH_TIMEOUT
+        for bot in bots:
+            bot.join(max(0, deadline - time.monotonic()))
+        with self.lock:
+            self.matches += 1
+            if any(bot.is_alive() for bot in bots):
+                self.stuck += 1
+                for bot in bots:
+                    try:
+                        bot.client.shutdown(socket.SHUT_RDWR)
+                    except (AttributeError, OSError):
+                        pass
+
+    def play_loop(self, slot):
+        number = 0
+        while self.playing.is_set():
+            self.play_match(slot, number)
+            number += 1
+
+    def play(self, seconds):
+        """Keep `pairs` matches running for `seconds`, then let them finish."""
+        self.playing.set()
+        threads = [threading.Thread(target=self.play_loop, args=(slot,), daemon=True) for slot in range(self.pairs)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            time.sleep(min(self.interval, max(0, deadline - time.monotonic())))
+            self.report(self.sample())
+        self.playing.clear()
+        for thread in threads:
+            thread.join()
+
+    def settle(self, baseline=False):
+        """Wait for the server to forget every player, then return its report.
+
+        With baseline the server's heap snapshot is reset, later reports list
+        the growth since this one.
+        """
+        deadline = time.monotonic() + SETTLE_TIMEOUT
+        report = self.sample()
+        while any(report['tables'].values()) and time.monotonic() < deadline:
+            time.sleep(1)
+            report = self.sample()
+        time.sleep(1)  # Let finished connection threads exit
+        return self.sample(baseline)
+
+    def report(self, sample):
+        if self.server.poll() is not None:
+            raise RuntimeError(f"server exited with code {self.server.returncode}")
+        busy = {name: size for name, size in sample['tables'].items() if size}
+        print(f"[{time.strftime('%H:%M:%S')}] matches {self.matches} (dropped {self.dropped}, stuck {self.stuck}) "
+              f"heap {sample.get('heap_kb')} KiB, rss {sample['rss_kb']} KiB, fds {sample['fds']}, "
+              f"threads {sample['threads']}, {busy or 'no players'}")
+
+    def stop(self):
+        if self.server and self.server.poll() is None:
+            self.server.terminate()
+            self.server.wait()
+
+def check(baseline, final, max_heap_kb, max_rss_kb):
+    """Return the problems found comparing the final settled report with the baseline."""
+    problems = []
+    for name, size in final['tables'].items():
+        if size:
+            problems.append(f"{name} still holds {size} entries with no players left")
+    if final['threads'] > baseline['threads'] + THREAD_SLACK:
+        problems.append(f"threads grew from {baseline['threads']} to {final['threads']}")
+    if baseline['fds'] is not None and final['fds'] > baseline['fds'] + FD_SLACK:
+        problems.append(f"open descriptors grew from {baseline['fds']} to {final['fds']}")
+    if final['heap_kb'] - baseline['heap_kb'] > max_heap_kb:
+        problems.append(f"heap grew by {final['heap_kb'] - baseline['heap_kb']} KiB")
+    if baseline['rss_kb'] is not None and final['rss_kb'] - baseline['rss_kb'] > max_rss_kb:
+        problems.append(f"RSS grew by {final['rss_kb'] - baseline['rss_kb']} KiB")
+    return problems
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Netwars server soak test')
+    parser.add_argument('-d', '--duration', type=float, default=3600,
+                       help='Seconds of matches after the warm-up (default: 3600)')
+    parser.add_argument('--warmup', type=float, default=120,
+                       help='Seconds of matches before the baseline is taken (default: 120)')
+    parser.add_argument('-p', '--port', type=int, default=5600,
+                       help='Port of the server under test (default: 5600)')
+    parser.add_argument('--pairs', type=int, default=4,
+                       help='Matches played at the same time (default: 4)')
+    parser.add_argument('--drop-rate', type=float, default=0.2,
+                       help='Share of matches where a bot hangs up halfway (default: 0.2)')
+    parser.add_argument('--think-time', type=float, default=0.2,
+                       help='Seconds each bot waits before a move (default: 0.2)')
+    parser.add_argument('--interval', type=float, default=30,
+                       help='Seconds between progress reports (default: 30)')
+    parser.add_argument('--max-heap-growth', type=float, default=1024,
+                       help='Allowed heap growth in KiB (default: 1024)')
+    parser.add_argument('--max-rss-growth', type=float, default=8192,
+                       help='Allowed RSS growth in KiB (default: 8192)')
+
+    args = parser.parse_args()
+    soak = Soak(args.port, args.pairs, args.drop_rate, args.think_time, args.interval)
+    try:
+        soak.start_server(reconnect_timeout=5)
+        print(f"Warming up for {args.warmup:.0f}s")
+        soak.play(args.warmup)
+        baseline = soak.settle(baseline=True)
+        soak.report(baseline)
+        print(f"Soaking for {args.duration:.0f}s")
+        soak.play(args.duration)
+        final = soak.settle()
+        soak.report(final)
+    finally:
+        soak.stop()
+
+    print("Largest allocation growth since the baseline:")
+    for site in final.get('growth', []):
+        print(f"  {site['site']:<40} {site['kb']:>+10.1f} KiB {site['blocks']:>+8} blocks")
+    problems = check(baseline, final, args.max_heap_growth, args.max_rss_growth)
+    if soak.stuck:
+        problems.append(f"{soak.stuck} matches didn't finish within {MATCH_TIMEOUT}s")
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    if problems:
+        sys.exit(1)
+    print(f"OK: {soak.matches} matches, no growth beyond the limits")
@@ -0,0 +1,217 @@
+import time
+import queue
+import sqlite3
+import argparse
+import threading
+
+STATS_FILE = 'netwars_stats.db'
+ELO_START = 1500
+ELO_K = 16
+BATCH_SIZE = 100  # Most results written in one transaction
+FLUSH_INTERVAL = 1.0  # Seconds the writer waits to fill a batch
+CACHE_TTL = 5.0  # Seconds a leaderboard or player lookup is served from memory
+CACHE_SIZE = 1000  # Most lookups kept in memory between commits
+
+def expected_score(rating, opponent):
+    """Return the Elo expected score of a player against an opponent."""
+    return 1 / (1 + 10 ** ((opponent - rating) / 400))
+
+def elo_update(rating_a, rating_b, score, k=ELO_K):
+    """Return both new ratings after a game, score is 1, 0.5 or 0 from a's side."""
+    delta = k * (score - expected_score(rating_a, rating_b))
+    return rating_a + delta, rating_b - delta
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    username TEXT PRIMARY KEY,
+    rating REAL NOT NULL DEFAULT {start},
+    wins INTEGER NOT NULL DEFAULT 0,
+    losses INTEGER NOT NULL DEFAULT 0,
+    shots INTEGER NOT NULL DEFAULT 0,
+    hits INTEGER NOT NULL DEFAULT 0,
+    updated REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS players_rating ON players (rating DESC);
+CREATE TABLE IF NOT EXISTS card_plays (
+    username TEXT NOT NULL,
+    card TEXT NOT NULL,
+    plays INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (username, card)
+);
+""".format(start=ELO_START)
+
+def connect(path):
+    conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")  # Readers never wait for the writer
+    conn.execute("PRAGMA synchronous=NORMAL")  # WAL stays consistent, fsync only at checkpoints
+    return conn
+
+class StatsStore:
+    """Player results, Elo ratings and card usage in a SQLite database.
+
+    record_game() only queues the result, a writer thread commits queued results
+    in batches so the match thread never waits on the disk. Leaderboard and
+    player lookups go through a small cache that every committed batch clears
+    and that holds at most cache_size lookups.
+    Several server processes can share one database file.
+    """
+
+    def __init__(self, path=STATS_FILE, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 cache_ttl=CACHE_TTL, cache_size=CACHE_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.queue = queue.Queue()
+        self.cache = {}  # Query key -> (time, result), oldest first
+        self.cache_lock = threading.Lock()
+        self.writer = connect(path)
+        self.writer.executescript(SCHEMA)
+        self.reader = connect(path)
+        self.read_lock = threading.Lock()  # One query at a time on the read connection
+        self.thread = threading.Thread(target=self.write_loop, daemon=True)
+        self.thread.start()
+
+    def record_game(self, players, winner, summary):
+        """Queue a finished match, summary maps player -> {'shots', 'hits', 'cards'}."""
+        self.queue.put((list(players), winner, summary, time.time()))
+
+    def write_loop(self):
+        """Commit queued results in batches until close() is called."""
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            results = [result for result in batch if result is not None]
+            if results:
+                try:
+                    self.write_batch(results)
+                except sqlite3.Error as e:
+                    print(f"Couldn't record {len(results)} results in {self.path}: {e}")
+            if stop:
+                return
+
+    def write_batch(self, results):
+        with self.writer:  # One transaction per batch
+            for players, winner, summary, finished in results:
+                for player in players:
+                    self.writer.execute("INSERT OR IGNORE INTO players (username) VALUES (?)", (player,))
+                a, b = players
+                (rating_a,), (rating_b,) = (
+                    self.writer.execute("SELECT rating FROM players WHERE username = ?", (p,)).fetchone()
+                    for p in players)
+                rating_a, rating_b = elo_update(rating_a, rating_b, float(winner == a))
+                for player, rating in ((a, rating_a), (b, rating_b)):
+                    stats = summary.get(player, {})
+                    self.writer.execute(
+                        "UPDATE players SET rating = ?, wins = wins + ?, losses = losses + ?, "
+                        "shots = shots + ?, hits = hits + ?, updated = ? WHERE username = ?",
+                        (rating, int(winner == player), int(winner != player),
+                         stats.get('shots', 0), stats.get('hits', 0), finished, player))
+                    self.writer.executemany(
+                        "INSERT INTO card_plays (username, card, plays) VALUES (?, ?, ?) "
+                        "ON CONFLICT (username, card) DO UPDATE SET plays = plays + excluded.plays",
+                        [(player, card, plays) for card, plays in stats.get('cards', {}).items() if plays])
+        with self.cache_lock:
+            self.cache.clear()
+
+    def cached(self, key, query):
+        """Return a recent result for key, or run query() and remember it."""
+        now = time.monotonic()
+        with self.cache_lock:
+            entry = self.cache.get(key)
+            if entry and now - entry[0] < self.cache_ttl:
+                return entry[1]
+        with self.read_lock:
+            result = query()
+        with self.cache_lock:
+            self.cache.pop(key, None)
+            if len(self.cache) >= self.cache_size:
+                # Drop what expired, or the oldest lookup if nothing did
+                expired = [k for k, (t, _) in self.cache.items() if now - t >= self.cache_ttl]
+                for k in expired or [next(iter(self.cache))]:
+                    del self.cache[k]
+            self.cache[key] = (now, result)
+        return result
+
+    def leaderboard(self, limit=10, offset=0):
+        """Return the top players by rating, best first."""
+        def query():
+            rows = self.reader.execute(
+                "SELECT username, rating, wins, losses, shots, hits FROM players "
+                "ORDER BY rating DESC LIMIT ? OFFSET ?", (limit, offset)).fetchall()
+            return [{
+                'rank': offset + i + 1,
+                'username': username,
+                'rating': round(rating),
+                'wins': wins,
+                'losses': losses,
+                'accuracy': round(hits / shots, 3) if shots else None
+            } for i, (username, rating, wins, losses, shots, hits) in enumerate(rows)]
+        return self.cached(('leaderboard', limit, offset), query)
+
+    def player(self, username):
+        """Return a player's stats and rank, or None if they never finished a match."""
+        def query():
+            row = self.reader.execute(
+                "SELECT rating, wins, losses, shots, hits FROM players WHERE username = ?",
+                (username,)).fetchone()
+            if row is None:
+                return None
+            rating, wins, losses, shots, hits = row
+            # Counted on the rating index
+            above, = self.reader.execute("SELECT COUNT(*) FROM players WHERE rating > ?", (rating,)).fetchone()
+            cards = dict(self.reader.execute(
+                "SELECT card, plays FROM card_plays WHERE username = ? ORDER BY plays DESC",
+                (username,)).fetchall())
+            return {
+                'username': username,
+                'rank': above + 1,
+                'rating': round(rating),
+                'wins': wins,
+                'losses': losses,
+                'shots': shots,
+                'hits': hits,
+                'accuracy': round(hits / shots, 3) if shots else None,
+                'cards': cards
+            }
+        return self.cached(('player', username), query)
+
+    def close(self):
+        """Write everything still queued and close the database."""
+        self.queue.put(None)
+        self.thread.join()
+        self.writer.close()
+        self.reader.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Netwars leaderboard')
+    parser.add_argument('player', nargs='?', default=None,
+                       help='Show one player\'s stats instead of the leaderboard')
+    parser.add_argument('--db', default=STATS_FILE,
+                       help=f'Stats database (default: {STATS_FILE})')
+    parser.add_argument('-n', '--top', type=int, default=20,
+                       help='Leaderboard entries to show (default: 20)')
+
+    args = parser.parse_args()
+    store = StatsStore(args.db)
+    if args.player:
+        stats = store.player(args.player)
+        if stats is None:
+            print(f"No finished matches for {args.player}")
+        else:
+            for key, value in stats.items():
+                print(f"{key:<10} {value}")
+    else:
+        print(f"{'#':>4} {'Player':<20} {'Elo':>6} {'W':>5} {'L':>5} {'acc':>6}")
+        for row in store.leaderboard(args.top):
+            accuracy = f"{row['accuracy']:.3f}" if row['accuracy'] is not None else '-'
+            print(f"{row['rank']:>4} {row['username']:<20} {row['rating']:>6} "
+                  f"{row['wins']:>5} {row['losses']:>5} {accuracy:>6}")
+    store.close()
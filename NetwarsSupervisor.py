@@ -0,0 +1,362 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import subprocess
+
+try:
+    import psutil  # Optional, used for CPU/RSS where /proc isn't available
+except ImportError:
+    psutil = None
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "NetwarsServer.py")
+ADMIN_PORT_OFFSET = 10000  # Admin socket of a worker on port P listens on P + offset
+DRAIN_TIMEOUT = 600  # Longest a graceful stop waits for running matches to finish
+
+def admin_port_for(port):
+    """Return the local admin port paired with a game port."""
+    if port + ADMIN_PORT_OFFSET <= 65535:
+        return port + ADMIN_PORT_OFFSET
+    return port - ADMIN_PORT_OFFSET
+
+def admin_request(port, request, timeout=2.0):
+    """Send one admin request to a local server and return its reply."""
+    with socket.create_connection(('127.0.0.1', port), timeout=timeout) as conn:
+        conn.sendall((json.dumps(request) + "\n").encode('utf-8'))
+        buffer = b""
+        while b"\n" not in buffer:
+            data = conn.recv(4096)
+            if not data:
+                raise ConnectionError("admin connection closed")
+            buffer += data
+    return json.loads(buffer.split(b"\n", 1)[0].decode('utf-8'))
+
+class ServerWorker:
+    """One NetwarsServer.py process and its supervision state."""
+
+    def __init__(self, port, extra_args=None):
+        self.port = port
+        self.admin_port = admin_port_for(port)
+        self.extra_args = extra_args or []
+        self.process = None
+        self.wanted = False  # Whether the supervisor should keep it running
+        self.state = "stopped"  # stopped, running, draining, unhealthy, backoff
+        self.started_at = 0.0
+        self.next_start = 0.0  # When a worker in backoff may start again
+        self.next_probe = 0.0
+        self.failures = 0  # Consecutive crashes, drives the backoff
+        self.failed_probes = 0
+        self.restarts = 0
+        self.last_probe = None  # Last successful ping reply
+        self.cpu = None  # Percent of one core since the previous sample
+        self.rss = None  # Bytes
+        self._cpu_sample = None
+
+    @property
+    def pid(self):
+        return self.process.pid if self.process else None
+
+    def usage(self):
+        """Sample CPU and RSS of the worker process, None where unsupported."""
+        if not self.process:
+            self.cpu = self.rss = None
+            return
+        try:
+            if psutil:
+                proc = psutil.Process(self.process.pid)
+                self.cpu = proc.cpu_percent(interval=None)
+                self.rss = proc.memory_info().rss
+                return
+            with open(f"/proc/{self.process.pid}/stat") as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open(f"/proc/{self.process.pid}/statm") as f:
+                self.rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+            ticks = int(fields[11]) + int(fields[12])  # utime + stime
+            now = time.time()
+            if self._cpu_sample:
+                last_ticks, last_time = self._cpu_sample
+                elapsed = max(now - last_time, 1e-6)
+                self.cpu = 100 * (ticks - last_ticks) / os.sysconf('SC_CLK_TCK') / elapsed
+            self._cpu_sample = (ticks, now)
+        except Exception:
+            self.cpu = self.rss = None  # Process gone, or psutil.NoSuchProcess and friends
+
+class Supervisor:
+    """Keeps a pool of server workers alive.
+
+    Workers are probed over their admin socket, killed after repeated failed
+    probes, and restarted with exponential backoff after crashes. A worker that
+    exits cleanly (its match is over) is restarted straight away. Output lines
+    and state changes are reported through callbacks, which are called from the
+    supervisor's threads.
+    """
+
+    def __init__(self, on_output=None, on_state=None, probe_interval=2.0, probe_timeout=2.0,
+                 max_failed_probes=3, startup_grace=5.0, backoff_base=1.0, backoff_max=60.0,
+                 stable_after=30.0):
+        self.workers = {}
+        self.on_output = on_output or (lambda port, line, is_error: None)
+        self.on_state = on_state or (lambda port, state: None)
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.max_failed_probes = max_failed_probes
+        self.startup_grace = startup_grace
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after  # Running this long resets the crash count
+        self.lock = threading.RLock()
+        self.running = False
+        self.thread = None
+
+    def add_worker(self, port, extra_args=None):
+        with self.lock:
+            if port not in self.workers:
+                self.workers[port] = ServerWorker(port, extra_args)
+            return self.workers[port]
+
+    def start_worker(self, port):
+        """Mark a worker as wanted and start it now."""
+        with self.lock:
+            worker = self.add_worker(port)
+            worker.wanted = True
+            worker.failures = 0
+            if worker.process is None:
+                self._spawn(worker)
+
+    def stop_worker(self, port, timeout=2.0, drain_timeout=0):
+        """Stop a worker and keep it stopped: terminate, then kill after `timeout`.
+
+        With a drain_timeout the worker is first asked to drain, and gets that
+        long to finish its running matches and exit on its own.
+        """
+        with self.lock:
+            worker = self.workers.get(port)
+            if not worker:
+                return
+            worker.wanted = False
+            process = worker.process
+        if process and drain_timeout and self.drain(worker):
+            try:
+                process.wait(drain_timeout)
+            except subprocess.TimeoutExpired:
+                self.on_output(port, f"Matches still running after {drain_timeout:.0f}s, stopping anyway", True)
+        with self.lock:
+            if worker.process is process:
+                worker.process = None
+            worker.cpu = worker.rss = None
+            self._set_state(worker, "stopped")
+        if process and process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    def drain(self, worker):
+        """Ask a worker to stop matchmaking and exit after its last match, True if it agreed."""
+        try:
+            reply = admin_request(worker.admin_port, {'cmd': 'drain'}, self.probe_timeout)
+        except (OSError, ValueError) as e:
+            self.on_output(worker.port, f"Drain request failed: {e}", True)
+            return False
+        if not reply.get('ok'):
+            return False
+        self._set_state(worker, "draining")
+        self.on_output(worker.port, f"Draining, {reply.get('matches', 0)} matches left", False)
+        return True
+
+    def restart_worker(self, port):
+        """Rolling restart: drain the worker, it is started again once it exits."""
+        with self.lock:
+            worker = self.workers.get(port)
+            if not worker or not worker.process:
+                return False
+            worker.wanted = True
+        return self.drain(worker)
+
+    def start_all(self):
+        for port in list(self.workers):
+            self.start_worker(port)
+
+    def stop_all(self, timeout=2.0, drain_timeout=0):
+        """Stop every worker in parallel, so the whole fleet takes one timeout at most."""
+        threads = [threading.Thread(target=self.stop_worker, args=(port, timeout, drain_timeout))
+                   for port in list(self.workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def _spawn(self, worker):
+        args = [sys.executable, "-u", SERVER_SCRIPT, "--port", str(worker.port),
+                "--admin-port", str(worker.admin_port)] + worker.extra_args
+        try:
+            worker.process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                              text=True, bufsize=1)
+        except OSError as e:
+            self.on_output(worker.port, f"Failed to start server: {e}", True)
+            self._schedule_restart(worker)
+            return
+        now = time.time()
+        worker.started_at = now
+        worker.next_probe = now + self.startup_grace
+        worker.failed_probes = 0
+        worker._cpu_sample = None
+        self._set_state(worker, "running")
+        for stream, is_error in ((worker.process.stdout, False), (worker.process.stderr, True)):
+            threading.Thread(target=self._pump, args=(worker.port, stream, is_error), daemon=True).start()
+
+    def _pump(self, port, stream, is_error):
+        """Forward a worker's output line by line until the pipe closes."""
+        for line in stream:
+            self.on_output(port, line.rstrip('\n'), is_error)
+        stream.close()
+
+    def _set_state(self, worker, state):
+        if worker.state != state:
+            worker.state = state
+            self.on_state(worker.port, state)
+
+    def _schedule_restart(self, worker):
+        worker.failures += 1
+        delay = min(self.backoff_base * 2 ** (worker.failures - 1), self.backoff_max)
+        worker.next_start = time.time() + delay
+        self._set_state(worker, "backoff")
+        self.on_output(worker.port, f"Restarting in {delay:.0f}s (failure {worker.failures})", True)
+
+    def tick(self):
+        """Run one round of exit checks, restarts, probes and usage sampling."""
+        now = time.time()
+        with self.lock:
+            workers = list(self.workers.values())
+        for worker in workers:
+            with self.lock:
+                process = worker.process
+                if process is not None and process.poll() is not None:
+                    code = process.returncode
+                    worker.process = None
+                    self.on_output(worker.port, f"Server process exited with code {code}", code != 0)
+                    if not worker.wanted:
+                        self._set_state(worker, "stopped")
+                    elif code == 0:
+                        worker.restarts += 1
+                        self._spawn(worker)  # Clean exit after a drain, respawn it for the rolling restart
+                    else:
+                        if now - worker.started_at >= self.stable_after:
+                            worker.failures = 0
+                        self._schedule_restart(worker)
+                    continue
+                if process is None:
+                    if worker.wanted and worker.state == "backoff" and now >= worker.next_start:
+                        worker.restarts += 1
+                        self._spawn(worker)
+                    continue
+                if now < worker.next_probe:
+                    worker.usage()
+                    continue
+                worker.next_probe = now + self.probe_interval
+
+            healthy = self.probe(worker)  # Outside the lock, it can take probe_timeout
+            worker.usage()
+            with self.lock:
+                if worker.process is not process:
+                    continue  # Stopped or restarted while we were probing
+                if healthy:
+                    worker.failed_probes = 0
+                    self._set_state(worker, "draining" if worker.last_probe.get('draining') else "running")
+                    continue
+                worker.failed_probes += 1
+                self._set_state(worker, "unhealthy")
+                if worker.failed_probes >= self.max_failed_probes:
+                    self.on_output(worker.port, f"{worker.failed_probes} failed health checks, killing server", True)
+                    process.kill()  # Picked up as a crash on the next tick
+
+    def probe(self, worker):
+        """Ping a worker's admin socket, True if it answered healthy."""
+        try:
+            reply = admin_request(worker.admin_port, {'cmd': 'ping'}, self.probe_timeout)
+        except (OSError, ValueError):
+            return False
+        if reply.get('ok'):
+            worker.last_probe = reply
+            return True
+        return False
+
+    def start(self, interval=0.5):
+        """Run tick() on a background thread until stop() is called."""
+        self.running = True
+        self.thread = threading.Thread(target=self.run, args=(interval,), daemon=True)
+        self.thread.start()
+
+    def run(self, interval=0.5):
+        self.running = True
+        while self.running:
+            self.tick()
+            time.sleep(interval)
+
+    def stop(self):
+        self.running = False
+
+def format_status(worker):
+    """Return a one-line summary of a worker for status displays."""
+    cpu = f"{worker.cpu:.0f}%" if worker.cpu is not None else "-"
+    rss = f"{worker.rss / 1048576:.1f} MB" if worker.rss is not None else "-"
+    clients = worker.last_probe['clients'] if worker.last_probe and worker.process else "-"
+    return (f"{worker.state}, pid {worker.pid or '-'}, CPU {cpu}, RSS {rss}, "
+            f"clients {clients}, restarts {worker.restarts}")
+
+def parse_ports(values):
+    """Expand '5555', '5555-5558' and '5555,5560' into a sorted list of ports."""
+    ports = set()
+    for value in values:
+        for part in value.split(','):
+            if '-' in part:
+                low, high = part.split('-', 1)
+                ports.update(range(int(low), int(high) + 1))
+            elif part:
+                ports.add(int(part))
+    return sorted(ports)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Headless Netwars server supervisor')
+    parser.add_argument('ports', nargs='*', default=['5555-5558'],
+                       help='Ports to run servers on, e.g. 5555-5558 5560 (default: 5555-5558)')
+    parser.add_argument('--status-interval', type=float, default=30.0,
+                       help='Seconds between status reports, 0 to disable (default: 30)')
+    parser.add_argument('--probe-interval', type=float, default=2.0,
+                       help='Seconds between health checks (default: 2)')
+    parser.add_argument('--drain-timeout', type=float, default=DRAIN_TIMEOUT,
+                       help=f'On Ctrl+C, seconds to let running matches finish (default: {DRAIN_TIMEOUT})')
+    parser.add_argument('--trusted-proxy', action='append', default=[],
+                       help='Passed on to every server, see NetwarsServer.py --help (default: none)')
+
+    args = parser.parse_args()
+
+    supervisor = Supervisor(
+        on_output=lambda port, line, is_error: print(f"[{port}]{' ERROR:' if is_error else ''} {line}", flush=True),
+        on_state=lambda port, state: print(f"[{port}] state: {state}", flush=True),
+        probe_interval=args.probe_interval)
+    for port in parse_ports(args.ports):
+        supervisor.add_worker(port, [arg for ip in args.trusted_proxy for arg in ('--trusted-proxy', ip)])
+    supervisor.start_all()
+    supervisor.start()
+
+    try:
+        while True:
+            if args.status_interval:
+                time.sleep(args.status_interval)
+                for port, worker in sorted(supervisor.workers.items()):
+                    print(f"[{port}] {format_status(worker)}", flush=True)
+            else:
+                time.sleep(3600)
+    except KeyboardInterrupt:
+        print("Draining all servers, press Ctrl+C again to stop them now...")
+        supervisor.stop()
+        try:
+            supervisor.stop_all(drain_timeout=args.drain_timeout)
+        except KeyboardInterrupt:
+            supervisor.stop_all()
@@ -0,0 +1,148 @@
+import time
+import random
+import argparse
+import itertools
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from NetwarsServer import Match
+from NetwarsBot import STRATEGIES
+from NetwarsStats import ELO_START, elo_update
+
+MAX_TURNS = 1000  # A game still running after this many turns is scored as a draw
+
+def play_game(index, strategy_a, strategy_b, seed):
+    """Play one game in-process with the server's rules and return its result."""
+    rng = random.Random(f"{seed}:{index}")  # Deterministic per game, whatever process runs it
+    names = ['A', 'B']
+    bots = {
+        'A': STRATEGIES[strategy_a](random.Random(rng.random())),
+        'B': STRATEGIES[strategy_b](random.Random(rng.random()))
+    }
+    game = Match(*names, rng=rng)
+    for name in names:
+        ships = bots[name].place_ships()
+        if not game.validate_ships(name, ships):
+            raise ValueError(f"{strategy_a if name == 'A' else strategy_b} placed an invalid fleet")
+        game.place_ships(name, ships)
+    game.current_turn = first = rng.choice(names)
+
+    winner = None
+    turns = 0
+    while winner is None and turns < MAX_TURNS:
+        player = game.current_turn
+        bot = bots[player]
+        msg = bot.choose_action()
+        turns += 1
+
+        if msg['type'] == 'draw_card':
+            card = game.draw_card(player)
+            if card is None:
+                winner = game.opponent(player)  # Stalling on a full hand forfeits
+            else:
+                bot.new_card(card)
+            continue
+
+        result = game.apply_attack(player, msg['row'], msg['col'], msg['card'])
+        if result is None:
+            winner = game.opponent(player)  # An illegal move forfeits the game
+            continue
+        if not result['uses_left']:
+            bot.remove_card(result['card'])
+        bot.observe_attack(result['coords'], result['hits'])
+        winner = result['winner']
+
+    strategies = {'A': strategy_a, 'B': strategy_b}
+    return {
+        'index': index,
+        'a': strategy_a,
+        'b': strategy_b,
+        'winner': strategies[winner] if winner else None,
+        'first': strategies[first],
+        'turns': turns
+    }
+
+def play_chunk(games, seed):
+    """Play a shard of (index, strategy_a, strategy_b) games in a worker process."""
+    return [play_game(index, a, b, seed) for index, a, b in games]
+
+def schedule(strategies, rounds):
+    """Round robin: every pair of strategies meets `rounds` times, alternating seats."""
+    games = []
+    for a, b in itertools.combinations(strategies, 2):
+        for r in range(rounds):
+            games.append((len(games),) + ((a, b) if r % 2 == 0 else (b, a)))
+    return games
+
+def run_tournament(strategies, rounds, seed, workers=None, chunk_size=None):
+    """Shard the schedule over a process pool and return results in game order."""
+    games = schedule(strategies, rounds)
+    if chunk_size is None:
+        chunk_size = max(1, len(games) // ((workers or 4) * 8))
+    chunks = [games[i:i + chunk_size] for i in range(0, len(games), chunk_size)]
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in executor.map(play_chunk, chunks, itertools.repeat(seed)):
+            results.extend(chunk)
+    return sorted(results, key=lambda r: r['index'])
+
+def elo_ratings(results):
+    """Replay the results in game order and return each strategy's Elo rating."""
+    ratings = defaultdict(lambda: ELO_START)
+    for r in results:
+        a, b = r['a'], r['b']
+        score = 0.5 if r['winner'] is None else float(r['winner'] == a)
+        ratings[a], ratings[b] = elo_update(ratings[a], ratings[b], score)
+    return dict(ratings)
+
+def print_report(results, elapsed):
+    """Print Elo ratings, per-strategy and per-pairing statistics."""
+    ratings = elo_ratings(results)
+    wins, played, turns = defaultdict(int), defaultdict(int), defaultdict(list)
+    pairs = defaultdict(lambda: [0, 0, 0])  # Wins of the first name, wins of the second, draws
+    first_wins = draws = 0
+    for r in results:
+        played[r['a']] += 1
+        played[r['b']] += 1
+        turns[r['a']].append(r['turns'])
+        turns[r['b']].append(r['turns'])
+        pair = tuple(sorted((r['a'], r['b'])))
+        if r['winner'] is None:
+            draws += 1
+            pairs[pair][2] += 1
+            continue
+        wins[r['winner']] += 1
+        pairs[pair][pair.index(r['winner'])] += 1
+        first_wins += r['winner'] == r['first']
+
+    print(f"{len(results)} games in {elapsed:.1f}s ({len(results) / elapsed:.0f} games/s)")
+    decided = max(len(results) - draws, 1)
+    print(f"Draws: {draws}, first player win rate: {first_wins / decided:.3f}")
+    print(f"{'Strategy':<10} {'Elo':>7} {'games':>7} {'win %':>7} {'turns':>7}")
+    for name in sorted(ratings, key=ratings.get, reverse=True):
+        print(f"{name:<10} {ratings[name]:>7.0f} {played[name]:>7} "
+              f"{wins[name] / played[name]:>7.3f} {sum(turns[name]) / len(turns[name]):>7.1f}")
+    print(f"{'Pairing':<22} {'wins':>11} {'draws':>6}")
+    for (a, b), (wins_a, wins_b, drawn) in sorted(pairs.items()):
+        print(f"{a + ' vs ' + b:<22} {wins_a:>5}-{wins_b:<5} {drawn:>6}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Netwars bot self-play tournament')
+    parser.add_argument('strategies', nargs='*', default=sorted(STRATEGIES),
+                       help=f"Strategies to enter (default: all of {', '.join(sorted(STRATEGIES))})")
+    parser.add_argument('-r', '--rounds', type=int, default=100,
+                       help='Games per pairing (default: 100)')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                       help='Worker processes (default: one per core)')
+    parser.add_argument('--seed', type=int, default=0,
+                       help='Base seed, each game derives its own from it (default: 0)')
+
+    args = parser.parse_args()
+    unknown = [s for s in args.strategies if s not in STRATEGIES]
+    if unknown or len(args.strategies) < 2:
+        parser.error(f"need at least two of {', '.join(sorted(STRATEGIES))}")
+
+    start = time.time()
+    results = run_tournament(args.strategies, args.rounds, args.seed, args.workers)
+    print_report(results, time.time() - start)